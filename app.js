@@ -8,6 +8,8 @@ class FortuneChat {
         this.chatHistory = [];
         this.currentCharacter = 'psychic';
         this.sessionId = null; // セッション継続用
+        this.chatSocket = null; // 永続WebSocketチャネル
+        this.pendingTurn = null; // WebSocket応答待ちのターン
         
         // UI要素
         this.initializeElements();
@@ -16,6 +18,7 @@ class FortuneChat {
         // システム初期化
         this.loadSystemConfigs();
         this.loadDynamicGreeting();
+        this.connectChatSocket();
         this.startRealtimeUpdates();
 
         console.log('占いチャットシステム初期化完了');
@@ -447,87 +450,175 @@ class FortuneChat {
         ) / 5;
     }
 
-    // AI応答生成
-    async generateResponse(message) {
+    // WebSocketチャネル接続（セッションを接続に束縛）
+    connectChatSocket() {
+        if (!('WebSocket' in window)) return;
+
         try {
-            // AIバックエンドAPI呼び出し
-            const requestData = {
-                message: message,
-                user_data: this.userData,
-                chat_history: this.chatHistory.slice(-5), // 最新5件の履歴
-                rally_count: this.rallyCount,
-                session_id: this.sessionId // セッション継続用
-            };
+            const params = this.sessionId ? `?session_id=${encodeURIComponent(this.sessionId)}&rally_count=${this.rallyCount}` : `?rally_count=${this.rallyCount}`;
+            const socket = new WebSocket(`ws://127.0.0.1:8011/ws/chat${params}`);
 
-            const response = await fetch('http://127.0.0.1:8011/api/chat', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify(requestData)
-            });
+            socket.onopen = () => {
+                // ユーザーデータは接続時に一度だけ送信
+                socket.send(JSON.stringify({ type: 'init', user_data: this.userData, session_id: this.sessionId }));
+                console.log('WebSocketチャネル接続完了');
+            };
 
-            if (response.ok) {
-                const data = await response.json();
+            socket.onmessage = (event) => this.handleSocketFrame(JSON.parse(event.data));
 
-                // セッションIDを保存（継続会話用）
-                if (data.session_id) {
-                    this.sessionId = data.session_id;
-                    console.log('セッション継続:', this.sessionId);
+            socket.onclose = () => {
+                this.chatSocket = null;
+                if (this.pendingTurn) {
+                    this.pendingTurn.reject(new Error('WebSocket切断'));
+                    this.pendingTurn = null;
                 }
+            };
 
-                // AI分析結果をユーザーデータに反映
-                if (data.needs_analysis) {
-                    Object.assign(this.userData.analysis_results.detected_needs, data.needs_analysis);
-                }
-                
-                if (data.emotion_analysis) {
-                    Object.assign(this.userData.analysis_results.emotional_analysis, data.emotion_analysis);
-                }
-                
-                if (data.resort_scores) {
-                    // v3.2仕様: 古い次元データをクリアしてから新しいデータを設定
-                    this.userData.analysis_results.resort_ti_scores = {
-                        relationship: data.resort_scores.relationship || 0,
-                        emotion: data.resort_scores.emotion || 0,
-                        situation: data.resort_scores.situation || 0,
-                        objective: data.resort_scores.objective || 0,
-                        resource: data.resort_scores.resource || 0,
-                        time: data.resort_scores.time || 0,
-                        total: 0
-                    };
-                    // 総合スコア計算
-                    const total = Object.values(data.resort_scores).reduce((sum, val) => sum + val, 0) / 6;
-                    this.userData.analysis_results.resort_ti_scores.total = Math.round(total);
-                }
-                
-                if (data.fortune_timing_score !== undefined) {
-                    this.userData.analysis_results.fortune_suggestion.timing_score = data.fortune_timing_score;
-                }
-                
-                // カテゴリ情報更新
-                if (data.category) {
-                    this.updateCategoryDisplay({
-                        id: this.getCategoryIdFromName(data.category),
-                        name: data.category,
-                        score: 90 // AI分析による高スコア
-                    });
+            this.chatSocket = socket;
+        } catch (error) {
+            console.warn('WebSocket接続エラー、HTTPにフォールバック:', error);
+            this.chatSocket = null;
+        }
+    }
+
+    // WebSocketフレーム処理
+    handleSocketFrame(frame) {
+        const turn = this.pendingTurn;
+
+        switch (frame.type) {
+            case 'analysis':
+                if (turn) this.applyChatResult(frame);
+                break;
+            case 'token':
+                if (!turn) break;
+                turn.text += frame.text;
+                if (!turn.bubble) {
+                    this.displayMessage('', 'bot');
+                    turn.bubble = this.chatMessages.lastElementChild;
                 }
-                
-                // 占い提案があれば表示
-                if (data.suggested_fortune) {
-                    this.showAIFortuneSuggestion(data.suggested_fortune);
+                turn.bubble.querySelector('.message-content').textContent = turn.text;
+                this.chatMessages.scrollTop = this.chatMessages.scrollHeight;
+                break;
+            case 'done':
+                if (!turn) break;
+                // ストリーミング表示を確定表示に置き換える
+                if (turn.bubble) turn.bubble.remove();
+                this.pendingTurn = null;
+                turn.resolve(frame);
+                break;
+            case 'error':
+                console.warn('WebSocketエラー:', frame.detail);
+                if (turn) {
+                    if (turn.bubble) turn.bubble.remove();
+                    this.pendingTurn = null;
+                    turn.reject(new Error(frame.detail));
                 }
-                
-                return data.response;
+                break;
+        }
+    }
+
+    // WebSocket経由の応答生成（新しいメッセージのみ送信）
+    generateResponseViaSocket(message) {
+        return new Promise((resolve, reject) => {
+            this.pendingTurn = { resolve, reject, text: '', bubble: null };
+            this.chatSocket.send(JSON.stringify({ message: message }));
+        });
+    }
+
+    // AI応答生成
+    async generateResponse(message) {
+        try {
+            let data;
+
+            if (this.chatSocket && this.chatSocket.readyState === WebSocket.OPEN && !this.pendingTurn) {
+                data = await this.generateResponseViaSocket(message);
             } else {
-                throw new Error('API応答エラー');
+                // AIバックエンドAPI呼び出し（WebSocket未接続時）
+                const requestData = {
+                    message: message,
+                    user_data: this.userData,
+                    chat_history: this.chatHistory.slice(-5), // 最新5件の履歴
+                    rally_count: this.rallyCount,
+                    session_id: this.sessionId // セッション継続用
+                };
+
+                const response = await fetch('http://127.0.0.1:8011/api/chat', {
+                    method: 'POST',
+                    headers: {
+                        'Content-Type': 'application/json',
+                    },
+                    body: JSON.stringify(requestData)
+                });
+
+                if (!response.ok) {
+                    throw new Error('API応答エラー');
+                }
+
+                data = await response.json();
+
+                // 次回以降はWebSocketチャネルを再接続
+                if (!this.chatSocket) this.connectChatSocket();
             }
+
+            this.applyChatResult(data);
+            return data.response;
         } catch (error) {
             console.warn('AI API呼び出しエラー、フォールバック応答に切り替え:', error);
             return this.generateFallbackResponse(message);
         }
     }
+
+    // サーバー分析結果を画面状態に反映
+    applyChatResult(data) {
+        // セッションIDを保存（継続会話用）
+        if (data.session_id) {
+            this.sessionId = data.session_id;
+            console.log('セッション継続:', this.sessionId);
+        }
+
+        // AI分析結果をユーザーデータに反映
+        if (data.needs_analysis) {
+            Object.assign(this.userData.analysis_results.detected_needs, data.needs_analysis);
+        }
+        
+        if (data.emotion_analysis) {
+            Object.assign(this.userData.analysis_results.emotional_analysis, data.emotion_analysis);
+        }
+        
+        if (data.resort_scores) {
+            // v3.2仕様: 古い次元データをクリアしてから新しいデータを設定
+            this.userData.analysis_results.resort_ti_scores = {
+                relationship: data.resort_scores.relationship || 0,
+                emotion: data.resort_scores.emotion || 0,
+                situation: data.resort_scores.situation || 0,
+                objective: data.resort_scores.objective || 0,
+                resource: data.resort_scores.resource || 0,
+                time: data.resort_scores.time || 0,
+                total: 0
+            };
+            // 総合スコア計算
+            const total = Object.values(data.resort_scores).reduce((sum, val) => sum + val, 0) / 6;
+            this.userData.analysis_results.resort_ti_scores.total = Math.round(total);
+        }
+        
+        if (data.fortune_timing_score !== undefined) {
+            this.userData.analysis_results.fortune_suggestion.timing_score = data.fortune_timing_score;
+        }
+        
+        // カテゴリ情報更新
+        if (data.category) {
+            this.updateCategoryDisplay({
+                id: this.getCategoryIdFromName(data.category),
+                name: data.category,
+                score: 90 // AI分析による高スコア
+            });
+        }
+        
+        // 占い提案があれば表示
+        if (data.suggested_fortune) {
+            this.showAIFortuneSuggestion(data.suggested_fortune);
+        }
+    }
     
     // フォールバック応答生成（AI API失敗時）
     generateFallbackResponse(message) {
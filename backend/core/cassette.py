@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+上流モデル呼び出しの録音・再生（カセット）
+record: リクエストのフィンガープリント・応答・所要時間をJSONLに記録
+replay: 記録した応答を決定的に返す（記録時のレイテンシまたは遅延ゼロ）
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.config import AppConfig
+from core.metrics import metrics
+
+OFF = "off"
+RECORD = "record"
+REPLAY = "replay"
+
+
+class CassetteMiss(Exception):
+    """再生モードで該当する録音がない"""
+
+
+class Cassette:
+    """録音・再生モードの切り替えと記録ファイルの管理（シングルトン）"""
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._lock = threading.Lock()
+            cls._instance.configure(
+                AppConfig.LLM_CASSETTE_MODE,
+                AppConfig.LLM_CASSETTE_PATH,
+                AppConfig.LLM_CASSETTE_LATENCY,
+                AppConfig.LLM_CASSETTE_STRICT
+            )
+        return cls._instance
+
+    def configure(self, mode: str, path: str, latency: str = "recorded", strict: bool = False):
+        """モード・記録ファイルを切り替え（ベンチマークツールからも利用）"""
+        if mode not in (OFF, RECORD, REPLAY):
+            print(f"不明なカセットモード '{mode}'（offで動作）")
+            mode = OFF
+
+        with self._lock:
+            self.mode = mode
+            self.path = path
+            self.replay_latency = latency != "zero"
+            self.strict = strict
+            self._truncated = False
+            self._by_fingerprint: Dict[str, List[Dict]] = defaultdict(list)
+            self._by_endpoint: Dict[str, List[Dict]] = defaultdict(list)
+            self._cursors: Dict[Any, int] = defaultdict(int)
+            self._stats = {"recorded": 0, "exact_hits": 0, "sequence_hits": 0, "misses": 0}
+
+        if mode == REPLAY:
+            self._load()
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == RECORD
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == REPLAY
+
+    @property
+    def active(self) -> bool:
+        return self.mode != OFF
+
+    def _load(self):
+        """記録ファイルを読み込み、フィンガープリント別・エンドポイント別に記録順で索引"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    self._by_fingerprint[entry["fingerprint"]].append(entry)
+                    self._by_endpoint[entry["endpoint"]].append(entry)
+            print(f"✅ カセット読み込み: {self.path}（{sum(len(v) for v in self._by_endpoint.values())}件）")
+        except FileNotFoundError:
+            print(f"カセットファイルが見つかりません: {self.path}")
+        except Exception as e:
+            print(f"カセット読み込みエラー: {e}")
+
+    def _next(self, key, entries: List[Dict]) -> Dict:
+        """記録順に返し、使い切ったら最後の記録を返し続ける"""
+        index = self._cursors[key]
+        self._cursors[key] = index + 1
+        return entries[min(index, len(entries) - 1)]
+
+    def lookup(self, endpoint: str, fingerprint: str) -> Dict:
+        """録音を取得（完全一致 → 同一エンドポイントの記録順、strict時は完全一致のみ）
+
+        記録時のプロバイダは entry["provider"] に残り、応答の復元に使う。
+        """
+        with self._lock:
+            entries = self._by_fingerprint.get(fingerprint)
+            if entries:
+                self._stats["exact_hits"] += 1
+                return self._next(fingerprint, entries)
+
+            # 時刻・ランダム選択でプロンプトが揺れる呼び出しは記録順で対応付ける
+            entries = self._by_endpoint.get(endpoint)
+            if entries and not self.strict:
+                self._stats["sequence_hits"] += 1
+                return self._next(endpoint, entries)
+
+            self._stats["misses"] += 1
+        metrics.incr(f"cassette.miss.{endpoint}")
+        raise CassetteMiss(f"{endpoint} の録音がありません（{fingerprint[:12]}）")
+
+    def record(
+        self,
+        provider: str,
+        endpoint: str,
+        fingerprint: str,
+        response: Any,
+        latency: float,
+        chunks: Optional[List[Tuple[float, str]]] = None
+    ):
+        """1呼び出し分を追記（記録開始時に既存ファイルを置き換える）"""
+        entry = {
+            "provider": provider,
+            "endpoint": endpoint,
+            "fingerprint": fingerprint,
+            "latency": round(latency, 4),
+            "response": response,
+            "recorded_at": time.time()
+        }
+        if chunks is not None:
+            entry["chunks"] = [[round(delay, 4), text] for delay, text in chunks]
+
+        with self._lock:
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                with open(self.path, "a" if self._truncated else "w", encoding="utf-8") as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                self._truncated = True
+                self._stats["recorded"] += 1
+            except Exception as e:
+                print(f"カセット書き込みエラー: {e}")
+
+    async def wait(self, entry: Dict):
+        """記録時のレイテンシを再現（遅延ゼロ設定時は即時）"""
+        if self.replay_latency:
+            await asyncio.sleep(entry.get("latency", 0))
+
+    async def replay_chunks(self, entry: Dict) -> AsyncIterator[str]:
+        """ストリーミング応答をチャンク間隔込みで再生"""
+        for delay, text in entry.get("chunks", []):
+            if self.replay_latency and delay > 0:
+                await asyncio.sleep(delay)
+            yield text
+
+    def stats(self) -> Dict[str, Any]:
+        """モードとヒット/ミス統計"""
+        return {"mode": self.mode, "path": self.path, **self._stats}
+
+
+# シングルトンインスタンス
+cassette = Cassette()
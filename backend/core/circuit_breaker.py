@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+プロバイダ別サーキットブレーカー
+エラー率・遅延呼び出し率でOPENにし、OPEN中は即座に失敗させてローカルのフォールバックへ回す
+"""
+
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Dict
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.config import AppConfig
+from core.metrics import metrics
+from core.resilience import is_retryable
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """サーキットOPEN中のため呼び出しを拒否"""
+
+
+class CircuitBreaker:
+    """直近ウィンドウの失敗率・遅延率で開閉するサーキットブレーカー"""
+
+    def __init__(
+        self,
+        name: str,
+        window: int = 20,
+        min_calls: int = 5,
+        failure_rate: float = 0.5,
+        slow_call_seconds: float = 15.0,
+        slow_call_rate: float = 0.8,
+        open_seconds: float = 30.0,
+        half_open_probes: int = 1,
+        is_failure: Callable[[Exception], bool] = is_retryable
+    ):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.half_open_probes = max(1, half_open_probes)
+        self.is_failure = is_failure
+
+        self.state = CLOSED
+        self._outcomes = deque(maxlen=window)  # (失敗, 遅延)
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self._stats = {"rejected": 0, "opened": 0}
+
+    def _current_state(self) -> str:
+        """OPENの待機時間が過ぎていればHALF_OPENへ移行"""
+        if self.state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._transition(HALF_OPEN)
+        return self.state
+
+    def _transition(self, state: str):
+        if state == self.state:
+            return
+        print(f"サーキット {self.name}: {self.state} → {state}")
+        self.state = state
+        metrics.incr(f"circuit.{self.name}.{state}")
+
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+            self._stats["opened"] += 1
+        elif state == HALF_OPEN:
+            self._probes_in_flight = 0
+            self._probe_successes = 0
+        elif state == CLOSED:
+            self._outcomes.clear()
+
+    def _is_rejecting(self) -> bool:
+        state = self._current_state()
+        return state == OPEN or (state == HALF_OPEN and self._probes_in_flight >= self.half_open_probes)
+
+    def _reject(self):
+        self._stats["rejected"] += 1
+        metrics.incr(f"circuit.{self.name}.rejected")
+
+    def rejecting(self) -> bool:
+        """呼び出し前の即時判定（拒否ならTrue、プローブ枠・拒否数は変更しない）"""
+        return self._is_rejecting()
+
+    def _acquire(self) -> bool:
+        """呼び出し許可を取得（拒否時はCircuitOpenError）、HALF_OPENのプローブならTrue"""
+        if self._is_rejecting():
+            self._reject()
+            raise CircuitOpenError(f"{self.name} サーキットOPEN中")
+
+        if self.state == HALF_OPEN:
+            self._probes_in_flight += 1
+            return True
+        return False
+
+    def _record(self, probe: bool, failed: bool, slow: bool):
+        """呼び出し結果を記録して状態を更新"""
+        if probe:
+            self._probes_in_flight -= 1
+            if self.state != HALF_OPEN:
+                return
+            if failed or slow:
+                self._transition(OPEN)
+            else:
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_probes:
+                    self._transition(CLOSED)
+            return
+
+        if self.state != CLOSED:
+            return
+
+        self._outcomes.append((failed, slow))
+        calls = len(self._outcomes)
+        if calls < self.min_calls:
+            return
+
+        failures = sum(1 for f, _ in self._outcomes if f)
+        slow_calls = sum(1 for _, s in self._outcomes if s)
+        if failures / calls >= self.failure_rate or slow_calls / calls >= self.slow_call_rate:
+            self._transition(OPEN)
+
+    @asynccontextmanager
+    async def guard(self) -> AsyncIterator[None]:
+        """上流呼び出し1回を保護（OPEN中は即座にCircuitOpenError）"""
+        probe = self._acquire()
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self._record(probe, failed=self.is_failure(e), slow=False)
+            raise
+        except BaseException:
+            # キャンセル（期限切れ・ヘッジの敗者など）は遅延閾値を超えた場合のみ遅延として数える
+            if time.perf_counter() - started >= self.slow_call_seconds:
+                self._record(probe, failed=False, slow=True)
+            elif probe:
+                self._probes_in_flight -= 1
+            raise
+        else:
+            self._record(probe, failed=False, slow=time.perf_counter() - started >= self.slow_call_seconds)
+
+    def stats(self) -> Dict:
+        """ブレーカー状態"""
+        state = self._current_state()
+        calls = len(self._outcomes)
+        return {
+            "state": state,
+            "window_calls": calls,
+            "failure_rate": round(sum(1 for f, _ in self._outcomes if f) / calls, 4) if calls else 0.0,
+            "slow_call_rate": round(sum(1 for _, s in self._outcomes if s) / calls, 4) if calls else 0.0,
+            "open_remaining_seconds": round(max(0.0, self.open_seconds - (time.monotonic() - self._opened_at)), 2) if state == OPEN else 0.0,
+            **self._stats
+        }
+
+
+class CircuitBreakerRegistry:
+    """プロバイダ別ブレーカーの管理（シングルトン）"""
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._breakers = {}
+        return cls._instance
+
+    def get(self, provider: str) -> CircuitBreaker:
+        """プロバイダのブレーカーを取得（初回に設定から生成）"""
+        breaker = self._breakers.get(provider)
+        if breaker is None:
+            settings = AppConfig.CIRCUIT_BREAKER
+            breaker = self._breakers[provider] = CircuitBreaker(
+                provider,
+                window=settings["window"],
+                min_calls=settings["min_calls"],
+                failure_rate=settings["failure_rate"],
+                slow_call_seconds=AppConfig.CIRCUIT_SLOW_CALL_SECONDS.get(
+                    provider, AppConfig.CIRCUIT_SLOW_CALL_SECONDS["default"]
+                ),
+                slow_call_rate=settings["slow_call_rate"],
+                open_seconds=settings["open_seconds"],
+                half_open_probes=settings["half_open_probes"]
+            )
+        return breaker
+
+    def stats(self) -> Dict[str, Dict]:
+        """全ブレーカーの状態"""
+        return {provider: breaker.stats() for provider, breaker in self._breakers.items()}
+
+
+# シングルトンインスタンス
+breakers = CircuitBreakerRegistry()
+
+def get_breaker(provider: str) -> CircuitBreaker:
+    """プロバイダのブレーカー取得"""
+    return breakers.get(provider)
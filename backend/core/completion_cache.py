@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LLM補完キャッシュ
+メモリLRU（前段）+ SQLite（後段・再起動後もワーカー間で共有）の2層キャッシュ
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+
+def completion_fingerprint(
+    model: str,
+    messages: List[Dict[str, str]],
+    temperature: float,
+    max_tokens: int
+) -> str:
+    """モデル・メッセージ・温度・最大トークンの正規化ハッシュ"""
+    canonical = json.dumps(
+        {
+            "model": model,
+            "messages": messages,
+            "temperature": round(float(temperature), 4),
+            "max_tokens": int(max_tokens)
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":")
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class CompletionCache:
+    """2層補完キャッシュ（エンドポイント別TTL・高温度呼び出しは対象外）"""
+
+    def __init__(
+        self,
+        db_path: str,
+        ttls: Dict[str, int],
+        max_memory_entries: int = 512,
+        max_cacheable_temperature: float = 0.3,
+        max_temperatures: Optional[Dict[str, float]] = None
+    ):
+        self.db_path = db_path
+        self.ttls = ttls
+        self.max_memory_entries = max_memory_entries
+        self.max_cacheable_temperature = max_cacheable_temperature
+        self.max_temperatures = max_temperatures or {}
+
+        self._memory: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "bypassed": 0
+        }
+
+        self._disk_enabled = self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        """SQLite接続を開く（スレッドごとに個別接続）"""
+        return sqlite3.connect(self.db_path, timeout=5)
+
+    def _init_db(self) -> bool:
+        """テーブル作成と期限切れエントリの掃除"""
+        try:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            with self._connect() as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS completions (
+                        key TEXT PRIMARY KEY,
+                        endpoint TEXT NOT NULL,
+                        response TEXT NOT NULL,
+                        created_at REAL NOT NULL,
+                        expires_at REAL NOT NULL
+                    )
+                    """
+                )
+                conn.execute("DELETE FROM completions WHERE expires_at < ?", (time.time(),))
+            return True
+        except Exception as e:
+            print(f"補完キャッシュDB初期化エラー（メモリのみで動作）: {e}")
+            return False
+
+    def is_cacheable(self, endpoint: str, temperature: float) -> bool:
+        """キャッシュ対象か判定（TTL未設定・高温度はオプトアウト）"""
+        max_temperature = self.max_temperatures.get(endpoint, self.max_cacheable_temperature)
+        if self.ttls.get(endpoint, 0) <= 0 or temperature > max_temperature:
+            self._stats["bypassed"] += 1
+            return False
+        return True
+
+    async def get(self, key: str) -> Optional[str]:
+        """キャッシュ取得（メモリ → SQLite の順）"""
+        now = time.time()
+
+        entry = self._memory.get(key)
+        if entry:
+            expires_at, response = entry
+            if expires_at >= now:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return response
+            del self._memory[key]
+
+        if self._disk_enabled:
+            row = await asyncio.to_thread(self._disk_get, key, now)
+            if row:
+                expires_at, response = row
+                self._remember(key, expires_at, response)
+                self._stats["disk_hits"] += 1
+                return response
+
+        self._stats["misses"] += 1
+        return None
+
+    async def set(self, key: str, endpoint: str, response: str):
+        """キャッシュ保存（両層に書き込み）"""
+        ttl = self.ttls.get(endpoint, 0)
+        if ttl <= 0 or not response:
+            return
+
+        now = time.time()
+        expires_at = now + ttl
+        self._remember(key, expires_at, response)
+        self._stats["stores"] += 1
+
+        if self._disk_enabled:
+            await asyncio.to_thread(self._disk_set, key, endpoint, response, now, expires_at)
+
+    def _remember(self, key: str, expires_at: float, response: str):
+        """メモリLRUへ登録（上限超過分は古い順に破棄）"""
+        self._memory[key] = (expires_at, response)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _disk_get(self, key: str, now: float) -> Optional[Tuple[float, str]]:
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT expires_at, response FROM completions WHERE key = ?", (key,)
+                ).fetchone()
+                if row and row[0] < now:
+                    conn.execute("DELETE FROM completions WHERE key = ?", (key,))
+                    return None
+                return row
+        except Exception as e:
+            print(f"補完キャッシュ読み込みエラー: {e}")
+            return None
+
+    def _disk_set(self, key: str, endpoint: str, response: str, created_at: float, expires_at: float):
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO completions (key, endpoint, response, created_at, expires_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, endpoint, response, created_at, expires_at)
+                )
+        except Exception as e:
+            print(f"補完キャッシュ書き込みエラー: {e}")
+
+    def stats(self) -> Dict[str, float]:
+        """ヒット/ミス統計"""
+        hits = self._stats["memory_hits"] + self._stats["disk_hits"]
+        lookups = hits + self._stats["misses"]
+        return {
+            **self._stats,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "disk_enabled": self._disk_enabled
+        }
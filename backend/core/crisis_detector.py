@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+危機レベル検出
+感情分析MD（crisis_levels）のキーワードをレベル別のキーワードグループとして共有オートマトンに登録し、
+全メッセージで上流呼び出しより先に実行する（MDが再読み込みされたときだけ再登録する）
+"""
+
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import yaml
+
+from core.message_features import keyword_registry, message_features
+
+# MDに crisis_levels がない場合のキーワード（emotion_analysis_system.md と同じ内容）
+DEFAULT_CRISIS_KEYWORDS = {
+    5: ["死にたい", "消えたい", "いなくなりたい", "終わりにしたい"],
+    4: ["もうダメ", "限界", "耐えられない", "壊れそう"],
+    3: ["疲れた", "辛すぎる", "苦しい"]
+}
+
+
+def parse_crisis_keywords(md_content: str) -> Dict[int, List[str]]:
+    """感情分析MDの crisis_levels（level_<N>_xxx: keywords）からレベル別キーワードを取得"""
+    keywords: Dict[int, List[str]] = {}
+    for block in re.findall(r'```yaml\n(.*?)\n```', md_content or "", re.DOTALL):
+        try:
+            data = yaml.safe_load(block)
+        except yaml.YAMLError:
+            continue
+        if not isinstance(data, dict) or not isinstance(data.get("crisis_levels"), dict):
+            continue
+
+        for name, rule in data["crisis_levels"].items():
+            match = re.match(r"level_(\d+)", str(name))
+            if match and isinstance(rule, dict) and rule.get("keywords"):
+                keywords[int(match.group(1))] = [str(keyword) for keyword in rule["keywords"]]
+
+    return keywords or DEFAULT_CRISIS_KEYWORDS
+
+
+class CrisisDetector:
+    """レベル別キーワードを crisis.level_<N> グループとして登録し、高いレベルから照合
+
+    照合は共有のメッセージ特徴量（NFKC正規化・空白除去済み）で行うため、
+    半角カナや「死に たい」のような表記揺れも検出する
+    """
+
+    def __init__(self, keywords: Dict[int, List[str]]):
+        self.keywords = keywords
+        self.groups: List[Tuple[int, str]] = [
+            (level, keyword_registry.define(f"crisis.level_{level}", keywords[level]))
+            for level in sorted(keywords, reverse=True)
+        ]
+
+    def detect(self, message: str) -> int:
+        """危機レベル（該当なしは0、複数該当は最も高いレベル）"""
+        features = message_features(message)
+        for level, group in self.groups:
+            if features.any(group):
+                return level
+        return 0
+
+
+_detector: Optional[CrisisDetector] = None
+_detector_source: Optional[str] = None
+_detector_lock = threading.Lock()
+
+
+def get_crisis_detector(md_configs: Optional[Dict[str, str]] = None) -> CrisisDetector:
+    """現在の感情分析MDからコンパイルした検出器（MDの内容が変わったときだけ再コンパイル）"""
+    global _detector, _detector_source
+    if md_configs is None:
+        from core.md_loader import get_md_configs
+        md_configs = get_md_configs()
+    source = md_configs.get("emotion_analysis_system", "") or ""
+
+    # MDローダーは再読み込みまで同じ文字列を返すため、同一性の比較だけで済む
+    if _detector is None or source is not _detector_source:
+        with _detector_lock:
+            if _detector is None or source != _detector_source:
+                _detector = CrisisDetector(parse_crisis_keywords(source))
+            _detector_source = source
+    return _detector
+
+
+# 使用例・テスト関数
+def test_crisis_detector():
+    """従来のキーワードループとの一致確認と検出レイテンシの比較"""
+    import json
+
+    def legacy_detect(message: str) -> int:
+        for level in (5, 4, 3):
+            if any(keyword in message for keyword in DEFAULT_CRISIS_KEYWORDS[level]):
+                return level
+        return 0
+
+    project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    with open(os.path.join(project_root, "systems", "emotion_analysis_system.md"), "r", encoding="utf-8") as f:
+        detector = get_crisis_detector({"emotion_analysis_system": f.read()})
+    assert detector.keywords == DEFAULT_CRISIS_KEYWORDS, detector.keywords
+
+    with open(os.path.join(project_root, "data", "emotion_seed.jsonl"), "r", encoding="utf-8") as f:
+        messages = [json.loads(line)["message"] for line in f if line.strip()]
+    messages += ["もう限界で死にたい", "疲れたし、もうダメかも", "今日はいい天気ですね" * 20]
+
+    for message in messages:
+        assert detector.detect(message) == legacy_detect(message), message
+    # 表記揺れ（空白・半角カナ）は正規化して検出
+    assert detector.detect("死に　たい") == 5
+    assert detector.detect("もうﾀﾞﾒ") == 4
+
+    results = {}
+    for name, detect in (("legacy", legacy_detect), ("automaton", detector.detect)):
+        started = time.perf_counter()
+        for _ in range(200):
+            for message in messages:
+                detect(message)
+        results[name] = (time.perf_counter() - started) / (200 * len(messages)) * 1e6
+    print({name: f"{micros:.2f}µs/件" for name, micros in results.items()})
+    print("=== 危機レベル検出テスト: OK ===")
+
+
+if __name__ == "__main__":
+    test_crisis_detector()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+感情分析結果キャッシュ
+正規化メッセージ（NFKC・空白圧縮）＋感情分析MDの版をキーに、モデルによる分析結果をLRUで保持する
+起動時に chat_logs の履歴メタデータから事前投入する
+"""
+
+import copy
+import glob
+import hashlib
+import json
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.config import AppConfig
+from core.metrics import metrics
+from core.cassette import cassette
+
+# 事前投入で受け付ける分析結果の必須フィールド
+REQUIRED_FIELDS = (
+    "primary_emotion", "emotion_intensity", "emotion_layers",
+    "empathy_level", "tone_matching", "crisis_level"
+)
+
+
+def normalize_message(message: str) -> str:
+    """NFKC正規化し、空白の連続を1つにまとめる（全角・半角や改行の揺れを同一視）"""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", message or "")).strip()
+
+
+def emotion_md_version(md_configs: Dict[str, str]) -> str:
+    """感情分析MDの版（内容ハッシュ、MD更新で既存キャッシュは自動的に無効）"""
+    text = md_configs.get("emotion_analysis_system", "") or ""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+class EmotionCache:
+    """感情分析結果のLRUキャッシュ（シングルトン）"""
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._lock = threading.Lock()
+            cls._instance.max_entries = AppConfig.EMOTION_CACHE_MAX_ENTRIES
+            cls._instance._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+            cls._instance._stats = {"hits": 0, "misses": 0, "stores": 0, "warmed": 0, "saved_seconds": 0.0}
+        return cls._instance
+
+    @property
+    def enabled(self) -> bool:
+        # 録音・再生中は上流呼び出しの順序を変えないよう無効
+        return AppConfig.EMOTION_CACHE_ENABLED and not cassette.active
+
+    @staticmethod
+    def key(message: str, version: str) -> str:
+        """正規化メッセージと版からキーを生成"""
+        return hashlib.sha256(f"{version}\0{normalize_message(message)}".encode("utf-8")).hexdigest()
+
+    def peek(self, message: str, version: str) -> Optional[Dict[str, Any]]:
+        """統計を更新せずに参照"""
+        with self._lock:
+            return self._entries.get(self.key(message, version))
+
+    def get(self, message: str, version: str) -> Optional[Dict[str, Any]]:
+        """キャッシュ取得（ヒット時は感情分析1回分の平均レイテンシを節約時間として計上）"""
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            key = self.key(message, version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+
+            latency = metrics.latency("emotion.analysis")
+            if latency and latency.count:
+                self._stats["saved_seconds"] += latency.total / latency.count
+
+        metrics.incr("emotion_cache.hits")
+        return copy.deepcopy(entry)
+
+    def set(self, message: str, version: str, analysis: Dict[str, Any]):
+        """モデルによる分析結果を保存（上限超過分は古い順に破棄）"""
+        if not self.enabled:
+            return
+        self._remember(self.key(message, version), analysis)
+        with self._lock:
+            self._stats["stores"] += 1
+
+    def _remember(self, key: str, analysis: Dict[str, Any]):
+        with self._lock:
+            self._entries[key] = copy.deepcopy(analysis)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def warm(self, logs_dir: str, version: str) -> int:
+        """chat_logs の履歴（ユーザー発話 → 直後のAI応答の感情分析）から事前投入
+
+        記録時の版が現在の版と一致するものだけを使う（版の記録がない旧形式は設定で許可した場合のみ）。
+        """
+        if not self.enabled:
+            return 0
+
+        warmed = 0
+        for path in sorted(glob.glob(os.path.join(logs_dir, "chat_*.json")), key=os.path.getmtime):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    messages = json.load(f).get("messages", [])
+            except Exception as e:
+                print(f"感情分析キャッシュ事前投入エラー ({os.path.basename(path)}): {e}")
+                continue
+
+            for previous, current in zip(messages, messages[1:]):
+                if previous.get("type") != "user" or current.get("type") != "ai":
+                    continue
+                metadata = current.get("metadata") or {}
+                analysis = metadata.get("emotion_analysis")
+                recorded_version = metadata.get("emotion_md_version")
+
+                if not isinstance(analysis, dict) or any(name not in analysis for name in REQUIRED_FIELDS):
+                    continue
+                if recorded_version != version and not (recorded_version is None and AppConfig.EMOTION_CACHE_WARM_UNVERSIONED):
+                    continue
+
+                self._remember(self.key(previous.get("content", ""), version), analysis)
+                warmed += 1
+
+        with self._lock:
+            self._stats["warmed"] += warmed
+        return warmed
+
+    def stats(self) -> Dict[str, Any]:
+        """ヒット率・推定節約時間"""
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                "enabled": self.enabled,
+                **self._stats,
+                "saved_seconds": round(self._stats["saved_seconds"], 3),
+                "hit_rate": round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries
+            }
+
+
+# シングルトンインスタンス
+emotion_cache = EmotionCache()
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ローカル感情・ニーズ分類器
+文字n-gram（1〜3文字をハッシュ化）の多クラスロジスティック回帰をNumPyで実行する
+確信度が閾値以上なら上流の感情分析を省略し、未満のときだけLLMへエスカレーションする
+学習は tools/train_local_classifier.py（オフライン）で行い、models/ に保存したモデルを読み込む
+"""
+
+import json
+import os
+import threading
+import zlib
+from collections import Counter
+from statistics import median
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from shared.config import AppConfig
+from core.emotion_cache import normalize_message
+from core.cassette import cassette
+
+NGRAM_SIZES = (1, 2, 3)
+DEFAULT_DIMENSIONS = 1 << 14
+
+
+def ngram_indices(message: str, dimensions: int = DEFAULT_DIMENSIONS) -> np.ndarray:
+    """正規化メッセージの文字n-gramをハッシュ化した特徴インデックス（重複なし）"""
+    text = normalize_message(message)
+    grams = {text[i:i + n] for n in NGRAM_SIZES for i in range(len(text) - n + 1)}
+    # 組み込みhash()はプロセスごとに値が変わるため、学習時と同じになるcrc32を使う
+    return np.unique(np.fromiter(
+        (zlib.crc32(gram.encode("utf-8")) % dimensions for gram in grams),
+        dtype=np.int64,
+        count=len(grams)
+    ))
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    shifted = np.exp(logits - logits.max(axis=-1, keepdims=True))
+    return shifted / shifted.sum(axis=-1, keepdims=True)
+
+
+class SoftmaxHead:
+    """1つのラベル種別（感情・ニーズ）の多クラスロジスティック回帰"""
+
+    def __init__(self, labels: List[str], weights: np.ndarray, bias: np.ndarray):
+        self.labels = labels
+        self.weights = weights
+        self.bias = bias
+
+    @classmethod
+    def train(
+        cls,
+        features: Sequence[np.ndarray],
+        labels: Sequence[str],
+        dimensions: int,
+        epochs: int = 600,
+        learning_rate: float = 2.0,
+        l2: float = 1e-4
+    ) -> "SoftmaxHead":
+        """全件勾配降下で学習（特徴は二値・L2正規化）"""
+        classes = sorted(set(labels))
+        X = np.zeros((len(features), dimensions), dtype=np.float32)
+        for row, indices in enumerate(features):
+            if len(indices):
+                X[row, indices] = 1.0 / np.sqrt(len(indices))
+        Y = np.zeros((len(labels), len(classes)), dtype=np.float32)
+        Y[np.arange(len(labels)), [classes.index(label) for label in labels]] = 1.0
+
+        weights = np.zeros((len(classes), dimensions), dtype=np.float32)
+        bias = np.zeros(len(classes), dtype=np.float32)
+        for _ in range(epochs):
+            gradient = (_softmax(X @ weights.T + bias) - Y) / len(labels)
+            weights -= learning_rate * (gradient.T @ X + l2 * weights)
+            bias -= learning_rate * gradient.sum(axis=0)
+
+        return cls(classes, weights, bias)
+
+    def predict(self, indices: np.ndarray) -> Tuple[str, float]:
+        """(ラベル, 確信度) を返す"""
+        if len(indices):
+            logits = self.weights[:, indices].sum(axis=1) / np.sqrt(len(indices)) + self.bias
+        else:
+            logits = self.bias
+        probabilities = _softmax(logits)
+        best = int(probabilities.argmax())
+        return self.labels[best], float(probabilities[best])
+
+
+class LocalClassifier:
+    """感情ヘッド＋ニーズヘッドと、感情ごとの分析値プロファイル"""
+
+    def __init__(
+        self,
+        emotion_head: SoftmaxHead,
+        needs_head: Optional[SoftmaxHead],
+        profiles: Dict[str, Dict[str, Any]],
+        dimensions: int = DEFAULT_DIMENSIONS,
+        metadata: Optional[Dict[str, Any]] = None
+    ):
+        self.emotion_head = emotion_head
+        self.needs_head = needs_head
+        self.profiles = profiles
+        self.dimensions = dimensions
+        self.metadata = metadata or {}
+
+    @classmethod
+    def train(
+        cls,
+        examples: List[Dict[str, Any]],
+        dimensions: int = DEFAULT_DIMENSIONS,
+        **options
+    ) -> "LocalClassifier":
+        """学習例（message / emotion_analysis / need）から学習"""
+        features = [ngram_indices(example["message"], dimensions) for example in examples]
+        emotion_head = SoftmaxHead.train(
+            features, [example["emotion_analysis"]["primary_emotion"] for example in examples], dimensions, **options
+        )
+
+        labelled = [(feature, example["need"]) for feature, example in zip(features, examples) if example.get("need")]
+        needs_head = None
+        if len({need for _, need in labelled}) >= 2:
+            needs_head = SoftmaxHead.train(
+                [feature for feature, _ in labelled], [need for _, need in labelled], dimensions, **options
+            )
+
+        return cls(emotion_head, needs_head, build_profiles(examples), dimensions)
+
+    def predict_emotion(self, message: str) -> Tuple[Dict[str, Any], float]:
+        """感情分析スキーマ形式の推定結果と確信度"""
+        emotion, confidence = self.emotion_head.predict(ngram_indices(message, self.dimensions))
+        profile = self.profiles[emotion]
+        return {
+            "primary_emotion": emotion,
+            "emotion_intensity": profile["emotion_intensity"],
+            "emotion_layers": dict(profile["emotion_layers"]),
+            "empathy_level": profile["empathy_level"],
+            "tone_matching": profile["tone_matching"],
+            "analysis_quality": "local",
+            "crisis_level": profile["crisis_level"]
+        }, confidence
+
+    def predict_need(self, message: str) -> Optional[Tuple[str, float]]:
+        """主要ニーズと確信度（ニーズヘッドがなければNone）"""
+        if not self.needs_head:
+            return None
+        return self.needs_head.predict(ngram_indices(message, self.dimensions))
+
+    def save(self, path: str):
+        """NumPy形式で保存（pickle不使用）"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        arrays = {
+            "emotion_weights": self.emotion_head.weights,
+            "emotion_bias": self.emotion_head.bias
+        }
+        if self.needs_head:
+            arrays["needs_weights"] = self.needs_head.weights
+            arrays["needs_bias"] = self.needs_head.bias
+
+        meta = {
+            "dimensions": self.dimensions,
+            "ngram_sizes": list(NGRAM_SIZES),
+            "emotion_labels": self.emotion_head.labels,
+            "needs_labels": self.needs_head.labels if self.needs_head else [],
+            "profiles": self.profiles,
+            **self.metadata
+        }
+        # 重みはfloat16で保存（ファイルサイズ半減、精度への影響は無視できる）
+        np.savez_compressed(
+            path,
+            meta=np.array(json.dumps(meta, ensure_ascii=False)),
+            **{name: array.astype(np.float16) for name, array in arrays.items()}
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "LocalClassifier":
+        """保存済みモデルを読み込み"""
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            if tuple(meta.get("ngram_sizes", [])) != NGRAM_SIZES:
+                raise ValueError(f"n-gram設定が異なるモデルです: {meta.get('ngram_sizes')}")
+
+            emotion_head = SoftmaxHead(
+                meta["emotion_labels"],
+                data["emotion_weights"].astype(np.float32),
+                data["emotion_bias"].astype(np.float32)
+            )
+            needs_head = None
+            if meta["needs_labels"]:
+                needs_head = SoftmaxHead(
+                    meta["needs_labels"],
+                    data["needs_weights"].astype(np.float32),
+                    data["needs_bias"].astype(np.float32)
+                )
+
+        metadata = {k: v for k, v in meta.items() if k not in ("dimensions", "ngram_sizes", "emotion_labels", "needs_labels", "profiles")}
+        return cls(emotion_head, needs_head, meta["profiles"], meta["dimensions"], metadata)
+
+
+def build_profiles(examples: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """感情ラベルごとの代表値（強度・共感・危機は中央値、トーン・3層は最頻値）"""
+    grouped: Dict[str, List[Dict[str, Any]]] = {}
+    for example in examples:
+        analysis = example["emotion_analysis"]
+        grouped.setdefault(analysis["primary_emotion"], []).append(analysis)
+
+    profiles = {}
+    for emotion, analyses in grouped.items():
+        layers = Counter(
+            tuple(analysis["emotion_layers"].get(key, "") for key in ("surface", "middle", "deep"))
+            for analysis in analyses
+        ).most_common(1)[0][0]
+        profiles[emotion] = {
+            "emotion_intensity": int(median(analysis["emotion_intensity"] for analysis in analyses)),
+            "empathy_level": int(median(analysis["empathy_level"] for analysis in analyses)),
+            "crisis_level": int(median(analysis["crisis_level"] for analysis in analyses)),
+            "tone_matching": Counter(analysis["tone_matching"] for analysis in analyses).most_common(1)[0][0],
+            "emotion_layers": dict(zip(("surface", "middle", "deep"), layers)),
+            "support": len(analyses)
+        }
+    return profiles
+
+
+_classifier: Optional[LocalClassifier] = None
+_load_attempted = False
+_load_lock = threading.Lock()
+
+
+def get_local_classifier() -> Optional[LocalClassifier]:
+    """学習済みモデルを1回だけ読み込んで返す（無効化・未学習時はNone）"""
+    global _classifier, _load_attempted
+    # 録音・再生中は上流へのプロンプトと呼び出し順序を変えないよう無効
+    if not AppConfig.LOCAL_CLASSIFIER_ENABLED or cassette.active:
+        return None
+
+    if not _load_attempted:
+        with _load_lock:
+            if not _load_attempted:
+                try:
+                    _classifier = LocalClassifier.load(AppConfig.LOCAL_CLASSIFIER_PATH)
+                    print(f"✅ ローカル分類器読み込み: {AppConfig.LOCAL_CLASSIFIER_PATH}")
+                except FileNotFoundError:
+                    print(f"ローカル分類器が見つかりません（全件LLMで分析）: {AppConfig.LOCAL_CLASSIFIER_PATH}")
+                except Exception as e:
+                    print(f"ローカル分類器読み込みエラー: {e}")
+                _load_attempted = True
+    return _classifier
@@ -48,9 +48,12 @@ class MDFileLoader:
             'third_sentence_categories': 'third_sentence_categories.md',
             'category_selection': 'category_selection.md',
             'analysis_system': 'analysis_system.md',
+            'emotion_analysis_system': 'emotion_analysis_system.md',
             'data_collection': 'data_collection.md',
             'fortune_system': 'fortune_system.md',
-            'fortune_menu_matching': 'fortune_menu_matching.md'
+            'fortune_menu_matching': 'fortune_menu_matching.md',
+            'crisis_response': 'crisis_response.md',
+            'resort_v32_analysis': 'resort_v32_analysis.md'
         }
 
         configs = {}
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+メッセージ特徴量
+各分析器のキーワードリストを名前付きグループとして登録し、全キーワードから構築した
+Aho-Corasickオートマトンでメッセージを1回だけ走査する（キーワード数が増えても走査コストは一定）
+ニーズ・RESORT・危機レベル・トーン・占いメニュー・セッション情報抽出は同じ特徴量を参照する
+"""
+
+import threading
+import unicodedata
+from collections import Counter, deque
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, Tuple
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@lru_cache(maxsize=4096)
+def normalize_text(text: str) -> str:
+    """NFKC正規化・小文字化し、空白を除去（全角半角・大文字小文字・「死に たい」のような表記揺れを同一視）"""
+    return "".join(unicodedata.normalize("NFKC", text or "").lower().split())
+
+
+class KeywordAutomaton:
+    """複数キーワードの同時照合（Aho-Corasick、重なり合う出現もすべて数える）"""
+
+    def __init__(self, keywords: Iterable[str]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[Tuple[str, ...]] = [()]
+
+        for keyword in sorted(set(keywords)):
+            if not keyword:
+                continue
+            state = 0
+            for char in keyword:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(())
+                state = next_state
+            self._output[state] = (keyword,)
+
+        # 幅優先で失敗リンクを張り、接尾辞として含まれるキーワードを出力に合流
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                self._output[next_state] += self._output[self._fail[next_state]]
+
+    @property
+    def size(self) -> int:
+        return len(self._goto)
+
+    def scan(self, text: str) -> Counter:
+        """テキスト中の各キーワードの出現回数"""
+        goto, fail, output = self._goto, self._fail, self._output
+        counts: Counter = Counter()
+        state = 0
+        for char in text:
+            while True:
+                next_state = goto[state].get(char)
+                if next_state is not None:
+                    state = next_state
+                    break
+                if state == 0:
+                    break
+                state = fail[state]
+            if output[state]:
+                counts.update(output[state])
+        return counts
+
+
+class KeywordRegistry:
+    """名前付きキーワードグループの登録とオートマトンの構築（登録内容が変わったときだけ再構築）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._groups: Dict[str, FrozenSet[str]] = {}
+        self._keyword_groups: Dict[str, Tuple[str, ...]] = {}
+        self._automaton = KeywordAutomaton(())
+        self._built = True
+        self.version = 0
+
+    def define(self, name: str, keywords: Iterable[str]) -> str:
+        """グループを登録してグループ名を返す（同じ内容の再登録は何もしない）"""
+        normalized = frozenset(normalize_text(keyword) for keyword in keywords if keyword)
+        normalized = frozenset(keyword for keyword in normalized if keyword)
+        if self._groups.get(name) == normalized:
+            return name
+
+        with self._lock:
+            if self._groups.get(name) != normalized:
+                self._groups[name] = normalized
+                self._built = False
+                self.version += 1
+        return name
+
+    def size(self, name: str) -> int:
+        return len(self._groups.get(name, ()))
+
+    def keywords(self, name: str) -> FrozenSet[str]:
+        """グループのキーワード（正規化済み）"""
+        return self._groups.get(name, frozenset())
+
+    def automaton(self) -> Tuple[KeywordAutomaton, Dict[str, Tuple[str, ...]], int]:
+        """現在のオートマトン・キーワード→グループの対応・版"""
+        if not self._built:
+            with self._lock:
+                if not self._built:
+                    keyword_groups: Dict[str, List[str]] = {}
+                    for name, keywords in self._groups.items():
+                        for keyword in keywords:
+                            keyword_groups.setdefault(keyword, []).append(name)
+                    self._keyword_groups = {k: tuple(v) for k, v in keyword_groups.items()}
+                    self._automaton = KeywordAutomaton(self._keyword_groups)
+                    self._built = True
+        return self._automaton, self._keyword_groups, self.version
+
+    def stats(self) -> Dict[str, int]:
+        automaton, keyword_groups, version = self.automaton()
+        return {
+            "groups": len(self._groups),
+            "keywords": len(keyword_groups),
+            "states": automaton.size,
+            "version": version
+        }
+
+
+# シングルトンインスタンス
+keyword_registry = KeywordRegistry()
+
+
+class MessageFeatures:
+    """1メッセージ分の正規化テキストとキーワード出現の多重集合（グループ単位で参照）"""
+
+    __slots__ = ("message", "text", "matches", "_hits", "_registry")
+
+    def __init__(self, message: str, registry: KeywordRegistry = keyword_registry):
+        automaton, keyword_groups, _ = registry.automaton()
+        self.message = message
+        self.text = normalize_text(message)
+        self.matches: Counter = automaton.scan(self.text)
+        self._registry = registry
+
+        # 出現したキーワードだけをグループに振り分ける（コストはリスト長ではなく出現数に比例）
+        hits: Dict[str, set] = {}
+        for keyword in self.matches:
+            for name in keyword_groups.get(keyword, ()):
+                hits.setdefault(name, set()).add(keyword)
+        self._hits = hits
+
+    def hits(self, group: str) -> FrozenSet[str]:
+        """グループ内で出現したキーワード（正規化済み）"""
+        return frozenset(self._hits.get(group, ()))
+
+    def any(self, group: str) -> bool:
+        """グループのキーワードが1つでも含まれるか"""
+        return group in self._hits
+
+    def count(self, group: str) -> int:
+        """含まれるキーワードの種類数（従来の sum(1 for w in keywords if w in text) と同じ）"""
+        return len(self._hits.get(group, ()))
+
+    def all(self, group: str) -> bool:
+        """グループのキーワードがすべて含まれるか（空のグループは偽）"""
+        size = self._registry.size(group)
+        return size > 0 and self.count(group) == size
+
+    def has(self, keyword: str) -> bool:
+        """単一キーワードの有無（未登録のキーワードは正規化テキストの部分一致で判定）"""
+        keyword = normalize_text(keyword)
+        return keyword in self.matches or keyword in self.text
+
+
+@lru_cache(maxsize=256)
+def _cached_features(message: str, version: int) -> MessageFeatures:
+    return MessageFeatures(message)
+
+
+def message_features(message: str) -> MessageFeatures:
+    """メッセージの特徴量（同じメッセージは登録内容が変わらない限り1回だけ走査）"""
+    return _cached_features(message or "", keyword_registry.automaton()[2])
+
+
+# 使用例・テスト関数
+def test_message_features():
+    """従来の部分一致ループとの一致確認と、キーワード数に対する走査コストの比較"""
+    import random
+    import time
+
+    registry = KeywordRegistry()
+    registry.define("a", ["疲れ", "疲れた", "れた", "ＡＢＣ", "元気"])
+    registry.define("b", ["たい", "死にたい", "にた"])
+    features = MessageFeatures("もう疲れた、死に　たい abc", registry)
+    assert features.hits("a") == {"疲れ", "疲れた", "れた", "abc"}, features.hits("a")
+    assert features.count("b") == 3 and features.all("b") and not features.all("a")
+    assert features.has("死にたい") and features.has("もう") and not features.has("元気")
+
+    rng = random.Random(0)
+    alphabet = "あいうえおかきくけこさしすせそたちつてとなにぬねのはひふへほ不安寂疲連絡"
+    for size in (10, 100, 1000, 10000):
+        keywords = sorted({"".join(rng.choice(alphabet) for _ in range(rng.randint(2, 4))) for _ in range(size)})
+        registry.define("bench", keywords)
+        messages = ["".join(rng.choice(alphabet) for _ in range(60)) for _ in range(50)]
+
+        started = time.perf_counter()
+        expected = [sum(1 for keyword in keywords if keyword in message) for message in messages]
+        loop_us = (time.perf_counter() - started) / len(messages) * 1e6
+
+        registry.automaton()
+        started = time.perf_counter()
+        actual = [MessageFeatures(message, registry).count("bench") for message in messages]
+        automaton_us = (time.perf_counter() - started) / len(messages) * 1e6
+
+        assert actual == expected, size
+        print(f"キーワード{len(keywords):>5}件: 部分一致ループ {loop_us:8.1f}µs/件, オートマトン {automaton_us:6.1f}µs/件")
+    print("=== メッセージ特徴量テスト: OK ===")
+
+
+if __name__ == "__main__":
+    test_message_features()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+メトリクス収集
+レイテンシ（直近ウィンドウのパーセンタイル）とカウンタを名前単位で集計
+"""
+
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+
+class LatencyStats:
+    """直近N件のレイテンシ統計"""
+
+    def __init__(self, window: int = 500):
+        self._samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def record(self, seconds: float):
+        """1件記録"""
+        self._samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+
+    def percentile(self, q: float) -> Optional[float]:
+        """直近ウィンドウのパーセンタイル（秒）、サンプルなしはNone"""
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, max(0, int(round(q / 100.0 * (len(ordered) - 1)))))
+        return ordered[index]
+
+    def snapshot(self) -> Dict[str, float]:
+        """ミリ秒単位の要約"""
+        if not self._samples:
+            return {"count": self.count}
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total / self.count * 1000, 2),
+            "p50_ms": round(self.percentile(50) * 1000, 2),
+            "p95_ms": round(self.percentile(95) * 1000, 2),
+            "max_ms": round(max(self._samples) * 1000, 2)
+        }
+
+
+class MetricsRegistry:
+    """名前付きレイテンシ・カウンタのレジストリ（シングルトン）"""
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._latencies = {}
+            cls._instance._counters = {}
+        return cls._instance
+
+    def record(self, name: str, seconds: float):
+        """レイテンシを記録"""
+        stats = self._latencies.get(name)
+        if stats is None:
+            stats = self._latencies[name] = LatencyStats()
+        stats.record(seconds)
+
+    def incr(self, name: str, amount: float = 1):
+        """カウンタを加算"""
+        self._counters[name] = self._counters.get(name, 0) + amount
+
+    def latency(self, name: str) -> Optional[LatencyStats]:
+        """レイテンシ統計を取得"""
+        return self._latencies.get(name)
+
+    @contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        """ブロックの所要時間を記録"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """全メトリクスの要約"""
+        return {
+            "latency": {name: stats.snapshot() for name, stats in sorted(self._latencies.items())},
+            "counters": dict(sorted(self._counters.items()))
+        }
+
+
+# シングルトンインスタンス
+metrics = MetricsRegistry()
+
+def get_metrics() -> MetricsRegistry:
+    """メトリクスレジストリ取得"""
+    return metrics
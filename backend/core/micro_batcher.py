@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+マイクロバッチ
+短い時間窓に届いた同じキーの要求を1回の処理にまとめ、結果を各要求者に返す
+（同一内容をまとめるシングルフライトと異なり、内容の異なる要求を束ねる）
+"""
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Set, Tuple
+
+
+class MicroBatcher:
+    """時間窓または上限件数でバッチを確定して一括処理するクラス
+
+    run_batch は要求の並びを受け取り、同じ順序・同じ件数の結果（個別の失敗は例外オブジェクト）を返す。
+    run_batch 自体が例外を送出した場合は、そのバッチの全要求に同じ例外を返す。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        run_batch: Callable[[List[Any]], Awaitable[List[Any]]],
+        window_seconds: float,
+        max_size: int
+    ):
+        self.name = name
+        self.run_batch = run_batch
+        self.window_seconds = window_seconds
+        self.max_size = max(1, max_size)
+        self._pending: Dict[str, List[Tuple[Any, asyncio.Future]]] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._running: Set[asyncio.Task] = set()
+        self._stats = {"requests": 0, "batches": 0, "batched_requests": 0, "largest_batch": 0}
+
+    async def submit(self, key: str, item: Any) -> Any:
+        """要求を追加して結果を待つ（同じキーの要求だけが同じバッチに入る）"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        batch = self._pending.setdefault(key, [])
+        batch.append((item, future))
+        self._stats["requests"] += 1
+
+        if len(batch) >= self.max_size:
+            self._flush(key)
+        elif len(batch) == 1:
+            self._timers[key] = loop.call_later(self.window_seconds, self._flush, key)
+
+        return await future
+
+    def _flush(self, key: str):
+        """バッチを確定して処理を開始（待機中にキャンセルされた要求は除外）"""
+        timer = self._timers.pop(key, None)
+        if timer:
+            timer.cancel()
+
+        batch = [(item, future) for item, future in self._pending.pop(key, []) if not future.done()]
+        if not batch:
+            return
+
+        self._stats["batches"] += 1
+        self._stats["largest_batch"] = max(self._stats["largest_batch"], len(batch))
+        if len(batch) > 1:
+            self._stats["batched_requests"] += len(batch)
+
+        # 呼び出し元のキャンセルがバッチ内の他の要求に波及しないよう独立タスクで実行
+        task = asyncio.ensure_future(self._run(batch))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch: List[Tuple[Any, asyncio.Future]]):
+        try:
+            try:
+                results = await self.run_batch([item for item, _ in batch])
+                if len(results) != len(batch):
+                    raise ValueError(f"{self.name}: バッチ結果の件数が不一致です（要求{len(batch)}件, 結果{len(results)}件）")
+            except Exception as e:
+                results = [e] * len(batch)
+
+            for (_, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, BaseException):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+        finally:
+            # キャンセル等で結果を配れなかった要求を待たせ続けない
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(RuntimeError(f"{self.name}: バッチ処理が中断されました"))
+
+    def stats(self) -> Dict[str, Any]:
+        """バッチ統計（平均バッチサイズ・待機中の要求数）"""
+        return {
+            **self._stats,
+            "mean_batch_size": round(self._stats["requests"] / self._stats["batches"], 2) if self._stats["batches"] else 0.0,
+            "pending": sum(len(batch) for batch in self._pending.values()),
+            "window_ms": self.window_seconds * 1000,
+            "max_size": self.max_size
+        }
+
+
+# 使用例・テスト関数
+def test_micro_batcher():
+    """同時要求の集約と、個別失敗・上限件数での即時確定の確認"""
+    calls: List[List[int]] = []
+
+    async def double(items: List[int]) -> List[Any]:
+        calls.append(items)
+        await asyncio.sleep(0.01)
+        return [ValueError("負の値") if item < 0 else item * 2 for item in items]
+
+    async def scenario():
+        batcher = MicroBatcher("test", double, window_seconds=0.02, max_size=4)
+        results = await asyncio.gather(
+            *(batcher.submit("k", item) for item in [1, 2, -3]), return_exceptions=True
+        )
+        assert results[:2] == [2, 4] and isinstance(results[2], ValueError), results
+        assert calls == [[1, 2, -3]], calls
+
+        # 上限件数に達したら時間窓を待たずに確定
+        started = time.perf_counter()
+        await asyncio.gather(*(batcher.submit("k", item) for item in range(4)))
+        assert time.perf_counter() - started < 0.02 + 0.01, "上限件数で即時確定されていない"
+        assert calls[-1] == [0, 1, 2, 3], calls
+
+        # 結果の件数不一致は全要求の失敗として返す
+        short = MicroBatcher("short", lambda items: asyncio.sleep(0, result=items[:-1]), window_seconds=0.01, max_size=4)
+        results = await asyncio.gather(*(short.submit("k", item) for item in range(3)), return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results), results
+
+        # 処理タスクがキャンセルされても要求は待たされ続けない
+        hang = MicroBatcher("hang", lambda items: asyncio.sleep(10, result=items), window_seconds=0.0, max_size=1)
+        pending = asyncio.ensure_future(hang.submit("k", 1))
+        await asyncio.sleep(0.01)
+        for task in list(hang._running):
+            task.cancel()
+        try:
+            await asyncio.wait_for(pending, timeout=1.0)
+            raise AssertionError("中断したバッチが成功扱い")
+        except RuntimeError:
+            pass
+        print(batcher.stats())
+
+    asyncio.run(scenario())
+    print("=== マイクロバッチテスト: OK ===")
+
+
+if __name__ == "__main__":
+    test_micro_batcher()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+応答モデルのティア選択
+感情強度・危機レベルが低いターンは高速モデル、強い感情や危機を含むターンは最上位モデルで生成する
+"""
+
+from dataclasses import dataclass
+from typing import Any, Dict
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.config import AppConfig
+
+FAST = "fast"
+STANDARD = "standard"
+STRONG = "strong"
+
+
+@dataclass(frozen=True)
+class ModelTier:
+    """ティア名と生成に使うモデル・最大トークン"""
+    name: str
+    model: str
+    max_tokens: int
+
+
+def get_model_tier(name: str) -> ModelTier:
+    """設定からティアを取得（未定義はstandard）"""
+    config = AppConfig.CHAT_MODEL_TIERS.get(name) or AppConfig.CHAT_MODEL_TIERS[STANDARD]
+    return ModelTier(name if name in AppConfig.CHAT_MODEL_TIERS else STANDARD, config["model"], config["max_tokens"])
+
+
+def select_model_tier(emotion_analysis: Dict[str, Any], crisis_level: int = 0) -> ModelTier:
+    """感情分析と危機レベルからティアを選択（危機・高強度を優先判定）"""
+    if not AppConfig.CHAT_MODEL_TIERING_ENABLED:
+        return get_model_tier(STANDARD)
+
+    rules = AppConfig.CHAT_MODEL_TIER_RULES
+    intensity = emotion_analysis.get("emotion_intensity", 0) or 0
+    # Claude分析の危機レベルとキーワード検出の大きい方
+    crisis = max(crisis_level, emotion_analysis.get("crisis_level", 0) or 0)
+
+    if crisis >= rules["strong_min_crisis"] or intensity >= rules["strong_min_intensity"]:
+        return get_model_tier(STRONG)
+    if crisis <= rules["fast_max_crisis"] and intensity <= rules["fast_max_intensity"]:
+        return get_model_tier(FAST)
+    return get_model_tier(STANDARD)
+
+
+def select_model_tier_before_analysis(crisis_level: int = 0) -> ModelTier:
+    """感情分析前に生成する場合（統合モード）の選択（危機レベルのみで判定し、fastは使わない）"""
+    if not AppConfig.CHAT_MODEL_TIERING_ENABLED:
+        return get_model_tier(STANDARD)
+
+    if crisis_level >= AppConfig.CHAT_MODEL_TIER_RULES["strong_min_crisis"]:
+        return get_model_tier(STRONG)
+    return get_model_tier(STANDARD)
@@ -3,106 +3,418 @@
 """
 OpenAI統合クライアント
 統合サーバー用の単一OpenAI APIクライアント管理
+
+非同期クライアント（AsyncOpenAI）とkeep-alive接続プールを全サービスで共有し、
+補完待ちの間もイベントループをブロックしない
+各呼び出しはProviderRouterがタスク種別ごとのポリシーでOpenAI/Anthropicへ振り分ける
 """
 
-from openai import OpenAI
-from typing import Dict, Any, Optional
+import httpx
+from openai import AsyncOpenAI
+from typing import Dict, Any, List, Optional, AsyncIterator
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from shared.config import AppConfig
+from core.completion_cache import CompletionCache, completion_fingerprint
+from core.single_flight import SingleFlight
+from core.scheduler import Priority
+from core.resilience import Deadline
+from core.circuit_breaker import CircuitBreaker, get_breaker
+from core.prompt_builder import PromptBuilder, PromptLayout
+from core.cassette import cassette
+from core.providers import AnthropicBackend, OpenAIBackend, ProviderRouter
+from core.sentence_limiter import SentenceLimiter
+from core.metrics import metrics
+
+# API障害時の定型応答
+CHAT_ERROR_MESSAGE = "申し訳ございません。一時的にお答えできません。少し時間をおいてからもう一度お試しください。"
+
+# 占い結果の共通形式（静的プレフィックスに含める）
+FORTUNE_READING_FORMAT = """
+占い結果は以下の形式で生成してください：
+- 具体的で的確な洞察
+- 前向きで建設的なアドバイス
+- 神秘的で魅力的な表現
+- 3-5文程度での構成
+"""
+
 
 class OpenAIClientManager:
     """OpenAI APIクライアント管理クラス（シングルトン）"""
 
     _instance = None
     _client = None
+    _http_client = None
+    _cache = None
+    _single_flight = None
+    _breaker = None
+    _router = None
 
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super().__new__(cls)
-            cls._instance._client = OpenAI(api_key=AppConfig.OPENAI_API_KEY)
+            cls._instance._single_flight = SingleFlight("openai")
+            cls._instance._breaker = get_breaker("openai")
+            cls._instance._http_client = cls._build_http_client()
+            cls._instance._client = AsyncOpenAI(
+                api_key=AppConfig.OPENAI_API_KEY,
+                base_url=AppConfig.OPENAI_BASE_URL,
+                http_client=cls._instance._http_client,
+                max_retries=0  # リトライは期限付きでcall_with_retriesが担当
+            )
+            cls._instance._router = ProviderRouter({
+                "openai": OpenAIBackend(cls._instance._client),
+                "anthropic": AnthropicBackend()
+            })
+            if AppConfig.COMPLETION_CACHE_ENABLED:
+                cls._instance._cache = CompletionCache(
+                    db_path=AppConfig.COMPLETION_CACHE_PATH,
+                    ttls=AppConfig.COMPLETION_CACHE_TTLS,
+                    max_memory_entries=AppConfig.COMPLETION_CACHE_MEMORY_ENTRIES,
+                    max_cacheable_temperature=AppConfig.COMPLETION_CACHE_MAX_TEMPERATURE,
+                    max_temperatures=AppConfig.COMPLETION_CACHE_MAX_TEMPERATURES
+                )
         return cls._instance
 
+    @staticmethod
+    def _build_http_client() -> httpx.AsyncClient:
+        """keep-alive接続プール付きHTTPクライアントを構築"""
+        return httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=AppConfig.OPENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=AppConfig.OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=AppConfig.OPENAI_KEEPALIVE_EXPIRY
+            ),
+            timeout=httpx.Timeout(
+                AppConfig.OPENAI_READ_TIMEOUT,
+                connect=AppConfig.OPENAI_CONNECT_TIMEOUT
+            )
+        )
+
     @property
-    def client(self) -> OpenAI:
+    def client(self) -> AsyncOpenAI:
         """OpenAIクライアントインスタンスを取得"""
         return self._client
 
+    @property
+    def cache(self) -> Optional[CompletionCache]:
+        """補完キャッシュ（無効時はNone）"""
+        return self._cache
+
+    @property
+    def single_flight(self) -> SingleFlight:
+        """同時リクエスト集約レイヤー"""
+        return self._single_flight
+
+    @property
+    def breaker(self) -> CircuitBreaker:
+        """OpenAIのサーキットブレーカー"""
+        return self._breaker
+
+    @property
+    def router(self) -> ProviderRouter:
+        """タスク種別ごとのプロバイダルーター"""
+        return self._router
+
+    def rejecting(self, endpoint: str = "chat") -> bool:
+        """エンドポイントの全プロバイダがサーキットOPEN中（待たずにテンプレート応答へ）"""
+        return not self._router.candidates(endpoint)
+
+    def _cache_key(
+        self,
+        endpoint: str,
+        fingerprint: str,
+        temperature: float
+    ) -> Optional[str]:
+        """キャッシュ対象ならキーを返す（録音・再生中はキャッシュを通さない）"""
+        if cassette.active or not self._cache or not self._cache.is_cacheable(endpoint, temperature):
+            return None
+        return fingerprint
+
+    async def create_chat_completion(
+        self,
+        messages: List[Dict[str, str]],
+        model: str = None,
+        max_tokens: int = None,
+        temperature: float = None,
+        endpoint: str = "chat",
+        priority: Priority = Priority.CHAT,
+        deadline: Optional[Deadline] = None
+    ) -> str:
+        """チャット補完の共通呼び出し（全サービス共通・例外は呼び出し元へ）
+
+        プロバイダはエンドポイントのルーティングポリシーで選択される。
+        """
+
+        model = model or AppConfig.CHAT_MODEL
+        max_tokens = AppConfig.MAX_TOKENS if max_tokens is None else max_tokens
+        temperature = AppConfig.TEMPERATURE if temperature is None else temperature
+
+        fingerprint = completion_fingerprint(model, messages, temperature, max_tokens)
+        cache_key = self._cache_key(endpoint, fingerprint, temperature)
+        if cache_key:
+            cached = await self._cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        async def request_completion() -> str:
+            completion = await self._router.complete(
+                endpoint, messages, model, max_tokens, temperature, fingerprint,
+                priority=priority, deadline=deadline
+            )
+
+            if cache_key:
+                await self._cache.set(cache_key, endpoint, completion.text)
+
+            return completion.text
+
+        # 同一フィンガープリントの同時リクエストは1回の上流呼び出しを共有
+        return await self._single_flight.do(fingerprint, request_completion)
+
+    async def create_limited_completion(
+        self,
+        messages: List[Dict[str, str]],
+        model: str = None,
+        max_tokens: int = None,
+        temperature: float = None,
+        endpoint: str = "chat",
+        priority: Priority = Priority.CHAT,
+        deadline: Optional[Deadline] = None
+    ) -> str:
+        """文数制限付きの補完（上限文数までストリーミングで受信、例外は呼び出し元へ）
+
+        同一フィンガープリントの同時リクエストは1本のストリームと打ち切り後のテキストを共有する。
+        """
+
+        model = model or AppConfig.CHAT_MODEL
+        max_tokens = AppConfig.MAX_TOKENS if max_tokens is None else max_tokens
+        temperature = AppConfig.TEMPERATURE if temperature is None else temperature
+        fingerprint = completion_fingerprint(model, messages, temperature, max_tokens)
+
+        async def collect() -> str:
+            chunks = []
+            async for token in self.stream_chat_completion(
+                messages, model, max_tokens, temperature, endpoint, priority, deadline
+            ):
+                chunks.append(token)
+            return "".join(chunks).strip()
+
+        # 打ち切り前の全文とは結果が異なるため、create_chat_completion とは別のキーで集約
+        return await self._single_flight.do(f"{fingerprint}:limited", collect)
+
     async def generate_chat_response(
         self,
         system_prompt: str,
         user_message: str,
         temperature: float = None,
-        max_tokens: int = None
+        max_tokens: int = None,
+        model: str = None,
+        endpoint: str = "chat",
+        priority: Priority = Priority.CHAT,
+        deadline: Optional[Deadline] = None
     ) -> str:
-        """チャット応答生成（統合版）"""
+        """チャット応答生成（統合版）
+
+        文数制限対象のエンドポイントはストリーミングで生成し、上限文数で打ち切る。
+        """
 
         try:
-            response = self._client.chat.completions.create(
-                model=AppConfig.CHAT_MODEL,
+            if endpoint in AppConfig.SENTENCE_LIMIT_ENDPOINTS:
+                return await self.create_limited_completion(
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": user_message}
+                    ],
+                    model=model,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    endpoint=endpoint,
+                    priority=priority,
+                    deadline=deadline
+                )
+
+            return await self.create_chat_completion(
                 messages=[
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_message}
                 ],
-                max_tokens=max_tokens or AppConfig.MAX_TOKENS,
-                temperature=temperature or AppConfig.TEMPERATURE
+                model=model,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                endpoint=endpoint,
+                priority=priority,
+                deadline=deadline
             )
 
-            return response.choices[0].message.content.strip()
-
         except Exception as e:
             print(f"OpenAI API エラー: {e}")
-            return "申し訳ございません。一時的にお答えできません。少し時間をおいてからもう一度お試しください。"
+            return CHAT_ERROR_MESSAGE
+
+    async def stream_chat_completion(
+        self,
+        messages: List[Dict[str, str]],
+        model: str = None,
+        max_tokens: int = None,
+        temperature: float = None,
+        endpoint: str = "chat",
+        priority: Priority = Priority.CHAT,
+        deadline: Optional[Deadline] = None
+    ) -> AsyncIterator[str]:
+        """チャット補完をトークン単位でストリーミング（例外は呼び出し元へ）
+
+        リトライ・フェイルオーバーは最初のトークン前（ストリーム確立まで）のみ行う。
+        文数制限対象のエンドポイントは上限文数に達した時点で上流ストリームを閉じる。
+        """
+
+        model = model or AppConfig.CHAT_MODEL
+        max_tokens = AppConfig.MAX_TOKENS if max_tokens is None else max_tokens
+        temperature = AppConfig.TEMPERATURE if temperature is None else temperature
+
+        fingerprint = completion_fingerprint(model, messages, temperature, max_tokens)
+        cache_key = self._cache_key(endpoint, fingerprint, temperature)
+        if cache_key:
+            cached = await self._cache.get(cache_key)
+            if cached is not None:
+                yield cached
+                return
+
+        limiter = (
+            SentenceLimiter(AppConfig.MAX_RESPONSE_SENTENCES)
+            if endpoint in AppConfig.SENTENCE_LIMIT_ENDPOINTS else None
+        )
+        chunks = []
+        tokens = self._router.stream(
+            endpoint, messages, model, max_tokens, temperature, fingerprint,
+            priority=priority, deadline=deadline
+        )
+        try:
+            async for token in tokens:
+                if limiter:
+                    token = limiter.feed(token)
+                if token:
+                    chunks.append(token)
+                    yield token
+                if limiter and limiter.done:
+                    break
+        finally:
+            await tokens.aclose()
+
+        if limiter:
+            limiter.finish()
+            self._record_sentence_limit(endpoint, limiter, max_tokens)
+
+        if cache_key:
+            await self._cache.set(cache_key, endpoint, "".join(chunks).strip())
+
+    def _record_sentence_limit(self, endpoint: str, limiter: SentenceLimiter, max_tokens: int):
+        """文数制限の打ち切りと節約トークン数（推定）を記録"""
+        report = limiter.report(max_tokens)
+        prefix = f"sentence_limit.{endpoint}"
+        metrics.incr(f"{prefix}.turns")
+        if report["truncated"]:
+            metrics.incr(f"{prefix}.truncated")
+            metrics.incr(f"{prefix}.tokens_trimmed", report["tokens_trimmed"])
+            metrics.incr(f"{prefix}.tokens_saved", report["tokens_saved"])
+        if AppConfig.DEBUG:
+            print(f"文数制限 {endpoint}: {report}")
+
+    async def stream_chat_response(
+        self,
+        system_prompt: str,
+        user_message: str,
+        temperature: float = None,
+        max_tokens: int = None,
+        model: str = None,
+        endpoint: str = "chat",
+        priority: Priority = Priority.CHAT,
+        deadline: Optional[Deadline] = None
+    ) -> AsyncIterator[str]:
+        """チャット応答をストリーミング生成（統合版）"""
+
+        emitted = False
+        try:
+            async for token in self.stream_chat_completion(
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_message}
+                ],
+                model=model,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                endpoint=endpoint,
+                priority=priority,
+                deadline=deadline
+            ):
+                emitted = True
+                yield token
+
+        except Exception as e:
+            print(f"OpenAI ストリーミングエラー: {e}")
+            if not emitted:
+                yield CHAT_ERROR_MESSAGE
+
+    def build_fortune_layout(
+        self,
+        fortune_prompt,
+        user_data: Dict[str, Any],
+        fortune_type: str
+    ) -> PromptLayout:
+        """占いのシステムプロンプトを構築（静的部分を先頭、占いタイプ・ユーザーデータを末尾）"""
+        if isinstance(fortune_prompt, PromptLayout):
+            name, prefix, suffix = f"{fortune_prompt.name}_reading", fortune_prompt.prefix, fortune_prompt.suffix
+        else:
+            name, prefix, suffix = "fortune_reading", "", fortune_prompt
+
+        return (
+            PromptBuilder(name)
+            .static(prefix)
+            .static(FORTUNE_READING_FORMAT)
+            .dynamic(suffix)
+            .dynamic(f"占いタイプ: {fortune_type}\nユーザーデータ: {user_data}")
+            .build()
+        )
 
     async def generate_fortune_reading(
         self,
-        fortune_prompt: str,
+        fortune_prompt,
         user_data: Dict[str, Any],
         fortune_type: str
     ) -> str:
-        """占い結果生成（専用メソッド）"""
+        """占い結果生成（専用メソッド、fortune_promptはPromptLayoutまたは文字列）"""
 
         try:
             # 占い専用プロンプトを構築
-            system_content = f"""
-{fortune_prompt}
+            system_content = self.build_fortune_layout(fortune_prompt, user_data, fortune_type).render()
 
-占いタイプ: {fortune_type}
-ユーザーデータ: {user_data}
-
-占い結果は以下の形式で生成してください：
-- 具体的で的確な洞察
-- 前向きで建設的なアドバイス
-- 神秘的で魅力的な表現
-- 3-5文程度での構成
-"""
-
-            response = self._client.chat.completions.create(
-                model=AppConfig.CHAT_MODEL,
+            return await self.create_chat_completion(
                 messages=[
                     {"role": "system", "content": system_content},
                     {"role": "user", "content": f"{fortune_type}の占いをお願いします"}
                 ],
                 max_tokens=400,  # 占いは少し長めに
-                temperature=0.8  # 創造性を高めに
+                temperature=0.8,  # 創造性を高めに
+                endpoint="fortune",
+                priority=Priority.FORTUNE
             )
 
-            return response.choices[0].message.content.strip()
-
         except Exception as e:
             print(f"占い生成エラー: {e}")
             return "星の導きが一時的に見えません。少し時間をおいてからもう一度お試しください。"
 
+    async def aclose(self):
+        """接続プールを解放（サーバー終了時）"""
+        await self._router.aclose()
+
 
 # シングルトンインスタンス
 openai_manager = OpenAIClientManager()
 
-def get_openai_client() -> OpenAI:
+def get_openai_client() -> AsyncOpenAI:
     """依存関係注入用のクライアント取得"""
     return openai_manager.client
 
 def get_openai_manager() -> OpenAIClientManager:
     """マネージャーインスタンス取得"""
-    return openai_manager
\ No newline at end of file
+    return openai_manager
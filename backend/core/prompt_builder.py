@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+プロンプト組み立てレイヤー
+キャラクター設定・MDルールなどの静的内容をバイト単位で同一の先頭ブロックにまとめ、
+リクエストごとの分析値は末尾に置く（プロバイダ側のプレフィックスキャッシュを効かせる）
+"""
+
+import hashlib
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.metrics import metrics
+from core.token_budget import estimate_tokens
+
+# 静的ブロックと動的ブロックの区切り
+DYNAMIC_SECTION_HEADER = "【今回のリクエスト情報】"
+
+
+@dataclass
+class PromptLayout:
+    """静的プレフィックスと動的サフィックスに分けたプロンプト"""
+    name: str
+    prefix: str
+    suffix: str
+
+    @property
+    def prefix_hash(self) -> str:
+        """プレフィックスのハッシュ（キャッシュ可否の確認用）"""
+        return hashlib.sha256(self.prefix.encode("utf-8")).hexdigest()[:16]
+
+    def render(self) -> str:
+        """送信用の1本のプロンプトに結合"""
+        if not self.suffix:
+            return self.prefix
+        return f"{self.prefix}\n\n{DYNAMIC_SECTION_HEADER}\n{self.suffix}"
+
+
+class PromptBuilder:
+    """静的ブロック → 動的ブロックの順でプロンプトを組み立てる"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._static: List[str] = []
+        self._dynamic: List[str] = []
+
+    @staticmethod
+    def _block(text: str, title: Optional[str]) -> str:
+        # 前後の空白差でプレフィックスが揺れないよう正規化
+        text = (text or "").strip()
+        return f"{title}\n{text}" if title else text
+
+    def static(self, text: str, title: Optional[str] = None) -> "PromptBuilder":
+        """リクエスト間で不変の内容を追加（キャラクター・MDルール・固定の制約）"""
+        block = self._block(text, title)
+        if block:
+            self._static.append(block)
+        return self
+
+    def dynamic(self, text: str, title: Optional[str] = None) -> "PromptBuilder":
+        """リクエストごとに変わる内容を追加（分析値・ユーザー情報）"""
+        block = self._block(text, title)
+        if block:
+            self._dynamic.append(block)
+        return self
+
+    def build(self) -> PromptLayout:
+        """レイアウトを確定し、プレフィックスの変化を記録"""
+        layout = PromptLayout(self.name, "\n\n".join(self._static), "\n\n".join(self._dynamic))
+        prefix_registry.observe(layout)
+        return layout
+
+    def render(self) -> str:
+        """組み立てたプロンプト文字列"""
+        return self.build().render()
+
+
+class PrefixRegistry:
+    """プロンプト種別ごとの静的プレフィックスの安定性を追跡（シングルトン）"""
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._prefixes = {}
+        return cls._instance
+
+    def observe(self, layout: PromptLayout):
+        """プレフィックスを記録（前回と異なればキャッシュミス要因としてカウント）"""
+        entry = self._prefixes.get(layout.name)
+        prefix_hash = layout.prefix_hash
+        if entry is None:
+            entry = self._prefixes[layout.name] = {
+                "prefix_hash": prefix_hash,
+                "prefix_tokens": estimate_tokens(layout.prefix),
+                "builds": 0,
+                "prefix_changes": 0
+            }
+        elif entry["prefix_hash"] != prefix_hash:
+            entry["prefix_hash"] = prefix_hash
+            entry["prefix_tokens"] = estimate_tokens(layout.prefix)
+            entry["prefix_changes"] += 1
+            metrics.incr(f"prompt_prefix.{layout.name}.changed")
+        entry["builds"] += 1
+
+    def stats(self) -> Dict[str, Dict]:
+        """プロンプト種別ごとのプレフィックス状態"""
+        return {name: dict(entry) for name, entry in self._prefixes.items()}
+
+
+# シングルトンインスタンス
+prefix_registry = PrefixRegistry()
+
+
+# 使用例・テスト関数
+def test_prefix_stability():
+    """異なるリクエストでも静的プレフィックスがバイト単位で同一であることを確認"""
+    from core.md_loader import get_md_configs, get_character_config
+    from core.openai_client import openai_manager
+    from core.response_engine import ResponseCandidate
+    from services.chat_service import generate_system_prompt, _build_response_engine
+    from services.fortune_service import FortuneSystem
+
+    md_configs = get_md_configs()
+    character_config = get_character_config()
+
+    requests = [
+        ({"complaining_listening": 0.8, "loneliness": 0.1}, "深い共感", 1),
+        ({"encouragement": 0.6, "recognition_desire": 0.3}, "優しい励まし", 7),
+    ]
+    prompts = [
+        generate_system_prompt(needs, category, rally, md_configs, character_config)
+        for needs, category, rally in requests
+    ]
+    prefixes = [p.split(DYNAMIC_SECTION_HEADER)[0] for p in prompts]
+    assert prompts[0] != prompts[1], "動的部分が反映されていません"
+    assert prefixes[0] == prefixes[1], "システムプロンプトのプレフィックスが揺れています"
+    print(f"システムプロンプト: プレフィックス {estimate_tokens(prefixes[0])} / 全体 {estimate_tokens(prompts[0])} トークン")
+
+    fortune = FortuneSystem(md_configs)
+    fortune_layouts = [
+        openai_manager.build_fortune_layout(
+            fortune.build_fortune_prompt("相手の本音占い", {"name": "A", "age": 25}, "彼氏のこと"),
+            {"name": "A", "age": 25}, "相手の本音占い"
+        ),
+        openai_manager.build_fortune_layout(
+            fortune.build_fortune_prompt("復縁可能性診断", {"name": "B"}, ""),
+            {"name": "B"}, "復縁可能性診断"
+        )
+    ]
+    assert fortune_layouts[0].prefix == fortune_layouts[1].prefix, "占いプロンプトのプレフィックスが揺れています"
+    print(f"占いプロンプト: プレフィックス {estimate_tokens(fortune_layouts[0].prefix)} / 全体 {estimate_tokens(fortune_layouts[0].render())} トークン")
+
+    engine = _build_response_engine()
+    template = engine._load_openai_prompt_template()
+    candidate = ResponseCandidate("第1文", "第2文", "第3文", "a→b→c", 8.0, "理由")
+    engine_prompts = [
+        engine._build_openai_prompt(template, "連絡がこない", {"primary_emotion": "不安", "emotion_intensity": 70}, {}, candidate),
+        engine._build_openai_prompt(template, "仕事がつらい", {"primary_emotion": "悲しみ", "emotion_intensity": 40}, {}, candidate)
+    ]
+    engine_prefixes = [p.split(DYNAMIC_SECTION_HEADER)[0] for p in engine_prompts]
+    assert engine_prefixes[0] == engine_prefixes[1], "応答生成プロンプトのプレフィックスが揺れています"
+    print(f"応答生成プロンプト: プレフィックス {estimate_tokens(engine_prefixes[0])} / 全体 {estimate_tokens(engine_prompts[0])} トークン")
+
+    # __main__実行時も各サービスが使う共有レジストリを参照
+    from core.prompt_builder import prefix_registry as shared_registry
+    for name, entry in shared_registry.stats().items():
+        assert entry["prefix_changes"] == 0, f"{name} のプレフィックスが変化しました"
+        print(f"{name}: {entry}")
+
+    print("=== プレフィックス安定性テスト: OK ===")
+
+
+if __name__ == "__main__":
+    test_prefix_stability()
@@ -0,0 +1,528 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LLMプロバイダ抽象化とルーティング
+OpenAI形式・Anthropic形式のバックエンドを共通インターフェースで扱い、
+タスク種別ごとのポリシー（直近p95優先・重み付け分割・障害時フェイルオーバー）で振り分ける
+"""
+
+import json
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+import httpx
+from openai import AsyncOpenAI
+from openai.types.chat import ChatCompletion
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.config import AppConfig
+from core.metrics import metrics
+from core.scheduler import Priority, scheduler
+from core.resilience import Deadline, call_with_retries, hedge_delay_for, hedged
+from core.circuit_breaker import CircuitOpenError, get_breaker
+from core.cassette import CassetteMiss, cassette
+from core.token_budget import estimate_message_tokens
+
+
+@dataclass
+class Completion:
+    """プロバイダ共通の補完結果"""
+    text: str
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    raw: Dict[str, Any] = field(default_factory=dict)
+
+
+class ProviderBackend:
+    """プロバイダバックエンドの共通インターフェース"""
+
+    name = "base"
+
+    def available(self) -> bool:
+        """APIキーが設定され呼び出し可能か"""
+        return True
+
+    def model_for(self, requested: str) -> str:
+        """指定モデル（OpenAI名）をこのプロバイダのモデルへ変換"""
+        model_map = AppConfig.PROVIDER_MODEL_MAP.get(self.name)
+        if not model_map:
+            return requested
+        return model_map.get(requested, model_map["default"])
+
+    async def complete(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        max_tokens: int,
+        temperature: float,
+        timeout: float
+    ) -> Completion:
+        """補完1回（例外は呼び出し元へ）"""
+        raise NotImplementedError
+
+    async def open_stream(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        max_tokens: int,
+        temperature: float,
+        timeout: float
+    ) -> AsyncIterator[str]:
+        """ストリームを確立し、テキスト差分のイテレータを返す"""
+        raise NotImplementedError
+
+    def parse(self, raw: Dict[str, Any]) -> Completion:
+        """生レスポンス（カセット記録）から補完結果を復元"""
+        raise NotImplementedError
+
+    async def aclose(self):
+        """接続プールを解放"""
+
+
+class OpenAIBackend(ProviderBackend):
+    """OpenAI Chat Completions形式のバックエンド"""
+
+    name = "openai"
+
+    def __init__(self, client: AsyncOpenAI):
+        self.client = client
+
+    def available(self) -> bool:
+        return bool(AppConfig.OPENAI_API_KEY)
+
+    async def complete(self, messages, model, max_tokens, temperature, timeout) -> Completion:
+        response = await self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            timeout=timeout
+        )
+        return self.parse(response.model_dump())
+
+    async def open_stream(self, messages, model, max_tokens, temperature, timeout) -> AsyncIterator[str]:
+        stream = await self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stream=True,
+            timeout=timeout
+        )
+        return self._delta_texts(stream)
+
+    @staticmethod
+    async def _delta_texts(stream) -> AsyncIterator[str]:
+        """ストリーミング応答からテキスト差分のみを取り出す"""
+        try:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            # 途中で閉じられた場合も接続を解放し、上流の生成を止める
+            await stream.response.aclose()
+
+    def parse(self, raw: Dict[str, Any]) -> Completion:
+        response = ChatCompletion.model_validate(raw)
+        usage = response.usage
+        return Completion(
+            text=response.choices[0].message.content.strip(),
+            prompt_tokens=usage.prompt_tokens if usage else None,
+            completion_tokens=usage.completion_tokens if usage else None,
+            raw=raw
+        )
+
+    async def aclose(self):
+        await self.client.close()
+
+
+class AnthropicBackend(ProviderBackend):
+    """Anthropic Messages形式のバックエンド（keep-alive接続プール共有）"""
+
+    name = "anthropic"
+
+    def __init__(self):
+        self.client = httpx.AsyncClient(
+            base_url=AppConfig.ANTHROPIC_BASE_URL,
+            headers={
+                "x-api-key": AppConfig.ANTHROPIC_API_KEY or "",
+                "anthropic-version": AppConfig.ANTHROPIC_VERSION
+            },
+            limits=httpx.Limits(
+                max_connections=AppConfig.ANTHROPIC_MAX_CONNECTIONS,
+                max_keepalive_connections=AppConfig.ANTHROPIC_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=AppConfig.OPENAI_KEEPALIVE_EXPIRY
+            ),
+            timeout=httpx.Timeout(
+                AppConfig.OPENAI_READ_TIMEOUT,
+                connect=AppConfig.OPENAI_CONNECT_TIMEOUT
+            )
+        )
+
+    def available(self) -> bool:
+        return bool(AppConfig.ANTHROPIC_API_KEY)
+
+    @staticmethod
+    def _payload(messages, model, max_tokens, temperature) -> Dict[str, Any]:
+        """OpenAI形式のメッセージをMessages API形式へ変換（systemはトップレベル）"""
+        system = "\n\n".join(m["content"] for m in messages if m["role"] == "system")
+        payload = {
+            "model": model,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "messages": [m for m in messages if m["role"] != "system"]
+        }
+        if system:
+            payload["system"] = system
+        return payload
+
+    async def complete(self, messages, model, max_tokens, temperature, timeout) -> Completion:
+        response = await self.client.post(
+            "/v1/messages",
+            json=self._payload(messages, model, max_tokens, temperature),
+            timeout=timeout
+        )
+        response.raise_for_status()
+        return self.parse(response.json())
+
+    async def open_stream(self, messages, model, max_tokens, temperature, timeout) -> AsyncIterator[str]:
+        request = self.client.build_request(
+            "POST",
+            "/v1/messages",
+            json={**self._payload(messages, model, max_tokens, temperature), "stream": True},
+            timeout=timeout
+        )
+        response = await self.client.send(request, stream=True)
+        if response.status_code != 200:
+            await response.aread()
+            await response.aclose()
+            response.raise_for_status()
+        return self._delta_texts(response)
+
+    @staticmethod
+    async def _delta_texts(response: httpx.Response) -> AsyncIterator[str]:
+        """SSEのcontent_block_deltaからテキスト差分のみを取り出す"""
+        try:
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                event = json.loads(line[5:])
+                if event.get("type") == "content_block_delta":
+                    text = event.get("delta", {}).get("text")
+                    if text:
+                        yield text
+        finally:
+            await response.aclose()
+
+    def parse(self, raw: Dict[str, Any]) -> Completion:
+        usage = raw.get("usage", {})
+        return Completion(
+            text="".join(block.get("text", "") for block in raw.get("content", []) if block.get("type") == "text").strip(),
+            prompt_tokens=usage.get("input_tokens"),
+            completion_tokens=usage.get("output_tokens"),
+            raw=raw
+        )
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+class RoutingPolicy:
+    """タスク種別ごとのプロバイダ優先順位"""
+
+    def __init__(
+        self,
+        task: str,
+        providers: List[str],
+        strategy: str = "primary",
+        weights: Optional[Dict[str, float]] = None
+    ):
+        self.task = task
+        self.providers = providers
+        self.strategy = strategy
+        self.weights = weights or {}
+
+    def order(self, providers: List[str], endpoint: str) -> Tuple[List[str], Optional[str]]:
+        """候補プロバイダを試行順に並べる（探索で先頭にしたプロバイダも返す）"""
+        if self.strategy == "weighted":
+            weights = [max(0.0, self.weights.get(name, 0.0)) for name in providers]
+            if sum(weights) <= 0:
+                return providers, None
+            first = random.choices(providers, weights=weights)[0]
+            return [first] + [name for name in providers if name != first], None
+
+        if self.strategy == "latency":
+            measured = {}
+            for name in providers:
+                stats = metrics.latency(f"llm.{name}.{endpoint}")
+                if stats is not None and stats.count >= AppConfig.ROUTING_LATENCY_MIN_SAMPLES:
+                    measured[name] = stats.percentile(AppConfig.ROUTING_LATENCY_PERCENTILE)
+            ordered = sorted(measured, key=measured.get) + [name for name in providers if name not in measured]
+            # 一部は最速以外へ送り、遅かったプロバイダの回復・未計測プロバイダを観測する
+            if len(ordered) > 1 and random.random() < AppConfig.ROUTING_EXPLORE_RATE:
+                explored = random.choice(ordered[1:])
+                return [explored] + [name for name in ordered if name != explored], explored
+            return ordered, None
+
+        return providers, None
+
+
+class ProviderRouter:
+    """ポリシーに従ってプロバイダを選び、失敗時は次のプロバイダへフェイルオーバー"""
+
+    def __init__(self, backends: Dict[str, ProviderBackend]):
+        self.backends = backends
+        self.policies = {
+            task: RoutingPolicy(task, **config)
+            for task, config in AppConfig.ROUTING_POLICIES.items()
+        }
+
+    def policy_for(self, endpoint: str) -> RoutingPolicy:
+        """エンドポイントに対応するポリシー（未定義はdefault）"""
+        task = AppConfig.ROUTING_TASK_ALIASES.get(endpoint, endpoint)
+        return self.policies.get(task) or self.policies["default"]
+
+    def _route(self, endpoint: str) -> Tuple[List[str], Optional[str]]:
+        """試行順の利用可能プロバイダと探索先（APIキー未設定・サーキットOPEN中は除外）"""
+        usable = [
+            name for name in self.policy_for(endpoint).providers
+            if name in self.backends and self.backends[name].available() and not get_breaker(name).rejecting()
+        ]
+        return self.policy_for(endpoint).order(usable, endpoint)
+
+    def candidates(self, endpoint: str) -> List[str]:
+        """試行順の利用可能プロバイダ（APIキー未設定・サーキットOPEN中は除外）"""
+        return self._route(endpoint)[0]
+
+    def _hedge_delay(self, provider: str, endpoint: str) -> Optional[float]:
+        """ヘッジ遅延（無効・対象外・サンプル不足はNone）"""
+        if not AppConfig.LLM_HEDGING_ENABLED or endpoint not in AppConfig.LLM_HEDGING_ENDPOINTS or cassette.active:
+            return None
+        return hedge_delay_for(
+            f"llm.{provider}.{endpoint}",
+            AppConfig.LLM_HEDGING_MIN_SAMPLES,
+            AppConfig.LLM_HEDGING_PERCENTILE
+        )
+
+    @staticmethod
+    def _attempts(index: int, providers: List[str]) -> int:
+        """後続プロバイダがあれば早めにフェイルオーバーする"""
+        if index < len(providers) - 1:
+            return AppConfig.ROUTING_ATTEMPTS_BEFORE_FAILOVER
+        return AppConfig.LLM_MAX_ATTEMPTS
+
+    @staticmethod
+    def _should_failover(error: Exception, deadline: Deadline) -> bool:
+        """次のプロバイダを試す価値があるか（期限切れ・録音なしは打ち切り）"""
+        return not deadline.expired() and not isinstance(error, CassetteMiss)
+
+    def _record_usage(self, provider: str, endpoint: str, messages: List[Dict[str, str]], completion: Optional[Completion] = None):
+        """呼び出しごとのトークン数を記録（usage未提供時は推定値のみ）"""
+        prefix = f"tokens.{provider}.{endpoint}"
+        metrics.incr(f"{prefix}.calls")
+        metrics.incr(f"{prefix}.prompt_estimated", estimate_message_tokens(messages))
+        if completion is not None and completion.prompt_tokens is not None:
+            metrics.incr(f"{prefix}.prompt", completion.prompt_tokens)
+            metrics.incr(f"{prefix}.completion", completion.completion_tokens or 0)
+
+    def _replayed_completion(self, entry: Dict[str, Any]) -> Completion:
+        """録音から補完結果を復元（ストリーミング録音はテキストのみ）"""
+        if "chunks" in entry:
+            return Completion(text=entry["response"]["text"].strip(), raw=entry["response"])
+        return self.backends[entry["provider"]].parse(entry["response"])
+
+    def _require_candidates(self, endpoint: str) -> Tuple[List[str], Optional[str]]:
+        providers, explored = self._route(endpoint)
+        if not providers:
+            raise CircuitOpenError(f"{endpoint}: 利用可能なプロバイダがありません")
+        return providers, explored
+
+    @staticmethod
+    def _explore_counter(endpoint: str, explored: Optional[str]) -> Callable[[str], None]:
+        """探索先へ実際に送った時点で1回だけ route.explore を数える"""
+        pending = {explored} if explored else set()
+
+        def dispatched(name: str):
+            if name in pending:
+                pending.discard(name)
+                metrics.incr(f"route.explore.{endpoint}.{name}")
+        return dispatched
+
+    async def complete(
+        self,
+        endpoint: str,
+        messages: List[Dict[str, str]],
+        model: str,
+        max_tokens: int,
+        temperature: float,
+        fingerprint: str,
+        priority: Priority = Priority.CHAT,
+        deadline: Optional[Deadline] = None
+    ) -> Completion:
+        """ポリシー順にプロバイダを試行して補完を取得"""
+        deadline = deadline or Deadline(AppConfig.LLM_DEFAULT_DEADLINE_SECONDS)
+        providers, explored = self._require_candidates(endpoint)
+        dispatched = self._explore_counter(endpoint, explored)
+        last_error = None
+
+        for index, name in enumerate(providers):
+            backend = self.backends[name]
+            breaker = get_breaker(name)
+            provider_model = backend.model_for(model)
+            hedge_delay = self._hedge_delay(name, endpoint)
+
+            async def send(timeout: float, name=name, backend=backend, breaker=breaker, provider_model=provider_model):
+                async with scheduler.slot(name, priority), breaker.guard():
+                    dispatched(name)
+                    started = time.perf_counter()
+                    if cassette.replaying:
+                        entry = cassette.lookup(endpoint, fingerprint)
+                        await cassette.wait(entry)
+                        completion = self._replayed_completion(entry)
+                    else:
+                        completion = await backend.complete(messages, provider_model, max_tokens, temperature, timeout)
+                    elapsed = time.perf_counter() - started
+                    metrics.record(f"llm.{name}.{endpoint}", elapsed)
+                    if cassette.recording:
+                        cassette.record(name, endpoint, fingerprint, completion.raw, elapsed)
+                    return completion
+
+            async def attempt(timeout: float, name=name, send=send, hedge_delay=hedge_delay):
+                # p95を超えて応答がなければ2本目を送り、先着を採用
+                return await hedged(lambda: send(timeout), hedge_delay, name=f"{name}.{endpoint}")
+
+            if index > 0:
+                metrics.incr(f"route.failover.{endpoint}.{name}")
+            try:
+                completion = await call_with_retries(
+                    attempt,
+                    deadline,
+                    max_attempts=self._attempts(index, providers),
+                    base_delay=AppConfig.LLM_RETRY_BASE_DELAY,
+                    max_delay=AppConfig.LLM_RETRY_MAX_DELAY,
+                    name=f"{name}.{endpoint}"
+                )
+            except Exception as e:
+                last_error = e
+                if not self._should_failover(e, deadline):
+                    break
+                print(f"{name} 呼び出しエラー（次のプロバイダを試行）: {e}")
+                continue
+
+            metrics.incr(f"route.{endpoint}.{name}")
+            self._record_usage(name, endpoint, messages, completion)
+            return completion
+
+        raise last_error
+
+    async def stream(
+        self,
+        endpoint: str,
+        messages: List[Dict[str, str]],
+        model: str,
+        max_tokens: int,
+        temperature: float,
+        fingerprint: str,
+        priority: Priority = Priority.CHAT,
+        deadline: Optional[Deadline] = None
+    ) -> AsyncIterator[str]:
+        """ストリーミング補完（フェイルオーバーは最初のトークン前のみ）"""
+        deadline = deadline or Deadline(AppConfig.LLM_DEFAULT_DEADLINE_SECONDS)
+        providers, explored = self._require_candidates(endpoint)
+        dispatched = self._explore_counter(endpoint, explored)
+        last_error = None
+
+        for index, name in enumerate(providers):
+            backend = self.backends[name]
+            breaker = get_breaker(name)
+            provider_model = backend.model_for(model)
+
+            async def open_stream(timeout: float, name=name, backend=backend, breaker=breaker, provider_model=provider_model):
+                async with breaker.guard():
+                    dispatched(name)
+                    return await backend.open_stream(messages, provider_model, max_tokens, temperature, timeout)
+
+            if index > 0:
+                metrics.incr(f"route.failover.{endpoint}.{name}")
+
+            async with scheduler.slot(name, priority):
+                started = last = time.perf_counter()
+                try:
+                    if cassette.replaying:
+                        dispatched(name)
+                        entry = cassette.lookup(endpoint, fingerprint)
+                        if "chunks" not in entry:
+                            # 非ストリーミングで録音した応答は1チャンクとして再生
+                            entry = {**entry, "chunks": [[entry["latency"], self._replayed_completion(entry).text]]}
+                        tokens = cassette.replay_chunks(entry)
+                    else:
+                        tokens = await call_with_retries(
+                            open_stream,
+                            deadline,
+                            max_attempts=self._attempts(index, providers),
+                            base_delay=AppConfig.LLM_RETRY_BASE_DELAY,
+                            max_delay=AppConfig.LLM_RETRY_MAX_DELAY,
+                            name=f"{name}.{endpoint}"
+                        )
+                except Exception as e:
+                    last_error = e
+                    if not self._should_failover(e, deadline):
+                        break
+                    print(f"{name} ストリーム確立エラー（次のプロバイダを試行）: {e}")
+                    continue
+
+                metrics.incr(f"route.{endpoint}.{name}")
+                chunks = []
+                timings = []
+                failed = False
+                try:
+                    async for token in tokens:
+                        now = time.perf_counter()
+                        timings.append((now - last, token))
+                        last = now
+                        chunks.append(token)
+                        yield token
+                except GeneratorExit:
+                    raise
+                except BaseException:
+                    failed = True
+                    raise
+                finally:
+                    # 呼び出し元が途中で閉じた場合（文数制限など）も上流を閉じ、受信分を記録
+                    await tokens.aclose()
+                    # 受信完了（または呼び出し元の打ち切り）までの時間をレイテンシ順ルーティング・ヘッジの標本にする
+                    if not failed:
+                        metrics.record(f"llm.{name}.{endpoint}", time.perf_counter() - started)
+                    # ストリーミングはusageが返らないため推定値のみ記録
+                    self._record_usage(name, endpoint, messages)
+                    if cassette.recording:
+                        cassette.record(
+                            name, endpoint, fingerprint, {"text": "".join(chunks)},
+                            time.perf_counter() - started, chunks=timings
+                        )
+            return
+
+        raise last_error
+
+    def stats(self) -> Dict[str, Dict]:
+        """タスク種別ごとのポリシーと現在の試行順"""
+        return {
+            task: {
+                "providers": policy.providers,
+                "strategy": policy.strategy,
+                "weights": policy.weights,
+                "available": [
+                    name for name in policy.providers
+                    if name in self.backends and self.backends[name].available()
+                ]
+            }
+            for task, policy in self.policies.items()
+        }
+
+    async def aclose(self):
+        """全バックエンドの接続プールを解放"""
+        for backend in self.backends.values():
+            await backend.aclose()
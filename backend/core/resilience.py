@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+上流呼び出しの耐障害ユーティリティ
+リクエスト期限（Deadline）・ジッター付きリトライ（Retry-After対応）・ヘッジリクエスト
+"""
+
+import asyncio
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Optional, TypeVar
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.metrics import metrics
+
+T = TypeVar("T")
+
+# リトライ対象のHTTPステータス
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+
+
+class DeadlineExceeded(Exception):
+    """リクエスト期限切れ"""
+
+
+class Deadline:
+    """ターン単位のリクエスト期限（monotonic時計基準）"""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        """残り秒数（期限切れは0）"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        """期限切れか"""
+        return self.remaining() <= 0
+
+    def timeout(self, cap: Optional[float] = None) -> float:
+        """残り時間とcapの小さい方"""
+        remaining = self.remaining()
+        return min(cap, remaining) if cap is not None else remaining
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """例外のレスポンスヘッダからRetry-After（秒）を取得"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000.0
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+def is_retryable(error: Exception) -> bool:
+    """リトライで回復が見込める失敗か"""
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+        return True
+
+    status_code = getattr(error, "status_code", None)
+    if status_code is None:
+        status_code = getattr(getattr(error, "response", None), "status_code", None)
+    if status_code is not None:
+        return status_code in RETRYABLE_STATUS_CODES
+
+    # 接続エラー・タイムアウト系（openai.APIConnectionError / httpx.TransportError など）
+    return any(name in type(error).__name__ for name in ("Timeout", "Connection", "Transport"))
+
+
+async def call_with_retries(
+    attempt: Callable[[float], Awaitable[T]],
+    deadline: Deadline,
+    max_attempts: int = 3,
+    base_delay: float = 0.5,
+    max_delay: float = 8.0,
+    name: str = "upstream"
+) -> T:
+    """期限内でジッター付き指数バックオフのリトライを行う
+
+    attemptには今回の試行に使えるタイムアウト秒数を渡す。
+    """
+    for attempt_index in range(max_attempts):
+        timeout = deadline.remaining()
+        if timeout <= 0:
+            metrics.incr(f"deadline_exceeded.{name}")
+            raise DeadlineExceeded(f"{name}: リクエスト期限切れ")
+
+        try:
+            return await asyncio.wait_for(attempt(timeout), timeout)
+
+        except Exception as e:
+            if attempt_index + 1 >= max_attempts or not is_retryable(e):
+                raise
+
+            delay = retry_after_seconds(e)
+            if delay is None:
+                # フルジッター
+                delay = random.uniform(0, min(max_delay, base_delay * (2 ** attempt_index)))
+
+            if delay >= deadline.remaining():
+                metrics.incr(f"deadline_exceeded.{name}")
+                raise
+
+            metrics.incr(f"retry.{name}")
+            print(f"{name} リトライ {attempt_index + 1}/{max_attempts - 1}（{delay:.2f}秒後）: {e}")
+            await asyncio.sleep(delay)
+
+    raise DeadlineExceeded(f"{name}: リトライ上限到達")
+
+
+async def hedged(
+    call: Callable[[], Awaitable[T]],
+    hedge_delay: Optional[float],
+    name: str = "upstream"
+) -> T:
+    """hedge_delay秒で応答がなければ2本目を送り、先に成功した方を採用"""
+    first = asyncio.ensure_future(call())
+    if hedge_delay is None:
+        return await first
+
+    second = None
+    try:
+        done, _ = await asyncio.wait({first}, timeout=hedge_delay)
+        if done:
+            return first.result()
+
+        metrics.incr(f"hedge.fired.{name}")
+        second = asyncio.ensure_future(call())
+        pending = {first, second}
+        error = None
+
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is second:
+                        metrics.incr(f"hedge.won.{name}")
+                    return task.result()
+                error = error or task.exception()
+
+        raise error
+
+    finally:
+        # 呼び出し元のキャンセル（期限切れを含む）・採用済みの場合も、残った呼び出しを必ず止める
+        for task in (first, second):
+            if task is not None and not task.done():
+                task.cancel()
+
+
+def hedge_delay_for(metric_name: str, min_samples: int, percentile: float = 95) -> Optional[float]:
+    """直近レイテンシのパーセンタイルからヘッジ遅延を算出（サンプル不足はNone）"""
+    stats = metrics.latency(metric_name)
+    if stats is None or stats.count < min_samples:
+        return None
+    return stats.percentile(percentile)
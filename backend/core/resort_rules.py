@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+RESORTルールプログラム
+resort_v32_analysis.md のYAMLブロックを版（内容ハッシュ）ごとに1回だけ解析・検証し、
+RESORTスコア・占いタイミング・占いメニュー提案で共有するルールプログラムにコンパイルする
+"""
+
+import hashlib
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import yaml
+
+from core.message_features import MessageFeatures, keyword_registry, message_features
+
+RESORT_DIMENSIONS = ("relationship", "emotion", "situation", "objective", "resource", "time")
+
+# YAMLのトップレベルキー → ルールのセクション（付随キーは同じセクションに統合）
+SECTION_KEYS = {
+    "relationship_keywords": ("relationship", None),
+    "emotion_keywords": ("emotion", None),
+    "special_patterns": ("emotion", "special_patterns"),
+    "default_emotion": ("emotion", "default_emotion"),
+    "situation_keywords": ("situation", None),
+    "objective_keywords": ("objective", None),
+    "resource_keywords": ("resource", None),
+    "calculation_logic": ("resource", "calculation_logic"),
+    "time_keywords": ("time", None),
+    "fortune_mapping": ("fortune_mapping", None),
+    "timing_calculation": ("timing_calculation", None)
+}
+
+# MDがない・セクションが欠けている場合のルール（MDと同じ形式）
+DEFAULT_RESORT_RULES = {
+    "relationship": {
+        "high_intimacy": {"keywords": ["彼氏", "彼女", "恋人"], "score": 7},
+        "medium_intimacy": {"keywords": ["友人", "職場", "家族"], "score": 5}
+    },
+    "emotion": {
+        "strong_emotions": ["不安", "心配", "寂しい", "辛い", "悲しい", "怒り"],
+        "special_patterns": {"contact_anxiety": {"pattern": ["連絡", "ない"], "score": 7}}
+    },
+    "situation": {
+        "urgency_high": {"keywords": ["緊急", "今すぐ", "どうしよう", "大変"], "score": 8},
+        "contact_situation": {"pattern": ["連絡", "ない"], "score": 5}
+    },
+    "objective": {
+        "clear_purpose": {"keywords": ["どうしたら", "方法", "解決"], "score": 6},
+        "default": {"score": 3}
+    },
+    "resource": {
+        "positive": {"keywords": ["頑張る", "できる", "強い", "大丈夫"]},
+        "negative": {"keywords": ["疲れた", "無理", "限界", "もうダメ"]},
+        "calculation_logic": {"if_negative_dominates": 3, "default": 5}
+    },
+    "time": {
+        "temporal_indicators": {"keywords": ["最近", "今", "以前から", "長い間", "いつも"], "score": 8},
+        "contact_temporal": {"pattern": ["連絡"], "score": 8}
+    },
+    "fortune_mapping": {
+        "romance": "相手の本音占い",
+        "relationship": "人間関係修復",
+        "emotion": "恋愛進展タイミング",
+        "spirit": "運命の相手探し",
+        "occupation": "総合運勢・人生指針"
+    },
+    "timing_calculation": {"resort_weight": 0.4, "needs_weight": 0.6}
+}
+
+DEFAULT_FORTUNE_MENU = "総合運勢・人生指針"
+
+
+def resort_rules_version(md_content: str) -> str:
+    """RESORT分析MDの版（内容ハッシュ）"""
+    return hashlib.sha256((md_content or "").encode("utf-8")).hexdigest()[:16]
+
+
+def parse_resort_rules(md_content: str) -> Tuple[Dict[str, Dict[str, Any]], List[str]]:
+    """MDのYAMLブロックをセクション別のルールに統合（読めないブロックはエラーとして報告）"""
+    rules: Dict[str, Dict[str, Any]] = {}
+    errors: List[str] = []
+
+    for index, block in enumerate(re.findall(r'```yaml\n(.*?)\n```', md_content or "", re.DOTALL), 1):
+        try:
+            data = yaml.safe_load(block)
+        except yaml.YAMLError as e:
+            errors.append(f"YAMLブロック{index}: 解析できません ({str(e).splitlines()[0]})")
+            continue
+        if not isinstance(data, dict):
+            continue
+
+        for key, value in data.items():
+            if key not in SECTION_KEYS:
+                continue
+            section, nested = SECTION_KEYS[key]
+            if not isinstance(value, dict):
+                errors.append(f"YAMLブロック{index}: {key} はマッピングである必要があります")
+                continue
+            if nested:
+                rules.setdefault(section, {})[nested] = value
+            else:
+                rules.setdefault(section, {}).update(value)
+
+    return rules, errors
+
+
+@dataclass(frozen=True)
+class MatchRule:
+    """キーワードグループに該当したときのスコア（require_all はすべての語を含む場合のみ）"""
+    group: str
+    score: int
+    require_all: bool = False
+
+    def matches(self, features: MessageFeatures) -> bool:
+        return features.all(self.group) if self.require_all else features.any(self.group)
+
+
+@dataclass
+class ResortRuleProgram:
+    """コンパイル済みのRESORTルール（各次元の評価は上から順に最初に該当したルール）"""
+    version: str
+    relationship: Tuple[MatchRule, ...]
+    emotion_group: str
+    emotion: Tuple[MatchRule, ...]
+    situation: Tuple[MatchRule, ...]
+    objective: Tuple[MatchRule, ...]
+    objective_default: int
+    resource_positive: str
+    resource_negative: str
+    resource_negative_score: int
+    resource_default: int
+    time: Tuple[MatchRule, ...]
+    resort_weight: float
+    needs_weight: float
+    fortune_mapping: Dict[str, str]
+    errors: List[str] = field(default_factory=list)
+
+    def scores(self, message: str, needs_analysis: Dict[str, float], rally_count: int) -> Dict[str, int]:
+        """RESORT 6次元スコア（1-10）"""
+        features = message_features(message)
+        scores = {}
+
+        scores["relationship"] = _first_match(self.relationship, features, max(1, rally_count))
+
+        emotion_count = features.count(self.emotion_group)
+        if emotion_count > 0:
+            scores["emotion"] = min(8, 5 + emotion_count)
+        else:
+            scores["emotion"] = _first_match(self.emotion, features, max(1, int(sum(needs_analysis.values()) * 5)))
+
+        scores["situation"] = _first_match(self.situation, features, max(1, min(7, rally_count + 2)))
+        scores["objective"] = _first_match(self.objective, features, self.objective_default)
+
+        if features.count(self.resource_negative) > features.count(self.resource_positive):
+            scores["resource"] = self.resource_negative_score
+        else:
+            scores["resource"] = self.resource_default
+
+        scores["time"] = _first_match(self.time, features, max(1, rally_count))
+
+        # スコアを1-10に正規化
+        return {key: min(10, max(1, score)) for key, score in scores.items()}
+
+    def fortune_timing(self, resort_scores: Dict[str, int], needs_analysis: Dict[str, float]) -> int:
+        """占いタイミングスコア（0-100）"""
+        total_resort = sum(resort_scores.values()) / len(resort_scores)
+        needs_strength = sum(needs_analysis.values()) * 10
+
+        timing_score = int(total_resort * self.resort_weight + needs_strength * self.needs_weight)
+        return min(100, max(0, timing_score))
+
+    def fortune_menu(self, resort_scores: Dict[str, int]) -> str:
+        """最も高いRESORT次元に対応する占いメニュー"""
+        max_resort_key = max(resort_scores, key=resort_scores.get)
+        default_menu = self.fortune_mapping.get("default", DEFAULT_FORTUNE_MENU)
+        return self.fortune_mapping.get(max_resort_key, default_menu)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"version": self.version, "errors": list(self.errors)}
+
+
+def _first_match(rules: Tuple[MatchRule, ...], features: MessageFeatures, default: int) -> int:
+    for rule in rules:
+        if rule.matches(features):
+            return rule.score
+    return default
+
+
+class _RuleCompiler:
+    """セクション単位で検証しながらルールプログラムを組み立てる（不正な項目はエラーを記録して既定値）"""
+
+    def __init__(self, rules: Dict[str, Dict[str, Any]], errors: List[str]):
+        self.rules = rules
+        self.errors = errors
+
+    def section(self, name: str) -> Tuple[Dict[str, Any], str]:
+        """MDのセクション（なければ既定ルール）と、キーワードグループの名前空間"""
+        if self.rules.get(name):
+            return self.rules[name], f"resort.rules.{name}"
+        return DEFAULT_RESORT_RULES[name], f"resort.default.{name}"
+
+    def keywords(self, value: Any, where: str) -> List[str]:
+        if not isinstance(value, list) or not all(isinstance(keyword, str) and keyword for keyword in value):
+            self.errors.append(f"{where}: 空でない文字列のリストである必要があります")
+            return []
+        return value
+
+    def score(self, value: Any, default: int, where: str) -> int:
+        if value is None:
+            return default
+        if isinstance(value, bool) or not isinstance(value, int) or not 1 <= value <= 10:
+            self.errors.append(f"{where}: スコアは1-10の整数である必要があります（{value!r}）")
+            return default
+        return value
+
+    def weight(self, value: Any, default: float, where: str) -> float:
+        if value is None:
+            return default
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+            self.errors.append(f"{where}: 重みは0以上の数値である必要があります（{value!r}）")
+            return default
+        return float(value)
+
+    def rule(self, section: Dict[str, Any], namespace: str, key: str, default_score: int,
+             field_name: str = "keywords", require_all: bool = False) -> Optional[MatchRule]:
+        """section[key] の {keywords|pattern, score} を MatchRule に（未定義なら None）"""
+        spec = section.get(key)
+        if spec is None:
+            return None
+        where = f"{namespace}.{key}"
+        if not isinstance(spec, dict):
+            self.errors.append(f"{where}: マッピングである必要があります")
+            return None
+
+        score = self.score(spec.get("score"), default_score, f"{where}.score")
+        keywords = self.keywords(spec.get(field_name, []), f"{where}.{field_name}")
+        # 組み合わせパターンは2語以上のときだけ有効
+        if require_all and len(keywords) < 2:
+            if keywords:
+                self.errors.append(f"{where}.{field_name}: 組み合わせパターンは2語以上必要です")
+            return None
+        if not keywords:
+            return None
+
+        group = keyword_registry.define(f"{namespace}.{key}", keywords)
+        return MatchRule(group, score, require_all)
+
+    def compile(self, version: str) -> ResortRuleProgram:
+        relationship, rel_ns = self.section("relationship")
+        emotion, emo_ns = self.section("emotion")
+        situation, sit_ns = self.section("situation")
+        objective, obj_ns = self.section("objective")
+        resource, res_ns = self.section("resource")
+        time_rules, time_ns = self.section("time")
+        fortune_mapping, _ = self.section("fortune_mapping")
+        timing, _ = self.section("timing_calculation")
+
+        special_patterns = emotion.get("special_patterns", {})
+        if not isinstance(special_patterns, dict):
+            self.errors.append(f"{emo_ns}.special_patterns: マッピングである必要があります")
+            special_patterns = {}
+
+        resource_groups = {}
+        for polarity in ("positive", "negative"):
+            spec = resource.get(polarity, {})
+            keywords = self.keywords(spec.get("keywords", []), f"{res_ns}.{polarity}.keywords") if isinstance(spec, dict) else []
+            resource_groups[polarity] = keyword_registry.define(f"{res_ns}.{polarity}", keywords)
+        calculation = resource.get("calculation_logic", {})
+        if not isinstance(calculation, dict):
+            self.errors.append(f"{res_ns}.calculation_logic: マッピングである必要があります")
+            calculation = {}
+
+        objective_default = objective.get("default", {})
+        # 既定のマッピングは旧来のキー（romance等）を含むため、次元名の検証はMDの定義のみ
+        mapping_from_md = bool(self.rules.get("fortune_mapping"))
+        mapping = {}
+        for key, menu in fortune_mapping.items():
+            if not isinstance(menu, str):
+                self.errors.append(f"fortune_mapping.{key}: 占いメニュー名（文字列）である必要があります")
+            elif mapping_from_md and key not in RESORT_DIMENSIONS + ("default",):
+                self.errors.append(f"fortune_mapping.{key}: RESORTの次元名または default である必要があります")
+            else:
+                mapping[key] = menu
+
+        def present(*rules: Optional[MatchRule]) -> Tuple[MatchRule, ...]:
+            return tuple(rule for rule in rules if rule)
+
+        return ResortRuleProgram(
+            version=version,
+            relationship=present(
+                self.rule(relationship, rel_ns, "high_intimacy", 7),
+                self.rule(relationship, rel_ns, "medium_intimacy", 5)
+            ),
+            emotion_group=keyword_registry.define(
+                f"{emo_ns}.strong_emotions",
+                self.keywords(emotion.get("strong_emotions", []), f"{emo_ns}.strong_emotions")
+            ),
+            emotion=present(self.rule(special_patterns, emo_ns, "contact_anxiety", 7, "pattern", require_all=True)),
+            situation=present(
+                self.rule(situation, sit_ns, "urgency_high", 8),
+                self.rule(situation, sit_ns, "contact_situation", 5, "pattern", require_all=True)
+            ),
+            objective=present(self.rule(objective, obj_ns, "clear_purpose", 6)),
+            objective_default=self.score(
+                objective_default.get("score") if isinstance(objective_default, dict) else None, 3, f"{obj_ns}.default.score"
+            ),
+            resource_positive=resource_groups["positive"],
+            resource_negative=resource_groups["negative"],
+            resource_negative_score=self.score(calculation.get("if_negative_dominates"), 3, f"{res_ns}.calculation_logic.if_negative_dominates"),
+            resource_default=self.score(calculation.get("default"), 5, f"{res_ns}.calculation_logic.default"),
+            time=present(
+                self.rule(time_rules, time_ns, "temporal_indicators", 8),
+                self.rule(time_rules, time_ns, "contact_temporal", 8, "pattern")
+            ),
+            resort_weight=self.weight(timing.get("resort_weight"), 0.4, "timing_calculation.resort_weight"),
+            needs_weight=self.weight(timing.get("needs_weight"), 0.6, "timing_calculation.needs_weight"),
+            fortune_mapping=mapping,
+            errors=self.errors
+        )
+
+
+def compile_resort_rules(md_content: str) -> ResortRuleProgram:
+    """RESORT分析MDをルールプログラムにコンパイル（検証エラーは errors に記録して表示）"""
+    rules, errors = parse_resort_rules(md_content)
+    program = _RuleCompiler(rules, errors).compile(resort_rules_version(md_content))
+    for error in program.errors:
+        print(f"RESORTルールエラー: {error}")
+    return program
+
+
+_program: Optional[ResortRuleProgram] = None
+_program_source: Optional[str] = None
+_program_lock = threading.Lock()
+
+
+def get_resort_program(md_configs: Optional[Dict[str, str]] = None) -> ResortRuleProgram:
+    """現在のRESORT分析MDからコンパイルしたルールプログラム（MDの内容が変わったときだけ再コンパイル）"""
+    global _program, _program_source
+    if md_configs is None:
+        from core.md_loader import get_md_configs
+        md_configs = get_md_configs()
+    source = md_configs.get("resort_v32_analysis", "") or ""
+
+    # MDローダーは再読み込みまで同じ文字列を返すため、同一性の比較だけで済む
+    if _program is None or source is not _program_source:
+        with _program_lock:
+            if _program is None or source != _program_source:
+                _program = compile_resort_rules(source)
+            _program_source = source
+    return _program
+
+
+# 使用例・テスト関数
+def test_resort_rules():
+    """MDとフォールバックの評価結果の一致・検証エラーの報告・評価レイテンシの確認"""
+    import time
+
+    project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    with open(os.path.join(project_root, "systems", "resort_v32_analysis.md"), "r", encoding="utf-8") as f:
+        md_content = f.read()
+
+    program = compile_resort_rules(md_content)
+    fallback = compile_resort_rules("")
+    assert not program.errors and not fallback.errors, program.errors + fallback.errors
+
+    messages = ["彼氏から連絡がこない", "最近ずっと不安で辛い", "どうしたらいいかわからない", "もう無理、疲れた", "今すぐ助けて"]
+    for message in messages:
+        assert program.scores(message, {"a": 0.3}, 2) == fallback.scores(message, {"a": 0.3}, 2), message
+    scores = program.scores("彼氏から連絡がない", {}, 0)
+    assert scores == {"relationship": 7, "emotion": 7, "situation": 5, "objective": 3, "resource": 5, "time": 8}, scores
+    assert program.fortune_menu(scores) == "運命の相手探し" and fallback.fortune_menu(scores) == DEFAULT_FORTUNE_MENU
+
+    broken = compile_resort_rules(
+        "```yaml\nrelationship_keywords:\n  high_intimacy:\n    keywords: 彼氏\n    score: 20\n```\n"
+        "```yaml\nsituation_keywords: [\n```\n"
+        "```yaml\ntiming_calculation:\n  resort_weight: -1\n```"
+    )
+    assert len(broken.errors) == 4, broken.errors
+    assert broken.fortune_timing(scores, {}) == fallback.fortune_timing(scores, {})
+
+    started = time.perf_counter()
+    for _ in range(200):
+        parse_resort_rules(md_content)
+    parse_ms = (time.perf_counter() - started) / 200 * 1000
+
+    started = time.perf_counter()
+    for _ in range(2000):
+        for message in messages:
+            scores = program.scores(message, {"a": 0.3}, 2)
+            program.fortune_timing(scores, {"a": 0.3})
+            program.fortune_menu(scores)
+    evaluate_us = (time.perf_counter() - started) / (2000 * len(messages)) * 1e6
+    print(f"MD解析 {parse_ms:.2f}ms/回, コンパイル済み評価 {evaluate_us:.1f}µs/件")
+    print("=== RESORTルールテスト: OK ===")
+
+
+if __name__ == "__main__":
+    test_resort_rules()
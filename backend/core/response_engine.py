@@ -8,9 +8,13 @@ MDファイル設定に基づく完全外部化システム
 import yaml
 import re
 import random
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple, AsyncIterator
 from dataclasses import dataclass
 import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.prompt_builder import PromptBuilder
 
 @dataclass
 class ResponseCandidate:
@@ -277,46 +281,121 @@ class FlexibleResponseEngine:
                          emotion_analysis: Dict,
                          resort_scores: Dict,
                          rally_count: int,
-                         openai_manager=None) -> Dict:
+                         openai_manager=None,
+                         priority: Optional[int] = None,
+                         deadline=None,
+                         tier=None) -> Dict:
         """最適なレスポンスを取得"""
 
         candidates = self.generate_response_candidates(message, emotion_analysis, resort_scores, rally_count)
 
         if not candidates:
-            return {
-                'response': '申し訳ございません。適切な応答を生成できませんでした。',
-                'pattern': 'fallback',
-                'score': 0.0,
-                'reasoning': 'エラー時フォールバック'
-            }
+            return self._fallback_result()
 
         best_candidate = candidates[0]
 
         # OpenAI APIを使用して自然なレスポンスを生成
         if openai_manager:
             try:
-                # プロンプトテンプレートを読み込み
-                prompt_template = self._load_openai_prompt_template()
-
-                # テンプレートを具体的な値で置換
-                system_prompt = self._build_openai_prompt(
-                    prompt_template,
-                    message,
-                    emotion_analysis,
-                    resort_scores,
-                    best_candidate
-                )
+                system_prompt = self._build_generation_prompt(message, emotion_analysis, resort_scores, best_candidate)
 
                 # OpenAI APIで自然な応答を生成
-                full_response = await openai_manager.generate_chat_response(system_prompt, message)
+                full_response = await openai_manager.generate_chat_response(
+                    system_prompt, message, **self._generation_options(priority, deadline, tier)
+                )
 
             except Exception as e:
                 print(f"OpenAI生成エラー: {e}")
                 # フォールバック：パターン結合
-                full_response = f"{best_candidate.first_sentence} {best_candidate.second_sentence} {best_candidate.third_sentence}"
+                full_response = self._join_candidate(best_candidate)
         else:
             # OpenAI未使用時：パターン結合
-            full_response = f"{best_candidate.first_sentence} {best_candidate.second_sentence} {best_candidate.third_sentence}"
+            full_response = self._join_candidate(best_candidate)
+
+        return self._build_result(full_response, best_candidate, candidates)
+
+    async def stream_best_response(self,
+                         message: str,
+                         emotion_analysis: Dict,
+                         resort_scores: Dict,
+                         rally_count: int,
+                         openai_manager=None,
+                         priority: Optional[int] = None,
+                         deadline=None,
+                         tier=None) -> AsyncIterator[Dict]:
+        """最適なレスポンスをトークン単位で生成（{'token': ...} を順に返し、最後に {'result': ...}）"""
+
+        candidates = self.generate_response_candidates(message, emotion_analysis, resort_scores, rally_count)
+
+        if not candidates:
+            result = self._fallback_result()
+            yield {'token': result['response']}
+            yield {'result': result}
+            return
+
+        best_candidate = candidates[0]
+        chunks = []
+
+        if openai_manager:
+            try:
+                system_prompt = self._build_generation_prompt(message, emotion_analysis, resort_scores, best_candidate)
+
+                async for token in openai_manager.stream_chat_response(
+                    system_prompt, message, **self._generation_options(priority, deadline, tier)
+                ):
+                    chunks.append(token)
+                    yield {'token': token}
+
+            except Exception as e:
+                print(f"OpenAIストリーミング生成エラー: {e}")
+
+        if not chunks:
+            # フォールバック：パターン結合
+            full_response = self._join_candidate(best_candidate)
+            yield {'token': full_response}
+        else:
+            full_response = "".join(chunks).strip()
+
+        yield {'result': self._build_result(full_response, best_candidate, candidates)}
+
+    def _generation_options(self, priority: Optional[int], deadline=None, tier=None) -> Dict:
+        """生成呼び出しに引き渡すオプション（未指定は省略）"""
+        options = {}
+        if priority is not None:
+            options['priority'] = priority
+        if deadline is not None:
+            options['deadline'] = deadline
+        if tier is not None:
+            options['model'] = tier.model
+            options['max_tokens'] = tier.max_tokens
+        return options
+
+    def _fallback_result(self) -> Dict:
+        """候補が生成できなかった場合の結果"""
+        return {
+            'response': '申し訳ございません。適切な応答を生成できませんでした。',
+            'pattern': 'fallback',
+            'score': 0.0,
+            'reasoning': 'エラー時フォールバック'
+        }
+
+    def _join_candidate(self, candidate: ResponseCandidate) -> str:
+        """候補の3文を結合"""
+        return f"{candidate.first_sentence} {candidate.second_sentence} {candidate.third_sentence}"
+
+    def _build_generation_prompt(self, message: str, emotion_analysis: Dict, resort_scores: Dict, candidate: ResponseCandidate) -> str:
+        """テンプレートを読み込み、生成用システムプロンプトを構築"""
+        prompt_template = self._load_openai_prompt_template()
+        return self._build_openai_prompt(
+            prompt_template,
+            message,
+            emotion_analysis,
+            resort_scores,
+            candidate
+        )
+
+    def _build_result(self, full_response: str, best_candidate: ResponseCandidate, candidates: List[ResponseCandidate]) -> Dict:
+        """生成結果をレスポンス辞書にまとめる"""
 
         # 第3文パターンをわかりやすいカテゴリ名に変換
         third_pattern = best_candidate.pattern_combination.split('→')[-1]  # 最後の要素
@@ -329,7 +408,7 @@ class FlexibleResponseEngine:
             'reasoning': best_candidate.reasoning,
             'candidates': [
                 {
-                    'response': f"{c.first_sentence} {c.second_sentence} {c.third_sentence}",
+                    'response': self._join_candidate(c),
                     'pattern': self._get_category_display_name(c.pattern_combination.split('→')[-1]),
                     'score': c.match_score,
                     'reasoning': c.reasoning
@@ -349,7 +428,7 @@ class FlexibleResponseEngine:
             content = f.read()
 
         # base_system_prompt を抽出
-        yaml_blocks = re.findall(r'```yaml\\n(.*?)\\n```', content, re.DOTALL)
+        yaml_blocks = re.findall(r'```yaml\n(.*?)\n```', content, re.DOTALL)
         for block in yaml_blocks:
             try:
                 data = yaml.safe_load(block)
@@ -362,20 +441,32 @@ class FlexibleResponseEngine:
         return "あなたは世界最高の恋愛カウンセラーです。以下の指示に従って、3センテンス以内で温かく共感的な返答をしてください。"
 
     def _build_openai_prompt(self, template: str, message: str, emotion_analysis: Dict, resort_scores: Dict, candidate) -> str:
-        """OpenAIプロンプトを構築"""
-
-        # テンプレート変数を置換
-        prompt = template.replace("{{primary_emotion}}", emotion_analysis.get('primary_emotion', 'ニュートラル'))
-        prompt = prompt.replace("{{emotion_intensity}}", str(emotion_analysis.get('emotion_intensity', 0)))
-        prompt = prompt.replace("{{deep_emotion}}", emotion_analysis.get('emotion_layers', {}).get('deep', '不明'))
-        prompt = prompt.replace("{{pattern_combination}}", candidate.pattern_combination)
-        prompt = prompt.replace("{{reasoning}}", candidate.reasoning)
-        prompt = prompt.replace("{{first_sentence}}", candidate.first_sentence)
-        prompt = prompt.replace("{{second_sentence}}", candidate.second_sentence)
-        prompt = prompt.replace("{{third_sentence}}", candidate.third_sentence)
-        prompt = prompt.replace("{{user_message}}", message)
-
-        return prompt
+        """OpenAIプロンプトを構築（変数を含まない段落を先頭、変数を含む段落を末尾に配置）"""
+
+        variables = {
+            "{{primary_emotion}}": emotion_analysis.get('primary_emotion', 'ニュートラル'),
+            "{{emotion_intensity}}": str(emotion_analysis.get('emotion_intensity', 0)),
+            "{{deep_emotion}}": emotion_analysis.get('emotion_layers', {}).get('deep', '不明'),
+            "{{pattern_combination}}": candidate.pattern_combination,
+            "{{reasoning}}": candidate.reasoning,
+            "{{first_sentence}}": candidate.first_sentence,
+            "{{second_sentence}}": candidate.second_sentence,
+            "{{third_sentence}}": candidate.third_sentence,
+            "{{user_message}}": message
+        }
+
+        builder = PromptBuilder("response_engine")
+        for paragraph in re.split(r'\n\s*\n', template):
+            if "{{" not in paragraph:
+                builder.static(paragraph)
+                continue
+
+            # テンプレート変数を置換
+            for placeholder, value in variables.items():
+                paragraph = paragraph.replace(placeholder, value)
+            builder.dynamic(paragraph)
+
+        return builder.render()
 
     def _get_category_display_name(self, pattern_name: str) -> str:
         """パターン名を表示用カテゴリ名に変換"""
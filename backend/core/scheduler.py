@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+上流モデル呼び出しスケジューラ
+プロバイダ別の同時実行上限・トークンバケット流量制限・優先度レーンを一元管理
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from typing import AsyncIterator, Dict, List, Tuple
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.config import AppConfig
+from core.metrics import metrics
+
+
+class Priority(IntEnum):
+    """優先度レーン（小さいほど優先）"""
+    CRISIS = 0    # detect_crisis_level >= 4
+    CHAT = 1      # /api/chat
+    FORTUNE = 2   # 占い
+    GREETING = 3  # 挨拶生成
+
+
+class TokenBucket:
+    """トークンバケット流量制限（不足時の待機者は優先度順に払い出し）"""
+
+    def __init__(self, rate_per_second: float, burst: int):
+        self.rate = rate_per_second
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._timer = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _dispatch(self):
+        """補充済みのトークンを優先度順に払い出し、残りの待機者には次の補充時刻を予約"""
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        self._refill()
+        while self._waiters:
+            _, _, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+            elif self._tokens >= 1:
+                heapq.heappop(self._waiters)
+                self._tokens -= 1
+                future.set_result(True)
+            else:
+                break
+        if self._waiters:
+            self._timer = asyncio.get_running_loop().call_later((1 - self._tokens) / self.rate, self._dispatch)
+
+    async def acquire(self, priority: Priority = Priority.CHAT):
+        """トークンを1つ取得（不足時は補充まで優先度順に待機）"""
+        if self.rate <= 0:
+            return
+        self._refill()
+        if not self._waiters and self._tokens >= 1:
+            self._tokens -= 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (int(priority), next(self._sequence), future))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 払い出し直後にキャンセルされた場合はトークンを返却
+                self.refund()
+            else:
+                future.cancel()
+            raise
+
+    def refund(self):
+        """取得済みのトークンを1つ返却（使わずに取り消した呼び出し用）"""
+        if self.rate <= 0:
+            return
+        self._refill()
+        self._tokens = min(self.capacity, self._tokens + 1)
+        self._dispatch()
+
+
+class ProviderLane:
+    """プロバイダ単位の同時実行スロットと優先度付き待ち行列"""
+
+    def __init__(self, name: str, max_concurrency: int, rate_per_second: float, burst: int):
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self.bucket = TokenBucket(rate_per_second, burst)
+        self._active = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._queued = {priority: 0 for priority in Priority}
+        self._sequence = itertools.count()
+
+    async def acquire(self, priority: Priority):
+        """流量トークン、続いてスロットを取得（いずれも不足時は優先度順に待機）"""
+        # バケットの待機も優先度順のため、流量制限下でも危機対応が先に通る
+        await self.bucket.acquire(priority)
+
+        if self._active < self.max_concurrency and not self._waiters:
+            self._active += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (int(priority), next(self._sequence), future))
+            self._queued[priority] += 1
+            try:
+                await future
+            except asyncio.CancelledError:
+                self._queued[priority] -= 1
+                if future.done() and not future.cancelled():
+                    # 付与直後にキャンセルされた場合はスロットを返却
+                    self.release()
+                else:
+                    future.cancel()
+                # 上流へ送らないため、取得済みの流量トークンも返却
+                self.bucket.refund()
+                raise
+            self._queued[priority] -= 1
+
+    def release(self):
+        """スロットを返却し、最優先の待機者へ引き渡す"""
+        self._active -= 1
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self._active += 1
+                future.set_result(True)
+                break
+
+    def stats(self) -> Dict:
+        """レーン状態"""
+        return {
+            "active": self._active,
+            "max_concurrency": self.max_concurrency,
+            "queue_depth": sum(self._queued.values()),
+            "queue_depth_by_priority": {priority.name.lower(): count for priority, count in self._queued.items()}
+        }
+
+
+class UpstreamScheduler:
+    """全上流呼び出しの中央スケジューラ（シングルトン）"""
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._lanes = {}
+        return cls._instance
+
+    def _lane(self, provider: str) -> ProviderLane:
+        lane = self._lanes.get(provider)
+        if lane is None:
+            limits = AppConfig.UPSTREAM_LIMITS.get(provider, AppConfig.UPSTREAM_LIMITS["default"])
+            lane = self._lanes[provider] = ProviderLane(
+                provider,
+                limits["max_concurrency"],
+                limits["rate_per_second"],
+                limits["burst"]
+            )
+        return lane
+
+    @asynccontextmanager
+    async def slot(self, provider: str, priority: Priority = Priority.CHAT) -> AsyncIterator[None]:
+        """上流呼び出し1回分のスロットを確保"""
+        lane = self._lane(provider)
+        queued_at = time.perf_counter()
+        await lane.acquire(priority)
+        waited = time.perf_counter() - queued_at
+        metrics.record(f"scheduler.{provider}.wait", waited)
+        metrics.record(f"scheduler.{provider}.wait.{Priority(priority).name.lower()}", waited)
+        try:
+            yield
+        finally:
+            lane.release()
+
+    def stats(self) -> Dict[str, Dict]:
+        """プロバイダ別のレーン状態と待ち時間"""
+        result = {}
+        for provider, lane in self._lanes.items():
+            wait = metrics.latency(f"scheduler.{provider}.wait")
+            result[provider] = {**lane.stats(), "wait": wait.snapshot() if wait else {"count": 0}}
+        return result
+
+
+# シングルトンインスタンス
+scheduler = UpstreamScheduler()
+
+def get_scheduler() -> UpstreamScheduler:
+    """スケジューラ取得"""
+    return scheduler
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ストリーミング文数制限
+日本語の文末（。！？とそれに続く閉じ括弧）を検出し、上限文数に達した時点で生成を打ち切る
+"""
+
+from typing import Dict
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.token_budget import estimate_tokens
+
+# 文末記号（連続する場合は1つの文末として扱う: 「？！」「。。」など）
+SENTENCE_TERMINATORS = set("。！？!?")
+# 文末記号の直後に付く閉じ括弧・引用符
+CLOSING_MARKS = set("」』）)】〕〉》\"'”’")
+# 括弧内の文末記号（「ありがとう。」と言った 等）は文の区切りにしない
+OPENING_MARKS = set("「『（(【〔〈《")
+
+
+class SentenceLimiter:
+    """トークン列を受け取り、上限文数までのテキストだけを通す"""
+
+    def __init__(self, max_sentences: int):
+        self.max_sentences = max_sentences
+        self.sentences = 0
+        self.done = False
+        self._in_terminator = False
+        self._depth = 0
+        self._emitted = []
+        self._received = []
+
+    def feed(self, token: str) -> str:
+        """トークンを1つ処理し、出力してよい部分を返す（上限到達後は空文字）"""
+        if self.done:
+            self._received.append(token)
+            return ""
+
+        self._received.append(token)
+        kept = []
+        for char in token:
+            if self._in_terminator:
+                if char in SENTENCE_TERMINATORS or char in CLOSING_MARKS:
+                    kept.append(char)
+                    self._depth = max(0, self._depth - (char in CLOSING_MARKS))
+                    continue
+                # 文末記号・閉じ括弧の後に通常の文字が来た時点で1文確定
+                self._in_terminator = False
+                self.sentences += 1
+                if self.sentences >= self.max_sentences:
+                    self.done = True
+                    break
+            kept.append(char)
+            if char in OPENING_MARKS:
+                self._depth += 1
+            elif char in CLOSING_MARKS:
+                self._depth = max(0, self._depth - 1)
+            elif char in SENTENCE_TERMINATORS and self._depth == 0:
+                self._in_terminator = True
+
+        text = "".join(kept)
+        self._emitted.append(text)
+        return text
+
+    def finish(self):
+        """ストリーム終端で末尾の文を確定"""
+        if self._in_terminator:
+            self._in_terminator = False
+            self.sentences += 1
+
+    @property
+    def text(self) -> str:
+        """出力済みテキスト"""
+        return "".join(self._emitted).strip()
+
+    def report(self, max_tokens: int) -> Dict[str, int]:
+        """打ち切りで節約したトークン数（推定）
+
+        tokens_trimmed: 受信済みで破棄した分
+        tokens_saved: max_tokensまで生成された場合との差（上限見積もり）
+        """
+        emitted_tokens = estimate_tokens("".join(self._emitted))
+        received_tokens = estimate_tokens("".join(self._received))
+        return {
+            "sentences": self.sentences,
+            "truncated": int(self.done),
+            "tokens_trimmed": max(0, received_tokens - emitted_tokens),
+            "tokens_saved": max(0, max_tokens - received_tokens) if self.done else 0
+        }
+
+
+def limit_sentences(text: str, max_sentences: int) -> str:
+    """確定済みテキストを上限文数で切り詰める"""
+    limiter = SentenceLimiter(max_sentences)
+    limiter.feed(text)
+    return limiter.text
+
+
+# 使用例・テスト関数
+def test_sentence_limiter():
+    """文末判定と打ち切り位置の確認"""
+    cases = [
+        ("今日は晴れ。明日は雨。明後日は雪。その次は嵐。", "今日は晴れ。明日は雨。明後日は雪。"),
+        ("「本当に？」と聞かれました。はい！そうですね！！次の文です。", "「本当に？」と聞かれました。はい！そうですね！！"),
+        ("彼は「ありがとう。」と言った。嬉しかった。また会いたい。さようなら。", "彼は「ありがとう。」と言った。嬉しかった。また会いたい。"),
+        ("一文だけ", "一文だけ"),
+    ]
+    for text, expected in cases:
+        assert limit_sentences(text, 3) == expected, (text, limit_sentences(text, 3))
+
+    # トークン境界をまたぐ文末・閉じ括弧
+    limiter = SentenceLimiter(2)
+    emitted = "".join(limiter.feed(token) for token in ["「そう", "ですね", "？", "」と", "言った。", "次", "の文。」", "破棄"])
+    assert emitted == "「そうですね？」と言った。次の文。」", emitted
+    assert limiter.done and limiter.feed("される") == ""
+    print(limiter.report(300))
+    print("=== 文数制限テスト: OK ===")
+
+
+if __name__ == "__main__":
+    test_sentence_limiter()
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+シングルフライト（同時リクエスト集約）
+同じフィンガープリントの同時呼び出しを1回の上流呼び出しにまとめ、結果を全員に返す
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+
+class SingleFlight:
+    """同一キーの実行中呼び出しを共有するクラス"""
+
+    def __init__(self, name: str = ""):
+        self.name = name
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._stats = {"upstream_calls": 0, "coalesced": 0}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """keyが実行中なら相乗りし、なければfnを実行する"""
+        task = self._inflight.get(key)
+
+        if task is None:
+            # 呼び出し元のキャンセルが他の待機者に波及しないよう独立タスクで実行
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, k=key: self._finish(k, t))
+            self._stats["upstream_calls"] += 1
+        else:
+            self._stats["coalesced"] += 1
+
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task: asyncio.Task):
+        """完了したタスクを登録解除（未取得の例外警告を抑止）"""
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, int]:
+        """集約統計"""
+        return {**self._stats, "in_flight": len(self._inflight)}
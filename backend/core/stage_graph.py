@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ステージグラフ
+依存関係のない処理（ローカル分析・設定読み込み・セッション検索）を上流呼び出しと並行実行し、
+ステージごとの所要時間を記録する
+"""
+
+import asyncio
+import time
+from typing import Any, Callable, Dict, Tuple
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.metrics import metrics
+
+
+class StageGraph:
+    """依存関係つきステージの並行実行（依存先の結果を位置引数で受け取る）"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.perf_counter()
+        self.durations: Dict[str, float] = {}
+        self._stages: Dict[str, Tuple[Callable, Tuple[str, ...], bool]] = {}
+
+    def add(self, name: str, fn: Callable, *deps: str, offload: bool = True) -> "StageGraph":
+        """ステージを追加（同期関数は offload=True でスレッド実行、async関数はそのままawait）"""
+        for dep in deps:
+            if dep not in self._stages:
+                raise ValueError(f"未定義の依存ステージ: {name} → {dep}")
+        self._stages[name] = (fn, deps, offload)
+        return self
+
+    async def _run_stage(self, name: str, tasks: Dict[str, asyncio.Task]) -> Any:
+        fn, deps, offload = self._stages[name]
+        args = [await tasks[dep] for dep in deps]
+
+        started = time.perf_counter()
+        try:
+            if asyncio.iscoroutinefunction(fn):
+                return await fn(*args)
+            if offload:
+                return await asyncio.to_thread(fn, *args)
+            return fn(*args)
+        finally:
+            self.record(name, started)
+
+    async def run(self) -> Dict[str, Any]:
+        """全ステージを実行して結果を返す（1つでも失敗すれば残りを取り消して例外を送出）"""
+        started = time.perf_counter()
+        tasks: Dict[str, asyncio.Task] = {}
+        # 追加順＝依存順なので、依存先のタスクは必ず先に作られている
+        for name in self._stages:
+            tasks[name] = asyncio.ensure_future(self._run_stage(name, tasks))
+
+        try:
+            await asyncio.gather(*tasks.values())
+        finally:
+            for task in tasks.values():
+                task.cancel()
+            self.record("critical_path", started)
+
+        return {name: task.result() for name, task in tasks.items()}
+
+    def record(self, name: str, started: float):
+        """ステージの所要時間を記録（グラフ外の生成・保存段もここに記録）"""
+        elapsed = time.perf_counter() - started
+        self.durations[name] = elapsed
+        metrics.record(f"stage.{self.name}.{name}", elapsed)
+
+
+# 使用例・テスト関数
+def test_stage_graph():
+    """独立ステージの並行実行と依存順の確認"""
+
+    async def slow_remote():
+        await asyncio.sleep(0.2)
+        return "remote"
+
+    def local_analysis():
+        time.sleep(0.2)
+        return 3
+
+    graph = (
+        StageGraph("test")
+        .add("remote", slow_remote)
+        .add("local", local_analysis)
+        .add("combined", lambda remote, local: f"{remote}:{local}", "remote", "local", offload=False)
+    )
+    results = asyncio.run(graph.run())
+
+    assert results["combined"] == "remote:3", results
+    # 直列なら0.4秒、並行なら約0.2秒
+    assert graph.durations["critical_path"] < 0.35, graph.durations
+    print({name: round(seconds * 1000, 1) for name, seconds in graph.durations.items()})
+    print("=== ステージグラフテスト: OK ===")
+
+
+if __name__ == "__main__":
+    test_stage_graph()
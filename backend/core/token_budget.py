@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+オフライントークン計数とプロンプト予算管理
+ネットワーク不要の推定でトークン数を数え、呼び出しごとの入力予算に収まるよう
+優先度の低いMDセクションから要約・削除する
+"""
+
+import math
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Tuple
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.config import AppConfig
+from core.metrics import metrics
+
+# 日本語（かな・漢字・全角記号）は1文字≒1トークン、英数字は4文字≒1トークン
+_CJK_PATTERN = re.compile(r"[\u3000-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]")
+_ASCII_WORD_PATTERN = re.compile(r"[A-Za-z0-9_]+")
+_SECTION_HEADING = re.compile(r"^## ", re.MULTILINE)
+
+# メッセージ1件あたりの付帯トークン（role等）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """テキストのトークン数を推定（ネットワーク不要）"""
+    if not text:
+        return 0
+
+    cjk = len(_CJK_PATTERN.findall(text))
+    ascii_words = _ASCII_WORD_PATTERN.findall(text)
+    ascii_tokens = sum(math.ceil(len(word) / 4) for word in ascii_words)
+    ascii_chars = sum(len(word) for word in ascii_words)
+
+    # 残り（空白・記号・改行・その他の文字）は2文字≒1トークン
+    others = len(text) - cjk - ascii_chars - text.count(" ")
+    return cjk + ascii_tokens + math.ceil(max(0, others) / 2)
+
+
+def estimate_message_tokens(messages: List[Dict[str, str]]) -> int:
+    """チャットメッセージ列の入力トークン数を推定"""
+    return sum(estimate_tokens(m.get("content", "")) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+
+@dataclass
+class MDSection:
+    """MDファイルの見出し（##）単位のセクション"""
+    source: str
+    index: int
+    title: str
+    text: str
+    priority: int
+    tokens: int
+
+
+def section_priority(title: str) -> int:
+    """見出しキーワードからセクション優先度を決定（大きいほど残す）"""
+    matches = [p for keyword, p in AppConfig.PROMPT_SECTION_PRIORITIES.items() if keyword in title]
+    return max(matches) if matches else AppConfig.PROMPT_SECTION_DEFAULT_PRIORITY
+
+
+@lru_cache(maxsize=64)
+def _split_cached(source: str, md: str) -> Tuple[MDSection, ...]:
+    starts = [m.start() for m in _SECTION_HEADING.finditer(md)]
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    bounds = starts + [len(md)]
+
+    sections = []
+    for index, (start, end) in enumerate(zip(bounds, bounds[1:])):
+        text = md[start:end]
+        if not text.strip():
+            continue
+        first_line = text.strip().splitlines()[0]
+        title = first_line.lstrip("#").strip()
+        sections.append(MDSection(source, index, title, text, section_priority(title), estimate_tokens(text)))
+    return tuple(sections)
+
+
+def split_sections(source: str, md: str) -> List[MDSection]:
+    """MDを##見出し単位に分割（同一内容は解析結果を再利用）"""
+    return list(_split_cached(source, md))
+
+
+def summarize_section(section: MDSection) -> str:
+    """セクションを見出しと小見出しのみに要約"""
+    lines = section.text.strip().splitlines()
+    kept = [lines[0]] + [line for line in lines[1:] if line.startswith("###")]
+    return "\n".join(kept) + "\n\n"
+
+
+class PromptBudget:
+    """呼び出し単位の入力トークン予算"""
+
+    def __init__(self, name: str, budget_tokens: int):
+        self.name = name
+        self.budget_tokens = budget_tokens
+
+    def fit(self, fixed_text: str, md_blocks: Dict[str, str]) -> Tuple[Dict[str, str], Dict]:
+        """固定部分＋MDブロックが予算に収まるよう低優先度セクションから要約・削除
+
+        戻り値は (ブロック名→調整後MD, レポート)。
+        """
+        fixed_tokens = estimate_tokens(fixed_text)
+        sections = [s for source, md in md_blocks.items() for s in split_sections(source, md or "")]
+        contents = {(s.source, s.index): s.text for s in sections}
+        tokens = {(s.source, s.index): s.tokens for s in sections}
+
+        tokens_before = fixed_tokens + sum(tokens.values())
+        total = tokens_before
+        summarized, dropped = [], []
+
+        # 優先度の低い順、同優先度は後ろのセクションから（要約 → 削除の2段階）
+        order = sorted(sections, key=lambda s: (s.priority, -s.index))
+        for stage in ("summarize", "drop"):
+            for section in order:
+                if total <= self.budget_tokens:
+                    break
+                key = (section.source, section.index)
+                # 先頭（ファイルタイトル・概要）は常に残す
+                if section.index == 0 or not contents[key]:
+                    continue
+                replacement = summarize_section(section) if stage == "summarize" else ""
+                new_tokens = estimate_tokens(replacement)
+                if new_tokens >= tokens[key]:
+                    continue
+                total -= tokens[key] - new_tokens
+                contents[key], tokens[key] = replacement, new_tokens
+                (summarized if stage == "summarize" else dropped).append(f"{section.source}:{section.title}")
+
+        fitted = {
+            source: "".join(contents[(s.source, s.index)] for s in sections if s.source == source)
+            for source in md_blocks
+        }
+        metrics.incr(f"prompt_budget.{self.name}.tokens_trimmed", tokens_before - total)
+        report = {
+            "budget": self.budget_tokens,
+            "tokens_before": tokens_before,
+            "tokens_after": total,
+            "summarized": summarized,
+            "dropped": dropped,
+            "over_budget": total > self.budget_tokens
+        }
+        return fitted, report
+
+
+def get_prompt_budget(name: str) -> PromptBudget:
+    """設定から呼び出し種別の予算を取得"""
+    return PromptBudget(name, AppConfig.PROMPT_TOKEN_BUDGETS.get(name, AppConfig.PROMPT_TOKEN_BUDGETS["default"]))
@@ -7,6 +7,7 @@ Port 8011での単一サーバー統合実装
 すべてのマイクロサービスを統合し、MDファイル直接参照システムを維持
 """
 
+import asyncio
 import os
 import uvicorn
 from fastapi import FastAPI
@@ -18,7 +19,7 @@ from fastapi.responses import FileResponse
 from shared.config import AppConfig
 
 # サービスモジュールのインポート
-from services.chat_service import chat_router
+from services.chat_service import chat_router, chat_ws_router, emotion_flight, emotion_batcher
 from services.fortune_service import fortune_router
 from services.analysis_service import analysis_router
 from services.chat_history_service import chat_history_router
@@ -26,7 +27,16 @@ from services.greeting_service import greeting_router
 
 # コアモジュールの初期化
 from core.md_loader import md_loader
+from core.message_features import keyword_registry
+from core.resort_rules import get_resort_program
 from core.openai_client import openai_manager
+from core.scheduler import scheduler
+from core.metrics import metrics
+from core.circuit_breaker import breakers
+from core.prompt_builder import prefix_registry
+from core.cassette import cassette
+from core.emotion_cache import emotion_cache, emotion_md_version
+from services.chat_history_service import chat_history_manager
 
 # FastAPI アプリケーション初期化
 app = FastAPI(
@@ -59,6 +69,11 @@ app.include_router(
     tags=["Chat Service"]
 )
 
+app.include_router(
+    chat_ws_router,
+    tags=["Chat Service"]
+)
+
 app.include_router(
     fortune_router,
     prefix=AppConfig.API_PREFIX,
@@ -121,6 +136,21 @@ async def system_status():
                 "last_loaded": md_loader._last_loaded.isoformat() if md_loader._last_loaded else None
             },
             "openai_status": "configured" if AppConfig.OPENAI_API_KEY else "not_configured",
+            "completion_cache": openai_manager.cache.stats() if openai_manager.cache else {"enabled": False},
+            "single_flight": {
+                "openai": openai_manager.single_flight.stats(),
+                "emotion": emotion_flight.stats()
+            },
+            "emotion_cache": emotion_cache.stats(),
+            "emotion_batch": {"enabled": AppConfig.EMOTION_BATCH_ENABLED, **emotion_batcher.stats()},
+            "keyword_automaton": keyword_registry.stats(),
+            "resort_rules": get_resort_program(md_configs).stats(),
+            "scheduler": scheduler.stats(),
+            "circuit_breakers": breakers.stats(),
+            "routing": openai_manager.router.stats(),
+            "prompt_prefixes": prefix_registry.stats(),
+            "cassette": cassette.stats(),
+            "metrics": metrics.snapshot(),
             "cors_origins": AppConfig.CORS_ORIGINS,
             "configuration": {
                 "max_tokens": AppConfig.MAX_TOKENS,
@@ -155,6 +185,22 @@ async def reload_configuration():
             "message": f"設定再読み込みエラー: {str(e)}"
         }
 
+@app.on_event("startup")
+async def warm_emotion_cache():
+    """過去の会話履歴から感情分析キャッシュを事前投入"""
+    try:
+        version = emotion_md_version(md_loader.load_system_configs())
+        warmed = await asyncio.to_thread(emotion_cache.warm, chat_history_manager.logs_dir, version)
+        if warmed:
+            print(f"✅ 感情分析キャッシュ事前投入: {warmed}件")
+    except Exception as e:
+        print(f"❌ 感情分析キャッシュ事前投入エラー: {e}")
+
+@app.on_event("shutdown")
+async def shutdown_clients():
+    """共有HTTP接続プールを解放"""
+    await openai_manager.aclose()
+
 # アプリケーション起動時の初期化処理
 def initialize_application():
     """アプリケーション初期化"""
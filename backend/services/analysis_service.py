@@ -6,14 +6,18 @@ RESORT-TI分析とデータ分析の専用サービスモジュール
 """
 
 from fastapi import APIRouter, HTTPException, Depends
-from typing import Dict, Any, List
-from pydantic import BaseModel
+from typing import Dict, Any, List, Optional, Tuple
+from pydantic import BaseModel, Field
+import numpy as np
+import threading
 
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from core.md_loader import get_md_configs
+from core.message_features import keyword_registry, message_features, normalize_text
+from core.resort_rules import get_resort_program
 from shared.config import AppConfig
 
 # 分析用のルーター
@@ -37,6 +41,18 @@ class NeedsAnalysisResponse(BaseModel):
     need_strength: float
     recommendations: List[str]
 
+class BatchAnalysisRequest(BaseModel):
+    messages: List[str]
+    user_data: Dict[str, Any] = Field(default_factory=dict)
+    rally_count: int = 0
+
+class BatchAnalysisResponse(BaseModel):
+    dimensions: List[str]
+    resort_scores: List[List[int]]
+    need_types: List[str]
+    needs: List[List[float]]
+    fortune_timing: List[int]
+
 class ComprehensiveAnalysisResponse(BaseModel):
     resort_analysis: ResortAnalysisResponse
     needs_analysis: NeedsAnalysisResponse
@@ -45,6 +61,19 @@ class ComprehensiveAnalysisResponse(BaseModel):
 
 # RESORT-TI分析システム
 class ResortAnalysisSystem:
+    # 次元別の特別なロジック（v3.2仕様）で使う語彙
+    SPECIAL_KEYWORDS = {
+        "relationship.high": ["彼氏", "彼女", "恋人"],
+        "relationship.medium": ["友人", "職場", "家族"],
+        "emotion.indicators": ["不安", "心配", "寂しい", "辛い", "悲しい", "怒り"],
+        "situation.urgency": ["緊急", "今すぐ", "どうしよう", "大変"],
+        "objective.clear": ["どうしたら", "方法", "解決"],
+        "resource.positive": ["頑張る", "できる", "強い", "大丈夫"],
+        "resource.negative": ["疲れた", "無理", "限界", "もうダメ"],
+        "time.words": ["最近", "今", "以前から", "長い間", "いつも"],
+        "contact": ["連絡", "ない"]
+    }
+
     def __init__(self, md_configs: Dict[str, str]):
         self.md_configs = md_configs
         self._load_analysis_configs()
@@ -93,6 +122,14 @@ class ResortAnalysisSystem:
             }
         }
 
+        # キーワードグループ（次元別の特別なロジックで使う語彙も含めて共有オートマトンに登録）
+        self.groups = {
+            dimension: keyword_registry.define(f"analysis.resort.{dimension}", config["keywords"])
+            for dimension, config in self.resort_dimensions.items()
+        }
+        for name, keywords in self.SPECIAL_KEYWORDS.items():
+            self.groups[name] = keyword_registry.define(f"analysis.resort.{name}", keywords)
+
     def analyze_resort_scores(
         self,
         messages: List[str],
@@ -102,17 +139,15 @@ class ResortAnalysisSystem:
         """RESORT 6次元スコア分析（v3.2仕様）"""
 
         scores = {}
-        combined_text = " ".join(messages).lower()
+        groups = self.groups
+        features = message_features(" ".join(messages))
 
         # 「彼氏から連絡がこない」の例に基づく詳細分析
         for dimension, config in self.resort_dimensions.items():
             base_score = 0
 
             # キーワードマッチングによる基本スコア
-            keyword_matches = 0
-            for keyword in config["keywords"]:
-                if keyword in combined_text:
-                    keyword_matches += 1
+            keyword_matches = features.count(groups[dimension])
 
             # キーワード密度による加重
             if keyword_matches > 0:
@@ -120,38 +155,33 @@ class ResortAnalysisSystem:
 
             # 次元別の特別なロジック（v3.2仕様準拠）
             if dimension == "relationship":
-                if any(word in combined_text for word in ["彼氏", "彼女", "恋人"]):
+                if features.any(groups["relationship.high"]):
                     base_score = 7  # 彼氏との関係があることが前提
-                elif any(word in combined_text for word in ["友人", "職場", "家族"]):
+                elif features.any(groups["relationship.medium"]):
                     base_score = 5
 
             elif dimension == "emotion":
-                emotion_indicators = ["不安", "心配", "寂しい", "辛い", "悲しい", "怒り"]
-                emotion_count = sum(1 for word in emotion_indicators if word in combined_text)
+                emotion_count = features.count(groups["emotion.indicators"])
                 if emotion_count > 0:
                     base_score = min(8, 5 + emotion_count)  # 不安・心配・寂しさが混在
-                elif "連絡" in combined_text and "ない" in combined_text:
+                elif features.all(groups["contact"]):
                     base_score = 7  # 連絡がないという状況による感情
 
             elif dimension == "situation":
-                urgency_words = ["緊急", "今すぐ", "どうしよう", "大変"]
-                if any(word in combined_text for word in urgency_words):
+                if features.any(groups["situation.urgency"]):
                     base_score = 8
-                elif "連絡" in combined_text and "ない" in combined_text:
+                elif features.all(groups["contact"]):
                     base_score = 5  # 連絡がないという状況、緊急性は中程度
 
             elif dimension == "objective":
-                if any(word in combined_text for word in ["どうしたら", "方法", "解決"]):
+                if features.any(groups["objective.clear"]):
                     base_score = 6
                 else:
                     base_score = 3  # 何を求めているか不明確
 
             elif dimension == "resource":
-                positive_words = ["頑張る", "できる", "強い", "大丈夫"]
-                negative_words = ["疲れた", "無理", "限界", "もうダメ"]
-
-                positive_count = sum(1 for word in positive_words if word in combined_text)
-                negative_count = sum(1 for word in negative_words if word in combined_text)
+                positive_count = features.count(groups["resource.positive"])
+                negative_count = features.count(groups["resource.negative"])
 
                 if negative_count > positive_count:
                     base_score = 3
@@ -159,10 +189,9 @@ class ResortAnalysisSystem:
                     base_score = 5  # 現在の心理的余裕は中程度
 
             elif dimension == "time":
-                time_words = ["最近", "今", "以前から", "長い間", "いつも"]
-                if any(word in combined_text for word in time_words):
+                if features.any(groups["time.words"]):
                     base_score = 8  # 継続的な状況
-                elif "連絡" in combined_text:
+                elif features.has("連絡"):
                     base_score = 8  # 「連絡がこない」という継続的な状況
 
             # ユーザーデータからの補正
@@ -294,6 +323,11 @@ class DetailedNeedsAnalyzer:
             }
         }
 
+        self.groups = {
+            need_type: keyword_registry.define(f"analysis.needs.{need_type}", config["keywords"])
+            for need_type, config in self.needs_categories.items()
+        }
+
     def analyze_detailed_needs(
         self,
         messages: List[str],
@@ -302,15 +336,11 @@ class DetailedNeedsAnalyzer:
         """詳細ニーズ分析"""
 
         scores = {}
-        combined_text = " ".join(messages).lower()
+        features = message_features(" ".join(messages))
 
         for need_type, config in self.needs_categories.items():
-            score = 0.0
-
             # キーワードマッチング
-            for keyword in config["keywords"]:
-                if keyword in combined_text:
-                    score += 0.3 * config["weight"]
+            score = features.count(self.groups[need_type]) * 0.3 * config["weight"]
 
             # コンテキスト分析
             if need_type.replace("_", " ") in str(context).lower():
@@ -340,6 +370,144 @@ class DetailedNeedsAnalyzer:
 
         return recommendations[:3]  # トップ3のみ
 
+# バッチスコアリング（メッセージ×キーワードの一致行列による一括計算）
+class BatchScoringSystem:
+    """N件のメッセージをそれぞれ RESORT 6次元・詳細ニーズ5種・占いタイミングへ一括スコアリング
+
+    結果は1件ずつの analyze_resort_scores([message])・analyze_detailed_needs([message])・
+    ResortRuleProgram.fortune_timing と完全に一致する
+    """
+
+    def __init__(self, md_configs: Dict[str, str]):
+        self.resort_analyzer = ResortAnalysisSystem(md_configs)
+        self.needs_analyzer = DetailedNeedsAnalyzer(md_configs)
+        self.program = get_resort_program(md_configs)
+        self.dimensions = list(self.resort_analyzer.resort_dimensions)
+        self.need_types = list(self.needs_analyzer.needs_categories)
+
+        # 列＝使用するキーワードグループ、行＝その語彙（グループ所属行列で一致数をグループ単位に集計）
+        group_names = list(self.resort_analyzer.groups.values()) + list(self.needs_analyzer.groups.values())
+        self.group_columns = {name: column for column, name in enumerate(dict.fromkeys(group_names))}
+        vocabulary = sorted(set().union(*(keyword_registry.keywords(name) for name in self.group_columns)))
+        self.vocabulary = {keyword: row for row, keyword in enumerate(vocabulary)}
+
+        self.membership = np.zeros((len(vocabulary), len(self.group_columns)), dtype=np.int32)
+        for name, column in self.group_columns.items():
+            for keyword in keyword_registry.keywords(name):
+                self.membership[self.vocabulary[keyword], column] = 1
+        self.group_sizes = self.membership.sum(axis=0)
+        self.need_weights = np.array([config["weight"] for config in self.needs_analyzer.needs_categories.values()])
+
+    def match_matrix(self, messages: List[str]) -> np.ndarray:
+        """メッセージ×キーワードの一致行列（一致した位置の行・列から組み立てる）"""
+        automaton, _, _ = keyword_registry.automaton()
+        rows, columns = [], []
+        for row, message in enumerate(messages):
+            for keyword in automaton.scan(normalize_text(message)):
+                column = self.vocabulary.get(keyword)
+                if column is not None:
+                    rows.append(row)
+                    columns.append(column)
+
+        matrix = np.zeros((len(messages), len(self.vocabulary)), dtype=np.int32)
+        matrix[rows, columns] = 1
+        return matrix
+
+    def score(
+        self,
+        messages: List[str],
+        user_data: Dict[str, Any] = None,
+        rally_count: int = 0
+    ) -> Dict[str, Any]:
+        """一括スコアリング（resort_scores: N×6の整数、needs: N×5、fortune_timing: N）"""
+        user_data = user_data or {}
+        matrix = self.match_matrix(messages)
+        counts = matrix @ self.membership
+        resort_groups = self.resort_analyzer.groups
+
+        def count(name: str) -> np.ndarray:
+            return counts[:, self.group_columns[resort_groups[name]]]
+
+        def contains_any(name: str) -> np.ndarray:
+            return count(name) > 0
+
+        def contains_all(name: str) -> np.ndarray:
+            size = self.group_sizes[self.group_columns[resort_groups[name]]]
+            return (count(name) == size) & (size > 0)
+
+        contact_row = self.vocabulary.get(normalize_text("連絡"))
+        has_contact = matrix[:, contact_row] > 0
+
+        resort_scores = []
+        for dimension in self.dimensions:
+            keyword_matches = count(dimension)
+            base_score = np.where(keyword_matches > 0, np.minimum(10, keyword_matches * 2), 0)
+
+            # 次元別の特別なロジック（analyze_resort_scores と同じ優先順位）
+            if dimension == "relationship":
+                base_score = np.where(contains_any("relationship.high"), 7,
+                             np.where(contains_any("relationship.medium"), 5, base_score))
+            elif dimension == "emotion":
+                emotion_count = count("emotion.indicators")
+                base_score = np.where(emotion_count > 0, np.minimum(8, 5 + emotion_count),
+                             np.where(contains_all("contact"), 7, base_score))
+            elif dimension == "situation":
+                base_score = np.where(contains_any("situation.urgency"), 8,
+                             np.where(contains_all("contact"), 5, base_score))
+            elif dimension == "objective":
+                base_score = np.where(contains_any("objective.clear"), 6, 3)
+            elif dimension == "resource":
+                base_score = np.where(count("resource.negative") > count("resource.positive"), 3, 5)
+            elif dimension == "time":
+                base_score = np.where(contains_any("time.words") | has_contact, 8, base_score)
+
+            # ユーザーデータからの補正
+            if dimension in str(user_data).lower():
+                base_score = base_score + 1
+
+            rally_adjustment = min(1, rally_count * 0.1)
+            final_score = np.minimum(10, np.maximum(1, base_score + rally_adjustment))
+            resort_scores.append(np.trunc(final_score).astype(np.int64))
+        resort_scores = np.stack(resort_scores, axis=1) if resort_scores else np.zeros((len(messages), 0), dtype=np.int64)
+
+        needs_columns = [self.group_columns[self.needs_analyzer.groups[need_type]] for need_type in self.need_types]
+        needs = counts[:, needs_columns] * 0.3 * self.need_weights
+        context_bonus = np.array([need_type.replace("_", " ") in str(user_data).lower() for need_type in self.need_types])
+        needs = np.minimum(1.0, np.where(context_bonus, needs + 0.2, needs))
+
+        # 占いタイミング（合計は1件ずつの計算と同じく左から順に加算）
+        total_resort = resort_scores.sum(axis=1) / len(self.dimensions)
+        needs_strength = np.zeros(len(messages))
+        for column in range(needs.shape[1]):
+            needs_strength = needs_strength + needs[:, column]
+        timing = np.trunc(total_resort * self.program.resort_weight + needs_strength * 10 * self.program.needs_weight)
+        fortune_timing = np.clip(timing, 0, 100).astype(np.int64)
+
+        return {
+            "dimensions": self.dimensions,
+            "resort_scores": resort_scores,
+            "need_types": self.need_types,
+            "needs": needs,
+            "fortune_timing": fortune_timing
+        }
+
+_batch_scorer: Optional[BatchScoringSystem] = None
+_batch_scorer_sources: Optional[Tuple[str, ...]] = None
+_batch_scorer_lock = threading.Lock()
+
+def get_batch_scorer(md_configs: Dict[str, str]) -> BatchScoringSystem:
+    """バッチスコアラー（分析・ニーズ・RESORTルールのMDが変わったときだけ再構築）"""
+    global _batch_scorer, _batch_scorer_sources
+    sources = tuple(md_configs.get(name, "") or "" for name in ("analysis_system", "needs_detection", "resort_v32_analysis"))
+
+    # MDローダーは再読み込みまで同じ文字列を返すため、同一性の比較だけで済む
+    if _batch_scorer is None or any(a is not b for a, b in zip(sources, _batch_scorer_sources)):
+        with _batch_scorer_lock:
+            if _batch_scorer is None or sources != _batch_scorer_sources:
+                _batch_scorer = BatchScoringSystem(md_configs)
+            _batch_scorer_sources = sources
+    return _batch_scorer
+
 # データ完全性分析
 def calculate_data_completeness(user_data: Dict[str, Any]) -> Dict[str, float]:
     """データ完全性の計算"""
@@ -464,4 +632,25 @@ async def comprehensive_analysis(
 
     except Exception as e:
         print(f"包括分析エラー: {str(e)}")
-        raise HTTPException(status_code=500, detail="包括分析エラー")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="包括分析エラー")
+
+@analysis_router.post("/analysis/batch", response_model=BatchAnalysisResponse)
+async def analyze_batch(
+    request: BatchAnalysisRequest,
+    md_configs: Dict[str, str] = Depends(get_md_configs)
+):
+    """バッチスコアリングエンドポイント（メッセージごとのRESORT・ニーズ・占いタイミング）"""
+    try:
+        result = get_batch_scorer(md_configs).score(request.messages, request.user_data, request.rally_count)
+
+        return BatchAnalysisResponse(
+            dimensions=result["dimensions"],
+            resort_scores=result["resort_scores"].tolist(),
+            need_types=result["need_types"],
+            needs=result["needs"].tolist(),
+            fortune_timing=result["fortune_timing"].tolist()
+        )
+
+    except Exception as e:
+        print(f"バッチ分析エラー: {str(e)}")
+        raise HTTPException(status_code=500, detail="バッチ分析エラー")
@@ -8,6 +8,8 @@
 import os
 import json
 import glob
+import tempfile
+import threading
 from datetime import datetime, timezone, timedelta
 from typing import Dict, List, Any, Optional
 from fastapi import APIRouter, HTTPException
@@ -21,6 +23,9 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 # チャット履歴用のルーター
 chat_history_router = APIRouter()
 
+# セッションファイル書き込みロックの数（同じロックを共有するセッション同士は直列化される）
+SESSION_LOCK_STRIPES = 64
+
 # データモデル
 class ChatMessage(BaseModel):
     message_id: str
@@ -44,6 +49,12 @@ class ChatHistoryManager:
     def __init__(self):
         self.logs_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "chat_logs")
         os.makedirs(self.logs_dir, exist_ok=True)
+        # セッション数に依存しない固定数のロック（セッションIDのハッシュで割り当て）
+        self._session_locks = [threading.RLock() for _ in range(SESSION_LOCK_STRIPES)]
+
+    def session_lock(self, session_id: str) -> threading.RLock:
+        """セッションファイルの読み込み→追記→書き込みを直列化するロック（ワーカースレッドからの同時保存用）"""
+        return self._session_locks[hash(session_id) % SESSION_LOCK_STRIPES]
 
     def save_chat_message(
         self,
@@ -54,43 +65,69 @@ class ChatHistoryManager:
     ) -> bool:
         """チャットメッセージを保存"""
         try:
-            timestamp = datetime.now(timezone.utc).isoformat()
+            with self.session_lock(session_id):
+                return self._append_message(session_id, message_type, content, metadata)
 
-            # セッションファイルパス
-            session_file = self._get_session_filepath(session_id)
+        except Exception as e:
+            print(f"チャット履歴保存エラー: {e}")
+            return False
 
-            # 既存セッションデータを読み込み
-            session_data = self._load_session_data(session_file)
+    def _append_message(
+        self,
+        session_id: str,
+        message_type: str,
+        content: str,
+        metadata: Optional[Dict[str, Any]]
+    ) -> bool:
+        """セッションファイルにメッセージを追記（session_lock の保持中に呼ぶ）"""
+        timestamp = datetime.now(timezone.utc).isoformat()
 
-            # 新しいメッセージを追加
-            message = {
-                "message_id": f"{session_id}_{len(session_data['messages'])}",
-                "type": message_type,
-                "content": content,
-                "timestamp": timestamp,
-                "metadata": metadata or {}
-            }
+        # セッションファイルパス
+        session_file = self._get_session_filepath(session_id)
 
-            session_data['messages'].append(message)
-            session_data['end_time'] = timestamp
-            session_data['message_count'] = len(session_data['messages'])
+        # 既存セッションデータを読み込み
+        session_data = self._load_session_data(session_file)
 
-            # 期間計算
-            if session_data['start_time']:
-                start_time = datetime.fromisoformat(session_data['start_time'].replace('Z', '+00:00'))
-                end_time = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
-                duration = (end_time - start_time).total_seconds() / 60
-                session_data['duration_minutes'] = round(duration, 2)
+        # 新しいメッセージを追加
+        message = {
+            "message_id": f"{session_id}_{len(session_data['messages'])}",
+            "type": message_type,
+            "content": content,
+            "timestamp": timestamp,
+            "metadata": metadata or {}
+        }
 
-            # ファイルに保存
-            with open(session_file, 'w', encoding='utf-8') as f:
-                json.dump(session_data, f, ensure_ascii=False, indent=2)
+        session_data['messages'].append(message)
+        session_data['end_time'] = timestamp
+        session_data['message_count'] = len(session_data['messages'])
 
-            return True
+        # 期間計算
+        if session_data['start_time']:
+            start_time = datetime.fromisoformat(session_data['start_time'].replace('Z', '+00:00'))
+            end_time = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+            duration = (end_time - start_time).total_seconds() / 60
+            session_data['duration_minutes'] = round(duration, 2)
 
-        except Exception as e:
-            print(f"チャット履歴保存エラー: {e}")
-            return False
+        # ファイルに保存（一時ファイルに書いてから置き換え、読み手が書きかけのファイルを見ないようにする）
+        self._write_session_data(session_file, session_data)
+
+        return True
+
+    def _write_session_data(self, session_file: str, session_data: Dict[str, Any]):
+        """セッションデータを原子的に書き込み"""
+        fd, temp_path = tempfile.mkstemp(
+            prefix=f".{os.path.basename(session_file)}.", suffix=".tmp", dir=self.logs_dir
+        )
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(session_data, f, ensure_ascii=False, indent=2)
+            # mkstemp は所有者のみ読み書き可で作成するため、従来の open() と同じ権限に戻す
+            os.chmod(temp_path, 0o644)
+            os.replace(temp_path, session_file)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
 
     def _get_session_filepath(self, session_id: str) -> str:
         """セッションファイルパスを取得"""
@@ -696,6 +733,23 @@ async def chat_history_page():
     return HTMLResponse(content=html_content)
 
 # チャット履歴保存関数（他のサービスから呼び出し用）
+def resolve_session_id(session_id: Optional[str]) -> str:
+    """セッション継続判定（未指定ならアクティブセッションを検索し、なければ新規作成）"""
+    if session_id:
+        return session_id
+
+    # セッションIDが未指定の場合、アクティブセッションを検索
+    active_session = chat_history_manager.get_active_session_id()
+    if active_session:
+        print(f"継続セッションを使用: {active_session}")
+        return active_session
+
+    # 新しいセッションを作成
+    from uuid import uuid4
+    session_id = str(uuid4())[:8]
+    print(f"新しいセッションを作成: {session_id}")
+    return session_id
+
 def save_chat_interaction(
     session_id: str,
     user_message: str,
@@ -704,31 +758,23 @@ def save_chat_interaction(
 ):
     """チャットのやり取りを一括保存"""
     # セッション継続判定
-    if not session_id:
-        # セッションIDが未指定の場合、アクティブセッションを検索
-        active_session = chat_history_manager.get_active_session_id()
-        if active_session:
-            session_id = active_session
-            print(f"継続セッションを使用: {session_id}")
-        else:
-            # 新しいセッションを作成
-            from uuid import uuid4
-            session_id = str(uuid4())[:8]
-            print(f"新しいセッションを作成: {session_id}")
-
-    # ユーザーメッセージを保存
-    chat_history_manager.save_chat_message(
-        session_id=session_id,
-        message_type="user",
-        content=user_message
-    )
-
-    # AI応答を分析データ付きで保存
-    chat_history_manager.save_chat_message(
-        session_id=session_id,
-        message_type="ai",
-        content=ai_response,
-        metadata=analysis_data
-    )
+    session_id = resolve_session_id(session_id)
+
+    # 同じセッションへの同時保存でユーザー発話とAI応答の組が分かれないよう、2件まとめてロック
+    with chat_history_manager.session_lock(session_id):
+        # ユーザーメッセージを保存
+        chat_history_manager.save_chat_message(
+            session_id=session_id,
+            message_type="user",
+            content=user_message
+        )
+
+        # AI応答を分析データ付きで保存
+        chat_history_manager.save_chat_message(
+            session_id=session_id,
+            message_type="ai",
+            content=ai_response,
+            metadata=analysis_data
+        )
 
     return session_id
\ No newline at end of file
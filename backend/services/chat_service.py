@@ -5,10 +5,16 @@
 チャット処理とレスポンス生成の専用サービスモジュール
 """
 
-from fastapi import APIRouter, HTTPException, Depends
-from typing import Dict, List, Optional, Any
-from pydantic import BaseModel
+from fastapi import APIRouter, HTTPException, Depends, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from typing import Dict, List, Optional, Any, AsyncIterator, Tuple
+from pydantic import BaseModel, ValidationError
 from datetime import datetime
+import asyncio
+import copy
+import json
+import textwrap
+import time
 import yaml
 
 import sys
@@ -18,12 +24,29 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from core.md_loader import get_md_configs, get_character_config
 from core.openai_client import get_openai_manager
 from core.response_engine import FlexibleResponseEngine
+from core.single_flight import SingleFlight
+from core.scheduler import Priority
+from core.resilience import Deadline
+from core.circuit_breaker import CircuitOpenError
+from core.token_budget import get_prompt_budget
+from core.metrics import metrics
+from core.prompt_builder import PromptBuilder
+from core.model_tiers import ModelTier, select_model_tier, select_model_tier_before_analysis
+from core.sentence_limiter import limit_sentences
+from core.stage_graph import StageGraph
+from core.emotion_cache import REQUIRED_FIELDS, emotion_cache, emotion_md_version
+from core.micro_batcher import MicroBatcher
+from core.cassette import cassette
+from core.local_classifier import get_local_classifier
+from core.crisis_detector import get_crisis_detector
+from core.message_features import keyword_registry, message_features
+from core.resort_rules import get_resort_program
 from shared.config import AppConfig
-from services.chat_history_service import save_chat_interaction
-import uuid
+from services.chat_history_service import resolve_session_id, save_chat_interaction
 
 # チャット用のルーター
 chat_router = APIRouter()
+chat_ws_router = APIRouter()
 
 # データモデル
 class ChatMessage(BaseModel):
@@ -42,6 +65,8 @@ class ChatResponse(BaseModel):
     fortune_timing_score: int
     suggested_fortune: Optional[str] = None
     session_id: str
+    model_tier: Optional[str] = None
+    crisis_level: Optional[int] = None
 
 # ニーズ分析クラス（統合版）
 class NeedsAnalyzer:
@@ -61,18 +86,27 @@ class NeedsAnalyzer:
             "encouragement": ["不安", "自信ない", "怖い", "心配", "緊張"],
             "loneliness": ["一人", "寂しい", "孤独", "さみしい", "独り"]
         }
+        self.groups = {
+            need_type: keyword_registry.define(f"needs.{need_type}", keywords)
+            for need_type, keywords in self.keywords.items()
+        }
 
     def analyze(self, message: str) -> Dict[str, float]:
         """ニーズ分析実行"""
         scores = {}
+        features = message_features(message)
 
-        for need_type, keywords in self.keywords.items():
-            score = 0.0
-            for keyword in keywords:
-                if keyword in message:
-                    score += 0.7
+        for need_type, group in self.groups.items():
+            # 含まれるキーワード1種類ごとに0.7
+            scores[need_type] = min(features.count(group) * 0.7, 1.0)
 
-            scores[need_type] = min(score, 1.0)
+        # キーワードに該当しなければローカル分類器の推定（確信度が閾値以上のときのみ）
+        if not any(scores.values()):
+            classifier = get_local_classifier()
+            predicted = classifier.predict_need(message) if classifier else None
+            if predicted and predicted[0] in scores and predicted[1] >= AppConfig.NEEDS_LOCAL_CONFIDENCE_THRESHOLD:
+                metrics.incr("needs.local.accepted")
+                scores[predicted[0]] = round(predicted[1], 2)
 
         return scores
 
@@ -113,6 +147,15 @@ class CategorySelector:
 
         return need_to_category.get(top_need, "深い共感")
 
+# システムプロンプトの固定制約（リクエスト間で不変）
+SYSTEM_PROMPT_CONSTRAINTS = """
+重要な制約：
+- 必ず3センテンス以内で応答してください
+- 150-250文字程度を目安としてください
+- 末尾の「今回のリクエスト情報」で選択されたカテゴリに沿った応答をしてください
+- 共感性を最優先に、温かみのある応答をしてください
+"""
+
 # システムプロンプト生成
 def generate_system_prompt(
     needs_analysis: Dict[str, float],
@@ -121,137 +164,451 @@ def generate_system_prompt(
     md_configs: Dict[str, str],
     character_config: str
 ) -> str:
-    """MDファイルベースのシステムプロンプト生成"""
-
-    base_prompt = f"""
-{character_config}
-
-以下のMDファイル設定に従って応答してください：
-
-【ニーズ判別システム】
-{md_configs.get('needs_detection', '')}
-
-【第3文カテゴリシステム】
-{md_configs.get('third_sentence_categories', '')}
-
-【カテゴリ選択システム】
-{md_configs.get('category_selection', '')}
-
-現在の分析結果：
+    """MDファイルベースのシステムプロンプト生成（入力トークン予算内に調整）"""
+
+    # 予算超過時は優先度の低いMDセクションから要約・削除
+    md_sections, budget_report = get_prompt_budget("system_prompt").fit(
+        character_config,
+        {
+            'needs_detection': md_configs.get('needs_detection', ''),
+            'third_sentence_categories': md_configs.get('third_sentence_categories', ''),
+            'category_selection': md_configs.get('category_selection', '')
+        }
+    )
+    if AppConfig.DEBUG and (budget_report['summarized'] or budget_report['dropped']):
+        print(f"プロンプト予算調整: {budget_report}")
+
+    # キャラクター・MDルール・固定の制約を先頭に、分析結果を末尾に置く
+    return (
+        PromptBuilder("system_prompt")
+        .static(character_config)
+        .static("以下のMDファイル設定に従って応答してください：")
+        .static(md_sections['needs_detection'], "【ニーズ判別システム】")
+        .static(md_sections['third_sentence_categories'], "【第3文カテゴリシステム】")
+        .static(md_sections['category_selection'], "【カテゴリ選択システム】")
+        .static(SYSTEM_PROMPT_CONSTRAINTS)
+        .dynamic(f"""現在の分析結果：
 - 検出ニーズ: {needs_analysis}
 - 選択カテゴリ: {category}
 - ラリー回数: {rally_count}
 
-重要な制約：
-- 必ず3センテンス以内で応答してください
-- 150-250文字程度を目安としてください
-- 選択されたカテゴリ「{category}」に沿った応答をしてください
-- 共感性を最優先に、温かみのある応答をしてください
-"""
-
-    return base_prompt
+選択されたカテゴリ「{category}」に沿った応答をしてください""")
+        .render()
+    )
 
 # Claude Sonnet API感情分析システム（v3.2対応）
-# 旧キーワードベース分析システムは削除済み
-
-def analyze_emotion_advanced(message: str, md_configs: Dict[str, str]) -> Dict[str, Any]:
-    """Claude Sonnet APIベース高度感情分析（v3.2仕様）"""
-    import json
-    try:
-        # 環境変数からAPIキーをチェック
-        import os
-        api_key = os.getenv("ANTHROPIC_API_KEY")
-
-        if not api_key:
-            print("ANTHROPIC_API_KEY not found, using fallback analysis")
-            return analyze_emotion_fallback(message)
 
-        # Anthropic Claude APIを使用した感情分析
-        import requests
-
-        emotion_md = md_configs.get('emotion_analysis_system', '')
-
-        # Claude APIプロンプト生成
-        analysis_prompt = f"""
-以下のMDファイル設定に基づいて、ユーザーメッセージの感情分析を行ってください：
-
-{emotion_md}
-
-【分析対象メッセージ】
-"{message}"
-
-【要求する分析結果（JSON形式で返答）】
-{{
+# 感情分析JSONの形式（分析単体・統合モード共通）
+EMOTION_ANALYSIS_SCHEMA = """{
   "primary_emotion": "主要感情（日本語）",
   "emotion_intensity": 0-100の整数値,
-  "emotion_layers": {{
+  "emotion_layers": {
     "surface": "表層感情",
     "middle": "中層感情",
     "deep": "深層感情"
-  }},
+  },
   "empathy_level": 1-5の整数値,
   "tone_matching": "推奨トーン",
   "analysis_quality": "primary または enhanced",
   "crisis_level": 0-5の危機レベル
-}}
+}"""
+
+def _text_field(value: Any) -> str:
+    if not isinstance(value, str) or not value.strip():
+        raise ValueError("空の文字列")
+    return value.strip()
+
+def _int_field(low: int, high: int):
+    def validate(value: Any) -> int:
+        if isinstance(value, bool):
+            raise ValueError("真偽値")
+        number = int(value)
+        if not low <= number <= high:
+            raise ValueError(f"範囲外: {number}")
+        return number
+    return validate
+
+EMOTION_FIELD_VALIDATORS = {
+    "primary_emotion": _text_field,
+    "emotion_intensity": _int_field(0, 100),
+    "empathy_level": _int_field(1, 5),
+    "tone_matching": _text_field,
+    "analysis_quality": _text_field,
+    "crisis_level": _int_field(0, 5)
+}
+EMOTION_LAYER_KEYS = ("surface", "middle", "deep")
+
+def validate_emotion_analysis(candidate: Any, message: str) -> Dict[str, Any]:
+    """感情分析JSONをスキーマで検証（欠損・不正なフィールドは簡易分析の値で個別に補完）"""
+    fallback = analyze_emotion_fallback(message)
+    if not isinstance(candidate, dict):
+        metrics.incr("emotion.field_fallback.all")
+        return fallback
+
+    analysis_result = {}
+
+    for name, validate in EMOTION_FIELD_VALIDATORS.items():
+        try:
+            analysis_result[name] = validate(candidate.get(name))
+        except (TypeError, ValueError):
+            metrics.incr(f"emotion.field_fallback.{name}")
+            analysis_result[name] = fallback[name]
+
+    layers = candidate.get("emotion_layers")
+    layers = layers if isinstance(layers, dict) else {}
+    analysis_result["emotion_layers"] = {}
+    for key in EMOTION_LAYER_KEYS:
+        try:
+            analysis_result["emotion_layers"][key] = _text_field(layers.get(key))
+        except ValueError:
+            metrics.incr(f"emotion.field_fallback.emotion_layers.{key}")
+            analysis_result["emotion_layers"][key] = fallback["emotion_layers"][key]
+
+    # 後方互換性のための追加データ
+    analysis_result.update({
+        "polarity": 1.0 if analysis_result["primary_emotion"] in ["喜び", "愛情", "感謝", "安心", "期待"] else -1.0,
+        "intensity": analysis_result["emotion_intensity"] / 100.0,
+        "dominant_emotion": analysis_result["primary_emotion"]
+    })
+
+    return analysis_result
+
+def extract_json_text(result_text: str) -> str:
+    """応答テキストからJSON部分を抽出（コードブロック・前後の説明文を除去）"""
+    if "```json" in result_text:
+        json_start = result_text.find("```json") + 7
+        json_end = result_text.find("```", json_start)
+        return result_text[json_start:json_end].strip()
+    elif "{" in result_text:
+        json_start = result_text.find("{")
+        json_end = result_text.rfind("}") + 1
+        return result_text[json_start:json_end]
+    return result_text
+# 旧キーワードベース分析システムは削除済み
+
+def emotion_prompt_md(md_configs: Dict[str, str]) -> str:
+    """感情分析プロンプトに含める感情分析MD（既定は含めない、含める場合は予算内に要約・削除）"""
+    if not AppConfig.EMOTION_PROMPT_INCLUDE_MD:
+        return ""
+    # 予算は感情分析MDのみに適用（メッセージ長で要約範囲が変わらないようにする）
+    fitted, _ = get_prompt_budget("emotion").fit(
+        "", {'emotion_analysis_system': md_configs.get('emotion_analysis_system', '')}
+    )
+    return fitted['emotion_analysis_system']
+
+def build_emotion_analysis_prompt(message: str, md_configs: Dict[str, str]) -> str:
+    """感情分析プロンプト生成"""
+    emotion_md = emotion_prompt_md(md_configs)
+
+    return f"""
+以下のMDファイル設定に基づいて、ユーザーメッセージの感情分析を行ってください：
+
+{emotion_md}
+
+【分析対象メッセージ】
+"{message}"
+
+【要求する分析結果（JSON形式で返答）】
+{EMOTION_ANALYSIS_SCHEMA}
 
 特に「彼氏から連絡がこない」のようなメッセージは不安感情として強度70で判定してください。
 文脈を理解して適切な感情分析を行ってください。
 JSONのみを返答してください。
 """
 
-        headers = {
-            "Content-Type": "application/json",
-            "x-api-key": api_key,
-            "anthropic-version": "2023-06-01"
-        }
+def parse_emotion_analysis(result_text: str, message: str) -> Dict[str, Any]:
+    """応答テキストからJSONを抽出して検証（JSONとして読めない場合は例外を送出）"""
+    return validate_emotion_analysis(json.loads(extract_json_text(result_text)), message)
 
-        data = {
-            "model": "claude-3-5-sonnet-20241022",
-            "max_tokens": 1000,
-            "messages": [
-                {"role": "user", "content": analysis_prompt}
-            ]
-        }
+async def request_emotion_analysis(
+    message: str,
+    md_configs: Dict[str, str],
+    priority: Priority = Priority.CHAT,
+    deadline: Optional[Deadline] = None
+) -> Dict[str, Any]:
+    """感情分析リクエスト（共有の接続プール経由、失敗時は例外を送出）
+
+    プロバイダ選択・ブレーカー・スロット・録音再生はルーターの emotion ポリシーに従う。
+    """
+    # ターン期限とは別に感情分析段の時間予算を持つ（ターンの残りが短ければそちらに合わせる）
+    budget = deadline.timeout(AppConfig.EMOTION_TIMEOUT_SECONDS) if deadline else AppConfig.EMOTION_TIMEOUT_SECONDS
+    if budget <= 0:
+        raise asyncio.TimeoutError("感情分析の時間予算切れ")
+
+    result_text = await get_openai_manager().create_chat_completion(
+        [{"role": "user", "content": build_emotion_analysis_prompt(message, md_configs)}],
+        model=AppConfig.EMOTION_MODEL,
+        max_tokens=AppConfig.EMOTION_MAX_TOKENS,
+        temperature=AppConfig.EMOTION_TEMPERATURE,
+        endpoint="emotion",
+        priority=priority,
+        deadline=Deadline(budget)
+    )
+    return parse_emotion_analysis(result_text, message)
+
+# 感情分析のマイクロバッチ（同時ターンの感情分析を1回の呼び出しにまとめる）
+def build_emotion_batch_prompt(messages: List[str], md_configs: Dict[str, str]) -> str:
+    """複数メッセージの感情分析プロンプト（感情分析MDを1回だけ含める）"""
+    numbered = "\n".join(f"[{index}] {json.dumps(message, ensure_ascii=False)}" for index, message in enumerate(messages, 1))
+    emotion_md = emotion_prompt_md(md_configs)
+
+    return f"""
+以下のMDファイル設定に基づいて、複数のユーザーメッセージの感情分析をそれぞれ独立に行ってください：
 
-        response = requests.post(
-            "https://api.anthropic.com/v1/messages",
-            headers=headers,
-            json=data,
-            timeout=30
-        )
+{emotion_md}
+
+【分析対象メッセージ一覧】
+{numbered}
 
-        if response.status_code == 200:
-            result_data = response.json()
-            result_text = result_data["content"][0]["text"]
-
-            # JSON抽出
-            if "```json" in result_text:
-                json_start = result_text.find("```json") + 7
-                json_end = result_text.find("```", json_start)
-                result_text = result_text[json_start:json_end].strip()
-            elif "{" in result_text:
-                json_start = result_text.find("{")
-                json_end = result_text.rfind("}") + 1
-                result_text = result_text[json_start:json_end]
-
-            analysis_result = json.loads(result_text)
-
-            # 後方互換性のための追加データ
-            analysis_result.update({
-                "polarity": 1.0 if analysis_result["primary_emotion"] in ["喜び", "愛情", "感謝", "安心", "期待"] else -1.0,
-                "intensity": analysis_result["emotion_intensity"] / 100.0,
-                "dominant_emotion": analysis_result["primary_emotion"]
-            })
-
-            return analysis_result
+【要求する分析結果（JSON配列形式で返答）】
+メッセージごとに、メッセージ番号を "index" に入れた以下の形式のオブジェクトを、番号順に{len(messages)}件並べた配列を返答してください：
+{EMOTION_ANALYSIS_SCHEMA}
+
+特に「彼氏から連絡がこない」のようなメッセージは不安感情として強度70で判定してください。
+JSON配列のみを返答してください。
+"""
+
+def parse_emotion_batch(result_text: str, messages: List[str]) -> List[Optional[Dict[str, Any]]]:
+    """JSON配列の応答をメッセージごとの分析結果に分配（欠落・不正な要素はNone、配列として読めなければ全件None）"""
+    analyses: List[Optional[Dict[str, Any]]] = [None] * len(messages)
+    text = result_text.strip()
+    if "```json" in text:
+        text = extract_json_text(text)
+    elif "[" in text:
+        text = text[text.find("["):text.rfind("]") + 1]
+    try:
+        items = json.loads(text)
+    except json.JSONDecodeError:
+        return analyses
+    if not isinstance(items, list):
+        return analyses
+
+    for position, item in enumerate(items):
+        if not isinstance(item, dict):
+            continue
+        # 番号がなければ件数が一致する場合のみ並び順で対応付け
+        index = item.get("index")
+        if isinstance(index, int) and not isinstance(index, bool):
+            index -= 1
+        elif len(items) == len(messages):
+            index = position
         else:
-            print(f"Claude API error: {response.status_code}")
-            return analyze_emotion_fallback(message)
+            continue
+        if not 0 <= index < len(messages) or analyses[index] is not None:
+            continue
+        if any(name not in item for name in REQUIRED_FIELDS):
+            continue
+        analyses[index] = validate_emotion_analysis(item, messages[index])
+    return analyses
+
+async def _run_emotion_batch(items: List[Tuple[str, Dict[str, str], Priority, Optional[Deadline]]]) -> List[Any]:
+    """バッチの感情分析（1件なら通常の呼び出し、欠落・不正な要素は個別の呼び出しで再分析）"""
+    if len(items) == 1:
+        return [await request_emotion_analysis(*items[0])]
+
+    messages = [message for message, _, _, _ in items]
+    md_configs = items[0][1]
+    # 最も優先度の高い要求のレーンで、最も短い時間予算に合わせて呼び出す
+    priority = min(item_priority for _, _, item_priority, _ in items)
+    budget = min(
+        deadline.timeout(AppConfig.EMOTION_TIMEOUT_SECONDS) if deadline else AppConfig.EMOTION_TIMEOUT_SECONDS
+        for _, _, _, deadline in items
+    )
+    if budget <= 0:
+        raise asyncio.TimeoutError("感情分析の時間予算切れ")
+
+    result_text = await get_openai_manager().create_chat_completion(
+        [{"role": "user", "content": build_emotion_batch_prompt(messages, md_configs)}],
+        model=AppConfig.EMOTION_MODEL,
+        max_tokens=AppConfig.EMOTION_BATCH_TOKENS_PER_MESSAGE * len(messages),
+        temperature=AppConfig.EMOTION_TEMPERATURE,
+        endpoint="emotion_batch",
+        priority=priority,
+        deadline=Deadline(budget)
+    )
+    analyses = parse_emotion_batch(result_text, messages)
+    metrics.incr("emotion_batch.messages", len(messages))
+
+    missing = [index for index, analysis in enumerate(analyses) if analysis is None]
+    if missing:
+        metrics.incr("emotion_batch.single_fallback", len(missing))
+        retried = await asyncio.gather(
+            *(request_emotion_analysis(*items[index]) for index in missing), return_exceptions=True
+        )
+        for index, result in zip(missing, retried):
+            analyses[index] = result
+    return analyses
+
+emotion_batcher = MicroBatcher(
+    "emotion",
+    _run_emotion_batch,
+    window_seconds=AppConfig.EMOTION_BATCH_WINDOW_MS / 1000.0,
+    max_size=AppConfig.EMOTION_BATCH_MAX_SIZE
+)
+
+def emotion_batching_enabled() -> bool:
+    # 録音・再生中は上流呼び出しの順序を変えないよう無効
+    return AppConfig.EMOTION_BATCH_ENABLED and not cassette.active
+
+def analyze_emotion_local(message: str) -> Optional[Tuple[Dict[str, Any], float]]:
+    """ローカル分類器による感情推定と確信度（分類器がなければNone）"""
+    classifier = get_local_classifier()
+    if classifier is None:
+        return None
+
+    analysis_result, confidence = classifier.predict_emotion(message)
+    # 危機レベルはキーワード検出のみ（感情ごとの代表値は低確信度の推定でも5になりうるため使わない）
+    analysis_result["crisis_level"] = detect_crisis_level(message)
+    analysis_result.update({
+        "polarity": calculate_polarity(analysis_result["primary_emotion"]),
+        "intensity": analysis_result["emotion_intensity"] / 100.0,
+        "dominant_emotion": analysis_result["primary_emotion"]
+    })
+    return analysis_result, confidence
+
+def accept_local_emotion(message: str) -> Optional[Dict[str, Any]]:
+    """確信度が閾値以上かつ危機の兆候がなければローカル推定を採用（それ以外はLLMへエスカレーション）"""
+    local = analyze_emotion_local(message)
+    if local is None:
+        return None
+
+    analysis_result, confidence = local
+    if confidence < AppConfig.EMOTION_LOCAL_CONFIDENCE_THRESHOLD or analysis_result["crisis_level"] >= AppConfig.CRISIS_PRIORITY_LEVEL:
+        metrics.incr("emotion.local.escalated")
+        return None
+
+    metrics.incr("emotion.local.accepted")
+    return analysis_result
+
+# 感情分析の同時リクエスト集約（同一メッセージ・同一MD設定で1回のClaude呼び出し）
+emotion_flight = SingleFlight("emotion")
+
+async def analyze_emotion_advanced(
+    message: str,
+    md_configs: Dict[str, str],
+    priority: Priority = Priority.CHAT,
+    deadline: Optional[Deadline] = None
+) -> Dict[str, Any]:
+    """Claude Sonnet APIベース高度感情分析（v3.2仕様、失敗時はフォールバック分析）"""
+    # ローカル分類器の確信度が十分ならLLMを呼ばない
+    local_result = accept_local_emotion(message)
+    if local_result is not None:
+        return local_result
+
+    # 全プロバイダ停止中は待たずにフォールバック分析へ
+    if get_openai_manager().rejecting("emotion"):
+        metrics.incr("emotion.fallback")
+        return analyze_emotion_fallback(message)
 
+    started = time.perf_counter()
+    try:
+        if emotion_batching_enabled():
+            # 同じ版の感情分析MDを使う要求だけを束ねる
+            analysis_result = await emotion_batcher.submit(
+                emotion_md_version(md_configs), (message, md_configs, priority, deadline)
+            )
+        else:
+            analysis_result = await request_emotion_analysis(message, md_configs, priority, deadline)
     except Exception as e:
         print(f"Claude API感情分析エラー: {e}")
+        metrics.incr("emotion.fallback")
         return analyze_emotion_fallback(message)
+    finally:
+        # 応答生成とは分けて感情分析段のレイテンシを記録
+        metrics.record("emotion.analysis", time.perf_counter() - started)
+
+    # フォールバック分析はキャッシュしない（障害が解消すればモデル分析に戻る）
+    emotion_cache.set(message, emotion_md_version(md_configs), analysis_result)
+    return analysis_result
+
+async def analyze_emotion_async(
+    message: str,
+    md_configs: Dict[str, str],
+    priority: Priority = Priority.CHAT,
+    deadline: Optional[Deadline] = None
+) -> Dict[str, Any]:
+    """感情分析（キャッシュ → 同時の同一リクエストを集約）"""
+    version = emotion_md_version(md_configs)
+    cached = emotion_cache.get(message, version)
+    if cached is not None:
+        return cached
+
+    # 正規化メッセージ単位で集約（全角・半角や空白だけが異なる同時リクエストも1回にまとめる）
+    key = emotion_cache.key(message, version)
+    result = await emotion_flight.do(
+        key, lambda: analyze_emotion_advanced(message, md_configs, priority, deadline)
+    )
+    # 呼び出し元ごとに独立したコピーを返す
+    return copy.deepcopy(result)
+
+# 統合モード（感情分析と応答生成を1回の呼び出しで実行）
+_FUSED_EMOTION_SCHEMA = textwrap.indent(EMOTION_ANALYSIS_SCHEMA, "  ").lstrip()
+FUSED_OUTPUT_FORMAT = f"""
+出力形式（以下のJSONのみを返答し、前後に説明文を付けないでください）：
+{{
+  "emotion_analysis": {_FUSED_EMOTION_SCHEMA},
+  "response": "ユーザーへの応答文（上記の制約に従う）"
+}}
+"""
+
+def generate_fused_prompt(
+    needs_analysis: Dict[str, float],
+    category: str,
+    rally_count: int,
+    md_configs: Dict[str, str],
+    character_config: str
+) -> str:
+    """統合モードのシステムプロンプト（応答生成MDと感情分析MDを1回の呼び出しにまとめる）"""
+    md_sections, budget_report = get_prompt_budget("fused_turn").fit(
+        character_config,
+        {
+            'needs_detection': md_configs.get('needs_detection', ''),
+            'third_sentence_categories': md_configs.get('third_sentence_categories', ''),
+            'category_selection': md_configs.get('category_selection', ''),
+            'emotion_analysis_system': md_configs.get('emotion_analysis_system', '') if AppConfig.EMOTION_PROMPT_INCLUDE_MD else ''
+        }
+    )
+    if AppConfig.DEBUG and (budget_report['summarized'] or budget_report['dropped']):
+        print(f"プロンプト予算調整: {budget_report}")
+
+    return (
+        PromptBuilder("fused_turn")
+        .static(character_config)
+        .static("以下のMDファイル設定に従って、ユーザーメッセージの感情分析と応答を同時に行ってください：")
+        .static(md_sections['needs_detection'], "【ニーズ判別システム】")
+        .static(md_sections['third_sentence_categories'], "【第3文カテゴリシステム】")
+        .static(md_sections['category_selection'], "【カテゴリ選択システム】")
+        .static(md_sections['emotion_analysis_system'], "【感情分析システム】")
+        .static(SYSTEM_PROMPT_CONSTRAINTS)
+        .static(FUSED_OUTPUT_FORMAT)
+        .dynamic(f"""現在の分析結果：
+- 検出ニーズ: {needs_analysis}
+- 選択カテゴリ: {category}
+- ラリー回数: {rally_count}
+
+選択されたカテゴリ「{category}」に沿った応答をしてください""")
+        .render()
+    )
+
+def parse_fused_turn(result_text: str, message: str) -> Tuple[Dict[str, Any], Optional[str]]:
+    """統合モードの応答を (感情分析, 応答文) に分解
+
+    感情分析はフィールド単位で補完する。応答文が取り出せなければNone。
+    """
+    try:
+        data = json.loads(extract_json_text(result_text))
+    except json.JSONDecodeError:
+        # JSON形式を守らず応答文だけを返した場合は、応答文として採用し感情分析は簡易分析で補完
+        if "{" in result_text:
+            raise
+        return validate_emotion_analysis(None, message), result_text.strip() or None
+
+    if not isinstance(data, dict):
+        return validate_emotion_analysis(None, message), None
+
+    reply = data.get("response")
+    reply = reply.strip() if isinstance(reply, str) and reply.strip() else None
+    return validate_emotion_analysis(data.get("emotion_analysis"), message), reply
 
 def analyze_emotion_fallback(message: str) -> Dict[str, Any]:
     """フォールバック用簡易感情分析"""
@@ -274,6 +631,11 @@ def analyze_emotion_fallback(message: str) -> Dict[str, Any]:
             "dominant_emotion": "不安"
         }
 
+    # ローカル分類器の確信度が閾値以上ならその推定（ニュートラル固定より実際の感情に近い）
+    local = analyze_emotion_local(message)
+    if local is not None and local[1] >= AppConfig.EMOTION_LOCAL_CONFIDENCE_THRESHOLD:
+        return local[0]
+
     # デフォルト（ニュートラル）
     return {
         "primary_emotion": "ニュートラル",
@@ -335,38 +697,24 @@ def calculate_empathy_level(intensity: int, thresholds: List[int]) -> int:
     else:
         return 1
 
+TONE_GROUPS = [
+    (keyword_registry.define("tone.casual", ["やばい", "マジで", "めっちゃ", "だわ"]), "カジュアル・親しみやすい"),
+    (keyword_registry.define("tone.polite", ["です", "ます", "恐れ入りますが"]), "丁寧・落ち着いた"),
+    (keyword_registry.define("tone.emotional", ["！！", "。。。"]), "感情的・不安定"),
+    (keyword_registry.define("tone.analytical", ["思うに", "考えてみると", "分析すると"]), "理知的・分析的")
+]
+
 def analyze_tone_matching(message: str) -> str:
-    """トーンマッチング分析"""
-    if any(word in message for word in ["やばい", "マジで", "めっちゃ", "だわ"]):
-        return "カジュアル・親しみやすい"
-    elif any(word in message for word in ["です", "ます", "恐れ入りますが"]):
-        return "丁寧・落ち着いた"
-    elif "！！" in message or "。。。" in message:
-        return "感情的・不安定"
-    elif any(word in message for word in ["思うに", "考えてみると", "分析すると"]):
-        return "理知的・分析的"
-    else:
-        return "自然体・バランス型"
+    """トーンマッチング分析（上のグループから順に判定）"""
+    features = message_features(message)
+    for group, tone in TONE_GROUPS:
+        if features.any(group):
+            return tone
+    return "自然体・バランス型"
 
 def detect_crisis_level(message: str) -> int:
-    """危機レベル検出"""
-    level_5_keywords = ["死にたい", "消えたい", "いなくなりたい", "終わりにしたい"]
-    level_4_keywords = ["もうダメ", "限界", "耐えられない", "壊れそう"]
-    level_3_keywords = ["疲れた", "辛すぎる", "苦しい"]
-
-    for keyword in level_5_keywords:
-        if keyword in message:
-            return 5
-
-    for keyword in level_4_keywords:
-        if keyword in message:
-            return 4
-
-    for keyword in level_3_keywords:
-        if keyword in message:
-            return 3
-
-    return 0
+    """危機レベル検出（感情分析MDの crisis_levels をコンパイルした検出器）"""
+    return get_crisis_detector().detect(message)
 
 def calculate_polarity(primary_emotion: str) -> float:
     """後方互換性のための極性計算"""
@@ -382,9 +730,9 @@ def calculate_polarity(primary_emotion: str) -> float:
 
 # 既存の関数名を維持（後方互換性）
 def analyze_emotion(message: str, md_configs: Dict[str, str] = None) -> Dict[str, Any]:
-    """感情分析（改良版）"""
+    """感情分析（同期版・簡易分析のみ、Claude分析は analyze_emotion_async を使用）"""
     if md_configs:
-        return analyze_emotion_advanced(message, md_configs)
+        return analyze_emotion_fallback(message)
     else:
         # フォールバック（従来の簡易版）
         return {
@@ -399,251 +747,374 @@ def analyze_emotion(message: str, md_configs: Dict[str, str] = None) -> Dict[str
             "dominant_emotion": "ニュートラル"
         }
 
-def load_resort_rules(md_content: str) -> Dict[str, Any]:
-    """リゾート計算ルールをMDファイルから読み込み"""
-    import re
-    import yaml
-
-    rules = {
-        "relationship": {},
-        "emotion": {},
-        "situation": {},
-        "objective": {},
-        "resource": {},
-        "time": {},
-        "fortune_mapping": {},
-        "timing_calculation": {}
+def calculate_resort_scores(message: str, needs_analysis: Dict[str, float], rally_count: int, md_configs: Dict[str, str] = None) -> Dict[str, int]:
+    """RESORT 6次元スコア計算（v3.2仕様 - コンパイル済みMDルール）"""
+    return get_resort_program(md_configs or {}).scores(message, needs_analysis, rally_count)
+
+def calculate_fortune_timing(resort_scores: Dict[str, int], needs_analysis: Dict[str, float], md_configs: Dict[str, str] = None) -> int:
+    """占いタイミングスコア計算（コンパイル済みMDルール）"""
+    return get_resort_program(md_configs or {}).fortune_timing(resort_scores, needs_analysis)
+
+def suggest_fortune_menu(resort_scores: Dict[str, int], needs_analysis: Dict[str, float], md_configs: Dict[str, str] = None) -> Optional[str]:
+    """占いメニュー提案（コンパイル済みMDルール）"""
+    return get_resort_program(md_configs or {}).fortune_menu(resort_scores)
+
+def generate_fallback_response(message: str) -> str:
+    """フォールバック応答生成"""
+    return "お話を聞かせていただき、ありがとうございます。あなたの気持ちに寄り添いたいと思います。どのようなことでも、遠慮なくお話しください。"
+
+def _build_response_engine() -> FlexibleResponseEngine:
+    """柔軟レスポンス生成エンジンを構築"""
+    # プロジェクトルートからsystemsへのパスを構築 (backend/../systems)
+    project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    systems_path = os.path.join(project_root, "systems")
+    return FlexibleResponseEngine(systems_path)
+
+def _turn_priority(crisis_level: int) -> Priority:
+    """危機レベルに応じた上流呼び出しの優先度"""
+    if crisis_level >= AppConfig.CRISIS_PRIORITY_LEVEL:
+        return Priority.CRISIS
+    return Priority.CHAT
+
+def _chat_turn_graph(
+    request: ChatMessage,
+    md_configs: Dict[str, str],
+    priority: Priority = Priority.CHAT,
+    deadline: Optional[Deadline] = None,
+    fused: bool = False,
+    name: str = "chat"
+) -> StageGraph:
+    """応答生成前のステージ（感情分析と独立なローカル分析・設定読み込み・セッション検索は並行実行）
+
+    統合モードでは感情分析を応答生成と同じ呼び出しで行うため、感情分析ステージを持たない。
+    """
+    message = request.message
+
+    async def emotion() -> Dict[str, Any]:
+        return await analyze_emotion_async(message, md_configs, priority, deadline)
+
+    graph = StageGraph(name)
+    if not fused:
+        graph.add("emotion", emotion)
+    graph = (
+        graph
+        .add("needs", lambda: NeedsAnalyzer(md_configs).analyze(message))
+        .add("resort", lambda needs: calculate_resort_scores(message, needs, request.rally_count, md_configs), "needs")
+        .add("crisis", lambda: detect_crisis_level(message), offload=False)
+        .add("character", get_character_config)
+        .add("session", lambda: resolve_session_id(request.session_id))
+    )
+
+    # 感情強度・危機レベルから応答生成モデルのティアを選択
+    if fused:
+        return graph.add("model_tier", select_model_tier_before_analysis, "crisis", offload=False)
+    return graph.add("model_tier", select_model_tier, "emotion", "crisis", offload=False)
+
+def _analysis_result(stages: Dict[str, Any]) -> Dict[str, Any]:
+    """ステージ結果から応答生成前の分析（ニーズ・感情・RESORT・危機レベル）を取り出す"""
+    return {
+        "needs_analysis": stages["needs"],
+        "emotion_analysis": stages["emotion"],
+        "resort_scores": stages["resort"],
+        "model_tier": stages["model_tier"].name,
+        # キーワード検出と感情分析の危機レベルの高い方
+        "crisis_level": max(stages["crisis"], stages["emotion"].get("crisis_level") or 0)
     }
 
-    # YAMLブロックを抽出
-    yaml_blocks = re.findall(r'```yaml\n(.*?)\n```', md_content, re.DOTALL)
+# 危機ファストパス（上流の感情分析を待たずに応答）
+CRISIS_CATEGORY = "危機対応"
+DEFAULT_CRISIS_RESPONSE = {
+    "safety_response": (
+        "とてもつらい気持ちを打ち明けてくださって、ありがとうございます。"
+        "どうか今すぐ、信頼できる人や専門の相談窓口に気持ちを聞いてもらってください。\n"
+        "・いのちの電話：0570-783-556\n"
+        "・よりそいホットライン：0120-279-338（24時間・無料）\n"
+        "・命の危険が迫っているときは119番へ"
+    ),
+    "crisis_prompt": (
+        "【危機対応モード】\n"
+        "- 占い・アドバイス・解決策の提示は行わない\n"
+        "- 苦しさへの深い共感を伝え、信頼できる人や専門の相談窓口に頼ってよいことを穏やかに伝える\n"
+        "- 命の危険がある場合は119番への連絡を促す"
+    )
+}
+
+def load_crisis_response(md_content: str) -> Dict[str, str]:
+    """危機対応MDから定型安全応答と危機対応プロンプトを読み込み（欠けている項目は既定値）"""
+    import re
 
-    for block in yaml_blocks:
+    rules = dict(DEFAULT_CRISIS_RESPONSE)
+    for block in re.findall(r'```yaml\n(.*?)\n```', md_content or "", re.DOTALL):
         try:
             yaml_data = yaml.safe_load(block)
-            if yaml_data:
-                # 各セクションのルールを統合
-                if "relationship_keywords" in yaml_data:
-                    rules["relationship"] = yaml_data["relationship_keywords"]
-                if "emotion_keywords" in yaml_data:
-                    rules["emotion"] = yaml_data["emotion_keywords"]
-                    if "special_patterns" in yaml_data:
-                        rules["emotion"]["special_patterns"] = yaml_data["special_patterns"]
-                    if "default_emotion" in yaml_data:
-                        rules["emotion"]["default_emotion"] = yaml_data["default_emotion"]
-                if "situation_keywords" in yaml_data:
-                    rules["situation"] = yaml_data["situation_keywords"]
-                if "objective_keywords" in yaml_data:
-                    rules["objective"] = yaml_data["objective_keywords"]
-                if "resource_keywords" in yaml_data:
-                    rules["resource"] = yaml_data["resource_keywords"]
-                    if "calculation_logic" in yaml_data:
-                        rules["resource"]["calculation_logic"] = yaml_data["calculation_logic"]
-                if "time_keywords" in yaml_data:
-                    rules["time"] = yaml_data["time_keywords"]
-                if "fortune_mapping" in yaml_data:
-                    rules["fortune_mapping"] = yaml_data["fortune_mapping"]
-                if "timing_calculation" in yaml_data:
-                    rules["timing_calculation"] = yaml_data["timing_calculation"]
-        except:
+        except yaml.YAMLError as e:
+            print(f"危機対応MD読み込みエラー: {e}")
             continue
-
+        if isinstance(yaml_data, dict):
+            for key in DEFAULT_CRISIS_RESPONSE:
+                if isinstance(yaml_data.get(key), str) and yaml_data[key].strip():
+                    rules[key] = yaml_data[key].strip()
     return rules
 
-def calculate_resort_scores(message: str, needs_analysis: Dict[str, float], rally_count: int, md_configs: Dict[str, str] = None) -> Dict[str, int]:
-    """RESORT 6次元スコア計算（v3.2仕様 - MDベース）"""
-    combined_text = message.lower()
-    scores = {}
+def crisis_fast_path_mode(crisis_level: int) -> Optional[str]:
+    """危機レベルに応じたファストパス（"safety": 定型安全応答 / "prompt": 危機対応プロンプト / None: 通常処理）"""
+    if not AppConfig.CRISIS_FAST_PATH_ENABLED:
+        return None
+    if crisis_level >= AppConfig.CRISIS_SAFETY_RESPONSE_LEVEL:
+        return "safety"
+    if crisis_level >= AppConfig.CRISIS_PRIORITY_LEVEL:
+        return "prompt"
+    return None
+
+def _crisis_turn_graph(
+    request: ChatMessage,
+    md_configs: Dict[str, str],
+    crisis_level: int,
+    deadline: Optional[Deadline] = None
+) -> StageGraph:
+    """危機ターンの応答生成前ステージ（感情分析は上流を呼ばずに簡易分析で行う）"""
+    def emotion() -> Dict[str, Any]:
+        analysis_result = analyze_emotion_fallback(request.message)
+        analysis_result["crisis_level"] = max(analysis_result.get("crisis_level") or 0, crisis_level)
+        return analysis_result
+
+    graph = _chat_turn_graph(request, md_configs, Priority.CRISIS, deadline, fused=True, name="crisis")
+    return graph.add("emotion", emotion, offload=False)
+
+def generate_crisis_prompt(md_configs: Dict[str, str], character_config: str) -> str:
+    """危機対応プロンプト（キャラクター設定＋危機対応MDの指示、リクエスト間で不変）"""
+    return (
+        PromptBuilder("crisis_turn")
+        .static(character_config)
+        .static(load_crisis_response(md_configs.get('crisis_response', ''))["crisis_prompt"])
+        .render()
+    )
+
+async def _crisis_chat_turn(
+    request: ChatMessage,
+    md_configs: Dict[str, str],
+    stages: Dict[str, Any],
+    openai_manager,
+    mode: str,
+    deadline: Optional[Deadline] = None
+) -> str:
+    """危機ターンの応答（定型安全応答、または危機対応プロンプトで最優先レーンから1回だけ生成）"""
+    safety_response = load_crisis_response(md_configs.get('crisis_response', ''))["safety_response"]
+    metrics.incr(f"crisis.fast_path.{mode}")
+    if mode == "safety":
+        return safety_response
 
-    # MDファイルからルールを読み込み
-    if md_configs and "resort_v32_analysis" in md_configs:
-        rules = load_resort_rules(md_configs["resort_v32_analysis"])
-    else:
-        # フォールバック: 簡易ルール
-        rules = {}
-
-    # 1. Relationship (関係性の深さ・親密度)
-    if rules.get("relationship"):
-        rel_rules = rules["relationship"]
-        if "high_intimacy" in rel_rules and any(word in combined_text for word in rel_rules["high_intimacy"].get("keywords", [])):
-            scores["relationship"] = rel_rules["high_intimacy"].get("score", 7)
-        elif "medium_intimacy" in rel_rules and any(word in combined_text for word in rel_rules["medium_intimacy"].get("keywords", [])):
-            scores["relationship"] = rel_rules["medium_intimacy"].get("score", 5)
-        else:
-            scores["relationship"] = max(1, rally_count)
-    else:
-        # フォールバック
-        if any(word in combined_text for word in ["彼氏", "彼女", "恋人"]):
-            scores["relationship"] = 7
-        elif any(word in combined_text for word in ["友人", "職場", "家族"]):
-            scores["relationship"] = 5
-        else:
-            scores["relationship"] = max(1, rally_count)
-
-    # 2. Emotion (感情の強度・種類)
-    if rules.get("emotion"):
-        emo_rules = rules["emotion"]
-        strong_emotions = emo_rules.get("strong_emotions", [])
-        emotion_count = sum(1 for word in strong_emotions if word in combined_text)
-
-        if emotion_count > 0:
-            scores["emotion"] = min(8, 5 + emotion_count)
-        elif "special_patterns" in emo_rules and "contact_anxiety" in emo_rules["special_patterns"]:
-            contact_pattern = emo_rules["special_patterns"]["contact_anxiety"].get("pattern", [])
-            if len(contact_pattern) >= 2 and all(word in combined_text for word in contact_pattern):
-                scores["emotion"] = emo_rules["special_patterns"]["contact_anxiety"].get("score", 7)
-            else:
-                scores["emotion"] = max(1, int(sum(needs_analysis.values()) * 5))
-        else:
-            scores["emotion"] = max(1, int(sum(needs_analysis.values()) * 5))
-    else:
-        # フォールバック
-        emotion_indicators = ["不安", "心配", "寂しい", "辛い", "悲しい", "怒り"]
-        emotion_count = sum(1 for word in emotion_indicators if word in combined_text)
-        if emotion_count > 0:
-            scores["emotion"] = min(8, 5 + emotion_count)
-        elif "連絡" in combined_text and "ない" in combined_text:
-            scores["emotion"] = 7
-        else:
-            scores["emotion"] = max(1, int(sum(needs_analysis.values()) * 5))
-
-    # 3. Situation (状況の緊急度・深刻度)
-    if rules.get("situation"):
-        sit_rules = rules["situation"]
-        if "urgency_high" in sit_rules and any(word in combined_text for word in sit_rules["urgency_high"].get("keywords", [])):
-            scores["situation"] = sit_rules["urgency_high"].get("score", 8)
-        elif "contact_situation" in sit_rules:
-            contact_pattern = sit_rules["contact_situation"].get("pattern", [])
-            if len(contact_pattern) >= 2 and all(word in combined_text for word in contact_pattern):
-                scores["situation"] = sit_rules["contact_situation"].get("score", 5)
-            else:
-                scores["situation"] = max(1, min(7, rally_count + 2))
-        else:
-            scores["situation"] = max(1, min(7, rally_count + 2))
-    else:
-        # フォールバック
-        urgency_words = ["緊急", "今すぐ", "どうしよう", "大変"]
-        if any(word in combined_text for word in urgency_words):
-            scores["situation"] = 8
-        elif "連絡" in combined_text and "ない" in combined_text:
-            scores["situation"] = 5
-        else:
-            scores["situation"] = max(1, min(7, rally_count + 2))
+    tier = stages["model_tier"]
+    try:
+        return await openai_manager.generate_chat_response(
+            generate_crisis_prompt(md_configs, stages["character"]), request.message,
+            model=tier.model, max_tokens=tier.max_tokens,
+            endpoint="chat_crisis", priority=Priority.CRISIS, deadline=deadline
+        )
+    except Exception as e:
+        print(f"危機対応生成エラー: {e}")
+        metrics.incr("crisis.response_fallback")
+        return safety_response
 
-    # 4. Objective (相談者の目的の明確さ)
-    if rules.get("objective"):
-        obj_rules = rules["objective"]
-        if "clear_purpose" in obj_rules and any(word in combined_text for word in obj_rules["clear_purpose"].get("keywords", [])):
-            scores["objective"] = obj_rules["clear_purpose"].get("score", 6)
-        else:
-            scores["objective"] = obj_rules.get("default", {}).get("score", 3)
-    else:
-        # フォールバック
-        if any(word in combined_text for word in ["どうしたら", "方法", "解決"]):
-            scores["objective"] = 6
-        else:
-            scores["objective"] = 3
-
-    # 5. Resource (相談者の心理的リソース)
-    if rules.get("resource"):
-        res_rules = rules["resource"]
-        positive_count = 0
-        negative_count = 0
-
-        if "positive" in res_rules:
-            positive_count = sum(1 for word in res_rules["positive"].get("keywords", []) if word in combined_text)
-        if "negative" in res_rules:
-            negative_count = sum(1 for word in res_rules["negative"].get("keywords", []) if word in combined_text)
-
-        if "calculation_logic" in res_rules:
-            calc_logic = res_rules["calculation_logic"]
-            if negative_count > positive_count:
-                scores["resource"] = calc_logic.get("if_negative_dominates", 3)
-            else:
-                scores["resource"] = calc_logic.get("default", 5)
-        else:
-            scores["resource"] = 3 if negative_count > positive_count else 5
-    else:
-        # フォールバック
-        positive_words = ["頑張る", "できる", "強い", "大丈夫"]
-        negative_words = ["疲れた", "無理", "限界", "もうダメ"]
-        positive_count = sum(1 for word in positive_words if word in combined_text)
-        negative_count = sum(1 for word in negative_words if word in combined_text)
-        scores["resource"] = 3 if negative_count > positive_count else 5
-
-    # 6. Time (時間的要因・タイミング)
-    if rules.get("time"):
-        time_rules = rules["time"]
-        if "temporal_indicators" in time_rules and any(word in combined_text for word in time_rules["temporal_indicators"].get("keywords", [])):
-            scores["time"] = time_rules["temporal_indicators"].get("score", 8)
-        elif "contact_temporal" in time_rules:
-            contact_pattern = time_rules["contact_temporal"].get("pattern", [])
-            if any(word in combined_text for word in contact_pattern):
-                scores["time"] = time_rules["contact_temporal"].get("score", 8)
-            else:
-                scores["time"] = max(1, rally_count)
-        else:
-            scores["time"] = max(1, rally_count)
-    else:
-        # フォールバック
-        time_words = ["最近", "今", "以前から", "長い間", "いつも"]
-        if any(word in combined_text for word in time_words):
-            scores["time"] = 8
-        elif "連絡" in combined_text:
-            scores["time"] = 8
-        else:
-            scores["time"] = max(1, rally_count)
+def _record_tier_latency(tier: ModelTier, started: float):
+    """ティア別の応答生成時間を記録"""
+    metrics.incr(f"chat_tier.{tier.name}.turns")
+    metrics.record(f"chat_tier.{tier.name}", time.perf_counter() - started)
 
-    # スコアを1-10に正規化
-    for key in scores:
-        scores[key] = min(10, max(1, scores[key]))
+def _finalize_chat_turn(
+    request: ChatMessage,
+    ai_response: str,
+    selected_category: str,
+    analysis: Dict[str, Any],
+    md_configs: Dict[str, str],
+    session_id: Optional[str] = None
+) -> ChatResponse:
+    """占い提案判定と履歴保存を行い、最終レスポンスを構築"""
+    needs_analysis = analysis["needs_analysis"]
+    resort_scores = analysis["resort_scores"]
+
+    version = emotion_md_version(md_configs)
+
+    # 占い提案タイミング計算
+    fortune_timing_score = calculate_fortune_timing(resort_scores, needs_analysis, md_configs)
+
+    # 占い提案判定（危機ターンでは提案しない）
+    crisis_level = analysis.get("crisis_level", 0)
+    suggested_fortune = None
+    if fortune_timing_score >= AppConfig.RESORT_ANALYSIS_THRESHOLD and crisis_level < AppConfig.CRISIS_PRIORITY_LEVEL:
+        suggested_fortune = suggest_fortune_menu(resort_scores, needs_analysis, md_configs)
+
+    # セッション継続機能付きでチャット履歴保存
+    session_id = save_chat_interaction(
+        session_id=session_id or request.session_id,
+        user_message=request.message,
+        ai_response=ai_response,
+        analysis_data={
+            "category": selected_category,
+            "needs_analysis": needs_analysis,
+            "emotion_analysis": analysis["emotion_analysis"],
+            "resort_scores": resort_scores,
+            "fortune_timing_score": fortune_timing_score,
+            "suggested_fortune": suggested_fortune,
+            "rally_count": request.rally_count,
+            "user_data": request.user_data or {},
+            "model_tier": analysis.get("model_tier"),
+            "crisis_level": crisis_level,
+            "crisis_fast_path": analysis.get("crisis_fast_path"),
+            # モデルによる分析結果のみ版を記録（起動時のキャッシュ事前投入に使用）
+            "emotion_md_version": version if emotion_cache.peek(request.message, version) else None
+        }
+    )
+
+    return ChatResponse(
+        response=ai_response,
+        category=selected_category,
+        needs_analysis=needs_analysis,
+        emotion_analysis=analysis["emotion_analysis"],
+        resort_scores=resort_scores,
+        fortune_timing_score=fortune_timing_score,
+        suggested_fortune=suggested_fortune,
+        session_id=session_id,
+        model_tier=analysis.get("model_tier"),
+        crisis_level=crisis_level
+    )
+
+def _fallback_chat_response(request: ChatMessage) -> ChatResponse:
+    """エラー時のフォールバックレスポンス"""
+    return ChatResponse(
+        response=generate_fallback_response(request.message),
+        category="深い共感",
+        needs_analysis={k: 0.0 for k in ["complaining_listening", "emotion_organizing", "recognition_desire", "encouragement", "loneliness"]},
+        emotion_analysis={"polarity": 0.0, "intensity": 0.0, "dominant_emotion": "ニュートラル"},
+        resort_scores={k: 1 for k in ["relationship", "emotion", "situation", "objective", "resource", "time"]},
+        fortune_timing_score=0,
+        session_id=request.session_id or "fallback_session"
+    )
+
+async def _engine_chat_turn(
+    request: ChatMessage,
+    md_configs: Dict[str, str],
+    stages: Dict[str, Any],
+    openai_manager,
+    priority: Priority = Priority.CHAT,
+    deadline: Optional[Deadline] = None
+) -> Tuple[str, str]:
+    """柔軟レスポンス生成エンジンで応答を生成し、(応答文, カテゴリ) を返す"""
+    needs_analysis = stages["needs"]
+    tier = stages["model_tier"]
+
+    # 柔軟レスポンス生成エンジンを使用
+    try:
+        # 全プロバイダのサーキットOPEN中は上流を待たずにテンプレート応答
+        if openai_manager.rejecting("chat"):
+            raise CircuitOpenError("openai サーキットOPEN中")
+
+        response_engine = _build_response_engine()
+
+        # レスポンス生成（OpenAI連携対応）
+        response_result = await response_engine.get_best_response(
+            message=request.message,
+            emotion_analysis=stages["emotion"],
+            resort_scores=stages["resort"],
+            rally_count=request.rally_count,
+            openai_manager=openai_manager,
+            priority=priority,
+            deadline=deadline,
+            tier=tier
+        )
 
-    return scores
+        ai_response = response_result['response']
+        # 新システムで生成されたパターンをカテゴリとして使用
+        selected_category = response_result.get('pattern', 'unknown_pattern')
 
-def calculate_fortune_timing(resort_scores: Dict[str, int], needs_analysis: Dict[str, float], md_configs: Dict[str, str] = None) -> int:
-    """占いタイミングスコア計算（MDベース）"""
-    # MDファイルからルールを読み込み
-    if md_configs and "resort_v32_analysis" in md_configs:
-        rules = load_resort_rules(md_configs["resort_v32_analysis"])
-        timing_rules = rules.get("timing_calculation", {})
-
-        resort_weight = timing_rules.get("resort_weight", 0.4)
-        needs_weight = timing_rules.get("needs_weight", 0.6)
-    else:
-        # フォールバック
-        resort_weight = 0.4
-        needs_weight = 0.6
+        # デバッグ情報（開発時）
+        if AppConfig.DEBUG:
+            print(f"=== レスポンス生成結果 ===")
+            print(f"パターン: {response_result.get('pattern', 'unknown')}")
+            print(f"スコア: {response_result.get('score', 0)}")
+            print(f"理由: {response_result.get('reasoning', 'unknown')}")
 
-    total_resort = sum(resort_scores.values()) / len(resort_scores)
-    needs_strength = sum(needs_analysis.values()) * 10
+    except Exception as response_error:
+        print(f"柔軟レスポンス生成エラー: {response_error}")
 
-    timing_score = int(total_resort * resort_weight + needs_strength * needs_weight)
-    return min(100, max(0, timing_score))
+        # フォールバック：従来のカテゴリ選択システム
+        selected_category = CategorySelector(md_configs).select_category(needs_analysis, request.rally_count)
 
-def suggest_fortune_menu(resort_scores: Dict[str, int], needs_analysis: Dict[str, float], md_configs: Dict[str, str] = None) -> Optional[str]:
-    """占いメニュー提案（MDベース）"""
-    max_resort_key = max(resort_scores, key=resort_scores.get)
+        if isinstance(response_error, CircuitOpenError):
+            ai_response = generate_fallback_response(request.message)
+        else:
+            system_prompt = generate_system_prompt(
+                needs_analysis, selected_category, request.rally_count,
+                md_configs, stages["character"]
+            )
 
-    # MDファイルからルールを読み込み
-    if md_configs and "resort_v32_analysis" in md_configs:
-        rules = load_resort_rules(md_configs["resort_v32_analysis"])
-        fortune_mapping = rules.get("fortune_mapping", {})
-    else:
-        # フォールバック
-        fortune_mapping = {
-            "romance": "相手の本音占い",
-            "relationship": "人間関係修復",
-            "emotion": "恋愛進展タイミング",
-            "spirit": "運命の相手探し",
-            "occupation": "総合運勢・人生指針"
-        }
+            ai_response = await openai_manager.generate_chat_response(
+                system_prompt, request.message, model=tier.model, max_tokens=tier.max_tokens,
+                endpoint="chat_fallback", priority=priority, deadline=deadline
+            )
 
-    default_menu = fortune_mapping.get("default", "総合運勢・人生指針")
-    return fortune_mapping.get(max_resort_key, default_menu)
+    return ai_response, selected_category
 
-def generate_fallback_response(message: str) -> str:
-    """フォールバック応答生成"""
-    return "お話を聞かせていただき、ありがとうございます。あなたの気持ちに寄り添いたいと思います。どのようなことでも、遠慮なくお話しください。"
+async def _fused_chat_turn(
+    request: ChatMessage,
+    md_configs: Dict[str, str],
+    stages: Dict[str, Any],
+    openai_manager,
+    priority: Priority = Priority.CHAT,
+    deadline: Optional[Deadline] = None
+) -> Tuple[str, str]:
+    """統合モードで応答を生成し、(応答文, カテゴリ) を返す
+
+    感情分析は stages["emotion"] に格納する（欠損・不正なフィールドは簡易分析で補完）。
+    """
+    needs_analysis = stages["needs"]
+    tier = stages["model_tier"]
+    selected_category = CategorySelector(md_configs).select_category(needs_analysis, request.rally_count)
+    ai_response = None
+
+    try:
+        # 全プロバイダのサーキットOPEN中は上流を待たずにテンプレート応答
+        if openai_manager.rejecting("chat_fused"):
+            raise CircuitOpenError("openai サーキットOPEN中")
+
+        fused_prompt = generate_fused_prompt(
+            needs_analysis, selected_category, request.rally_count,
+            md_configs, stages["character"]
+        )
+        result_text = await openai_manager.create_chat_completion(
+            [
+                {"role": "system", "content": fused_prompt},
+                {"role": "user", "content": request.message}
+            ],
+            model=tier.model,
+            max_tokens=AppConfig.CHAT_FUSED_MAX_TOKENS,
+            endpoint="chat_fused",
+            priority=priority,
+            deadline=deadline
+        )
+        stages["emotion"], ai_response = parse_fused_turn(result_text, request.message)
+
+    except Exception as fused_error:
+        print(f"統合モード生成エラー: {fused_error}")
+        stages["emotion"] = analyze_emotion_fallback(request.message)
+        if isinstance(fused_error, CircuitOpenError):
+            return generate_fallback_response(request.message), selected_category
+
+    if ai_response is None:
+        # 応答文が取り出せなければ従来のカテゴリ選択システムで生成
+        metrics.incr("chat_fused.response_fallback")
+        system_prompt = generate_system_prompt(
+            needs_analysis, selected_category, request.rally_count,
+            md_configs, stages["character"]
+        )
+        ai_response = await openai_manager.generate_chat_response(
+            system_prompt, request.message, model=tier.model, max_tokens=tier.max_tokens,
+            endpoint="chat_fallback", priority=priority, deadline=deadline
+        )
+    elif "chat_fused" in AppConfig.SENTENCE_LIMIT_ENDPOINTS:
+        ai_response = limit_sentences(ai_response, AppConfig.MAX_RESPONSE_SENTENCES)
+
+    return ai_response, selected_category
 
 # チャットエンドポイント
 @chat_router.post("/chat", response_model=ChatResponse)
@@ -654,110 +1125,284 @@ async def chat_endpoint(
 ):
     """メインチャット応答エンドポイント"""
     try:
-        # MDファイル設定でインスタンス作成
-        needs_analyzer = NeedsAnalyzer(md_configs)
-        category_selector = CategorySelector(md_configs)
-        character_config = get_character_config()
+        # 危機レベルは上流呼び出しより先に判定
+        crisis_level = detect_crisis_level(request.message)
+        crisis_mode = crisis_fast_path_mode(crisis_level)
+        priority = _turn_priority(crisis_level)
+        deadline = Deadline(AppConfig.CHAT_TURN_DEADLINE_SECONDS)
+        fused = AppConfig.CHAT_FUSED_ANALYSIS_ENABLED
+
+        if crisis_mode:
+            graph = _crisis_turn_graph(request, md_configs, crisis_level, deadline)
+        else:
+            graph = _chat_turn_graph(request, md_configs, priority, deadline, fused)
+        stages = await graph.run()
+        tier = stages["model_tier"]
+        generation_started = time.perf_counter()
+
+        if crisis_mode:
+            ai_response = await _crisis_chat_turn(request, md_configs, stages, openai_manager, crisis_mode, deadline)
+            selected_category = CRISIS_CATEGORY
+        elif fused:
+            ai_response, selected_category = await _fused_chat_turn(
+                request, md_configs, stages, openai_manager, priority, deadline
+            )
+        else:
+            ai_response, selected_category = await _engine_chat_turn(
+                request, md_configs, stages, openai_manager, priority, deadline
+            )
+        analysis = _analysis_result(stages)
+        analysis["crisis_fast_path"] = crisis_mode
+
+        _record_tier_latency(tier, generation_started)
+        graph.record("generation", generation_started)
+
+        history_started = time.perf_counter()
+        response = await asyncio.to_thread(
+            _finalize_chat_turn, request, ai_response, selected_category, analysis, md_configs, stages["session"]
+        )
+        graph.record("history", history_started)
+        graph.record("turn", graph.started)
+        return response
+
+    except Exception as e:
+        print(f"チャットサービスエラー: {str(e)}")
+
+        # エラー時のフォールバック
+        return _fallback_chat_response(request)
+
+def _sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Server-Sent Events形式の1イベントを整形"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def stream_chat_turn(
+    request: ChatMessage,
+    md_configs: Dict[str, str],
+    openai_manager
+) -> AsyncIterator[Dict[str, Any]]:
+    """1ターン分のチャット処理を段階的イベントとして生成
+
+    analysis → token（複数） → done の順で辞書を返す。
+    """
+    # 危機レベルは上流呼び出しより先に判定
+    crisis_level = detect_crisis_level(request.message)
+    crisis_mode = crisis_fast_path_mode(crisis_level)
+    priority = _turn_priority(crisis_level)
+    deadline = Deadline(AppConfig.CHAT_TURN_DEADLINE_SECONDS)
+
+    fused = AppConfig.CHAT_FUSED_ANALYSIS_ENABLED
+    if crisis_mode:
+        graph = _crisis_turn_graph(request, md_configs, crisis_level, deadline)
+    else:
+        graph = _chat_turn_graph(request, md_configs, priority, deadline, fused)
 
-        # ニーズ分析
-        needs_analysis = needs_analyzer.analyze(request.message)
+    try:
+        stages = await graph.run()
+    except Exception as e:
+        print(f"チャットサービスエラー: {str(e)}")
+        fallback = _fallback_chat_response(request)
+        yield {"type": "token", "text": fallback.response}
+        yield {"type": "done", **fallback.model_dump()}
+        return
+
+    needs_analysis = stages["needs"]
+    tier = stages["model_tier"]
+    generation_started = time.perf_counter()
+
+    if crisis_mode:
+        analysis = {**_analysis_result(stages), "crisis_fast_path": crisis_mode}
+        yield {"type": "analysis", **analysis}
+        ai_response = await _crisis_chat_turn(request, md_configs, stages, openai_manager, crisis_mode, deadline)
+        selected_category = CRISIS_CATEGORY
+        yield {"type": "token", "text": ai_response}
+    elif fused:
+        # 統合モードは感情分析と応答文が同時に確定するため、分析結果の直後に応答文をまとめて送信
+        ai_response, selected_category = await _fused_chat_turn(
+            request, md_configs, stages, openai_manager, priority, deadline
+        )
+        analysis = _analysis_result(stages)
+        yield {"type": "analysis", **analysis}
+        yield {"type": "token", "text": ai_response}
+    else:
+        # 分析結果を最初に送信
+        analysis = _analysis_result(stages)
+        yield {"type": "analysis", **analysis}
 
-        # 高度な感情分析を先に実行
-        emotion_analysis = analyze_emotion_advanced(request.message, md_configs)
-        resort_scores = calculate_resort_scores(request.message, needs_analysis, request.rally_count, md_configs)
+        chunks = []
+        response_result = None
 
-        # 柔軟レスポンス生成エンジンを使用
         try:
-            # プロジェクトルートからsystemsへのパスを構築 (backend/../systems)
-            project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-            systems_path = os.path.join(project_root, "systems")
-            response_engine = FlexibleResponseEngine(systems_path)
+            # 全プロバイダのサーキットOPEN中は上流を待たずにテンプレート応答
+            if openai_manager.rejecting("chat"):
+                raise CircuitOpenError("openai サーキットOPEN中")
 
-            # レスポンス生成（OpenAI連携対応）
-            response_result = await response_engine.get_best_response(
+            response_engine = _build_response_engine()
+
+            async for event in response_engine.stream_best_response(
                 message=request.message,
-                emotion_analysis=emotion_analysis,
-                resort_scores=resort_scores,
+                emotion_analysis=analysis["emotion_analysis"],
+                resort_scores=analysis["resort_scores"],
                 rally_count=request.rally_count,
-                openai_manager=openai_manager
-            )
+                openai_manager=openai_manager,
+                priority=priority,
+                deadline=deadline,
+                tier=tier
+            ):
+                if 'token' in event:
+                    chunks.append(event['token'])
+                    yield {"type": "token", "text": event['token']}
+                else:
+                    response_result = event['result']
 
             ai_response = response_result['response']
-            # 新システムで生成されたパターンをカテゴリとして使用
             selected_category = response_result.get('pattern', 'unknown_pattern')
 
-            # デバッグ情報（開発時）
-            if AppConfig.DEBUG:
-                print(f"=== レスポンス生成結果 ===")
-                print(f"パターン: {response_result.get('pattern', 'unknown')}")
-                print(f"スコア: {response_result.get('score', 0)}")
-                print(f"理由: {response_result.get('reasoning', 'unknown')}")
-
         except Exception as response_error:
             print(f"柔軟レスポンス生成エラー: {response_error}")
 
             # フォールバック：従来のカテゴリ選択システム
-            selected_category = category_selector.select_category(needs_analysis, request.rally_count)
-            system_prompt = generate_system_prompt(
-                needs_analysis, selected_category, request.rally_count,
-                md_configs, character_config
-            )
-
-            ai_response = await openai_manager.generate_chat_response(
-                system_prompt, request.message
-            )
-
-        # 占い提案タイミング計算
-        fortune_timing_score = calculate_fortune_timing(resort_scores, needs_analysis, md_configs)
-
-        # 占い提案判定
-        suggested_fortune = None
-        if fortune_timing_score >= AppConfig.RESORT_ANALYSIS_THRESHOLD:
-            suggested_fortune = suggest_fortune_menu(resort_scores, needs_analysis, md_configs)
-
-        # セッション継続機能付きでチャット履歴保存
-        session_id = save_chat_interaction(
-            session_id=request.session_id,
-            user_message=request.message,
-            ai_response=ai_response,
-            analysis_data={
-                "category": selected_category,
-                "needs_analysis": needs_analysis,
-                "emotion_analysis": emotion_analysis,
-                "resort_scores": resort_scores,
-                "fortune_timing_score": fortune_timing_score,
-                "suggested_fortune": suggested_fortune,
-                "rally_count": request.rally_count,
-                "user_data": request.user_data or {}
-            }
-        )
+            selected_category = CategorySelector(md_configs).select_category(needs_analysis, request.rally_count)
 
-        return ChatResponse(
-            response=ai_response,
-            category=selected_category,
-            needs_analysis=needs_analysis,
-            emotion_analysis=emotion_analysis,
-            resort_scores=resort_scores,
-            fortune_timing_score=fortune_timing_score,
-            suggested_fortune=suggested_fortune,
-            session_id=session_id
+            if chunks:
+                ai_response = "".join(chunks).strip()
+            elif isinstance(response_error, CircuitOpenError):
+                ai_response = generate_fallback_response(request.message)
+                yield {"type": "token", "text": ai_response}
+            else:
+                system_prompt = generate_system_prompt(
+                    needs_analysis, selected_category, request.rally_count,
+                    md_configs, stages["character"]
+                )
+                async for token in openai_manager.stream_chat_response(
+                    system_prompt, request.message, model=tier.model, max_tokens=tier.max_tokens,
+                    endpoint="chat_fallback", priority=priority, deadline=deadline
+                ):
+                    chunks.append(token)
+                    yield {"type": "token", "text": token}
+                ai_response = "".join(chunks).strip()
+
+    _record_tier_latency(tier, generation_started)
+    graph.record("generation", generation_started)
+
+    history_started = time.perf_counter()
+    try:
+        final = await asyncio.to_thread(
+            _finalize_chat_turn, request, ai_response, selected_category, analysis, md_configs, stages["session"]
         )
-
     except Exception as e:
         print(f"チャットサービスエラー: {str(e)}")
+        final = _fallback_chat_response(request)
+        final.response = ai_response
+    graph.record("history", history_started)
+    graph.record("turn", graph.started)
 
-        # エラー時のフォールバック
-        fallback_response = generate_fallback_response(request.message)
-
-        return ChatResponse(
-            response=fallback_response,
-            category="深い共感",
-            needs_analysis={k: 0.0 for k in ["complaining_listening", "emotion_organizing", "recognition_desire", "encouragement", "loneliness"]},
-            emotion_analysis={"polarity": 0.0, "intensity": 0.0, "dominant_emotion": "ニュートラル"},
-            resort_scores={k: 1 for k in ["relationship", "emotion", "situation", "objective", "resource", "time"]},
-            fortune_timing_score=0,
-            session_id=request.session_id or "fallback_session"
-        )
+    yield {"type": "done", **final.model_dump()}
+
+# ストリーミングチャットエンドポイント（SSE）
+@chat_router.post("/chat/stream")
+async def chat_stream_endpoint(
+    request: ChatMessage,
+    md_configs: Dict[str, str] = Depends(get_md_configs),
+    openai_manager = Depends(get_openai_manager)
+):
+    """チャット応答をServer-Sent Eventsでストリーミング
+
+    analysis（分析結果） → token（応答断片） → done（最終メタデータとsession_id）
+    """
+
+    async def event_stream():
+        async for event in stream_chat_turn(request, md_configs, openai_manager):
+            event_type = event.pop("type")
+            yield _sse_event(event_type, event)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# WebSocketチャット（接続単位でセッションを束縛）
+@chat_ws_router.websocket("/ws/chat")
+async def chat_websocket(
+    websocket: WebSocket,
+    session_id: Optional[str] = None,
+    rally_count: int = 0
+):
+    """永続WebSocketチャットチャネル
+
+    接続時にセッション・設定・ユーザーデータを一度だけ束縛し、
+    各ターンは {"message": "..."} のみを受け取って
+    analysis / token / done フレームを返す。
+    初回に {"type": "init", "user_data": {...}} を送るとユーザーデータを束縛できる。
+    """
+    await websocket.accept()
+
+    # 依存関係は接続ごとに一度だけ解決
+    md_configs = get_md_configs()
+    openai_manager = get_openai_manager()
+    user_data = None
+
+    await websocket.send_json({"type": "ready", "session_id": session_id})
+
+    try:
+        while True:
+            raw = await websocket.receive_text()
+            try:
+                payload = json.loads(raw)
+            except json.JSONDecodeError:
+                await websocket.send_json({"type": "error", "detail": "JSON形式で送信してください"})
+                continue
+            if not isinstance(payload, dict):
+                await websocket.send_json({"type": "error", "detail": "JSONオブジェクトで送信してください"})
+                continue
+
+            if payload.get("type") == "init":
+                try:
+                    bound = ChatMessage.model_validate({
+                        "message": "",
+                        "user_data": payload.get("user_data") or user_data,
+                        "session_id": payload.get("session_id") or session_id
+                    })
+                except ValidationError as e:
+                    await websocket.send_json({"type": "error", "detail": f"初期化データが不正です: {e.errors()}"})
+                    continue
+                user_data, session_id = bound.user_data, bound.session_id
+                await websocket.send_json({"type": "ready", "session_id": session_id})
+                continue
+
+            message = str(payload.get("message", "")).strip()
+            if not message:
+                await websocket.send_json({"type": "error", "detail": "メッセージが空です"})
+                continue
+
+            try:
+                turn = ChatMessage(
+                    message=message,
+                    user_data=user_data,
+                    chat_history=None,
+                    rally_count=rally_count + 1,
+                    session_id=session_id
+                )
+            except ValidationError as e:
+                await websocket.send_json({"type": "error", "detail": f"メッセージが不正です: {e.errors()}"})
+                continue
+            rally_count = turn.rally_count
+
+            async for event in stream_chat_turn(turn, md_configs, openai_manager):
+                if event["type"] == "done" and event.get("session_id") != "fallback_session":
+                    session_id = event["session_id"]
+                await websocket.send_json(event)
+
+    except WebSocketDisconnect:
+        if AppConfig.DEBUG:
+            print(f"WebSocket切断: session_id={session_id}")
+    except Exception as e:
+        print(f"WebSocketチャットエラー: {e}")
+        try:
+            await websocket.send_json({"type": "error", "detail": "チャット処理エラー"})
+            await websocket.close(code=1011)
+        except Exception:
+            pass
 
 # ログエンドポイント
 @chat_router.post("/log")
@@ -775,6 +1420,18 @@ async def log_endpoint(log_data: dict):
         print(f"ログエラー: {str(e)}")
         raise HTTPException(status_code=500, detail="ログ処理エラー")
 
+# 占いエンドポイント用の静的指示（リクエスト間で不変）
+CHAT_FORTUNE_INSTRUCTIONS = """
+あなたは霊能師「蒼司」として、末尾の「今回のリクエスト情報」にある占いを実行してください。
+
+占い結果は以下の特徴で生成してください：
+- 神秘的で魅力的な表現
+- 具体的で的確な洞察
+- 前向きで建設的なアドバイス
+- 3-5文程度での構成
+- 蒼司らしい温かく上品な口調
+"""
+
 # JavaScript互換性のための占い実行エンドポイント
 @chat_router.post("/fortune")
 async def fortune_endpoint(
@@ -787,21 +1444,13 @@ async def fortune_endpoint(
         user_data = request.get('user_data', {})
         specific_context = request.get('specific_context', '')
 
-        # 占い専用プロンプト生成
-        fortune_prompt = f"""
-あなたは霊能師「蒼司」として、以下の占いを実行してください：
-
-占いタイプ: {fortune_type}
-ユーザーデータ: {user_data}
-追加コンテキスト: {specific_context}
-
-占い結果は以下の特徴で生成してください：
-- 神秘的で魅力的な表現
-- 具体的で的確な洞察
-- 前向きで建設的なアドバイス
-- 3-5文程度での構成
-- 蒼司らしい温かく上品な口調
-"""
+        # 占い専用プロンプト生成（静的な指示を先頭、リクエスト固有の情報を末尾）
+        fortune_prompt = (
+            PromptBuilder("chat_fortune")
+            .static(CHAT_FORTUNE_INSTRUCTIONS)
+            .dynamic(f"占いタイプ: {fortune_type}\nユーザーデータ: {user_data}\n追加コンテキスト: {specific_context}")
+            .build()
+        )
 
         # OpenAI API呼び出し
         result = await openai_manager.generate_fortune_reading(
@@ -812,4 +1461,31 @@ async def fortune_endpoint(
 
     except Exception as e:
         print(f"占い実行エラー: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"占い実行エラー: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"占い実行エラー: {str(e)}")
+
+# 使用例・テスト関数
+def test_local_emotion_fallback():
+    """フォールバック分析が低確信度の推定を使わず、危機レベルをキーワード検出だけで決めることの確認"""
+    classifier = get_local_classifier()
+    if classifier is None:
+        print("ローカル分類器が無効または未学習のためスキップ（LOCAL_CLASSIFIER_ENABLED=true で実行）")
+        return
+
+    # 絶望プロファイル（代表危機レベル5）に低確信度で分類されやすい発話
+    for message in ["眠い", "何もしたくない", "どうでもいい"]:
+        prediction, confidence = classifier.predict_emotion(message)
+        local_result, _ = analyze_emotion_local(message)
+        fallback_result = analyze_emotion_fallback(message)
+        assert local_result["crisis_level"] == detect_crisis_level(message) == 0, message
+        assert fallback_result["crisis_level"] == 0, (message, fallback_result)
+        if confidence < AppConfig.EMOTION_LOCAL_CONFIDENCE_THRESHOLD:
+            assert fallback_result["analysis_quality"] != "local", (message, prediction["primary_emotion"], confidence)
+        print(f"{message}: {prediction['primary_emotion']} ({confidence:.2f}) → {fallback_result['primary_emotion']}")
+
+    # キーワードで検出される危機はそのまま
+    assert analyze_emotion_local("死にたい")[0]["crisis_level"] == 5
+    print("=== フォールバック感情分析テスト: OK ===")
+
+
+if __name__ == "__main__":
+    test_local_emotion_fallback()
@@ -14,7 +14,9 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from core.md_loader import get_md_configs
+from core.message_features import keyword_registry, message_features
 from core.openai_client import get_openai_manager
+from core.prompt_builder import PromptBuilder, PromptLayout
 from shared.config import AppConfig
 
 # 占い用のルーター
@@ -43,6 +45,24 @@ class FortuneMenuResponse(BaseModel):
     match_reasons: Dict[str, str]
     timing_scores: Dict[str, float]
 
+# 占いプロンプトの静的部分（リクエスト間で不変）
+FORTUNE_PROMPT_INSTRUCTIONS = """
+あなたは霊能師「蒼司」として、末尾の「今回のリクエスト情報」にある占いを実行してください。
+
+以下の形式で占い結果を生成してください：
+
+【占い結果】
+具体的で的確な洞察を3-4文で
+
+【ガイダンス】
+実践的なアドバイスを2-3文で
+
+【タイミング】
+最適な行動時期について1-2文で
+
+神秘的で魅力的な表現を使い、前向きで建設的な内容にしてください。
+"""
+
 # 占いシステムクラス
 class FortuneSystem:
     def __init__(self, md_configs: Dict[str, str]):
@@ -92,6 +112,11 @@ class FortuneSystem:
             }
         }
 
+        self.groups = {
+            menu_name: keyword_registry.define(f"fortune.{menu_name}", menu_config["keywords"])
+            for menu_name, menu_config in self.fortune_menus.items()
+        }
+
     def match_fortune_menu(
         self,
         resort_scores: Dict[str, int],
@@ -101,6 +126,7 @@ class FortuneSystem:
         """最適な占いメニューをマッチング"""
 
         menu_scores = {}
+        features = message_features(user_context)
 
         for menu_name, menu_config in self.fortune_menus.items():
             score = 0.0
@@ -111,9 +137,7 @@ class FortuneSystem:
                     score += resort_scores[target_resort] / 100.0
 
             # キーワードマッチング
-            for keyword in menu_config["keywords"]:
-                if keyword in user_context.lower():
-                    score += 0.3
+            score += features.count(self.groups[menu_name]) * 0.3
 
             # ニーズとの相関
             if "romance" in menu_config["target_resort"]:
@@ -133,6 +157,24 @@ class FortuneSystem:
             }
         }
 
+    def build_fortune_prompt(
+        self,
+        fortune_type: str,
+        user_data: Dict[str, Any],
+        context: str = ""
+    ) -> PromptLayout:
+        """占いプロンプトを構築（出力形式は静的プレフィックス、占い内容・ユーザー情報は末尾）"""
+        menu_config = self.fortune_menus[fortune_type]
+
+        return (
+            PromptBuilder("fortune")
+            .static(FORTUNE_PROMPT_INSTRUCTIONS)
+            .dynamic(f"占いタイプ: {fortune_type}\n占い内容: {menu_config['description']}")
+            .dynamic(f"ユーザー情報:\n{user_data}")
+            .dynamic(f"追加コンテキスト: {context}")
+            .build()
+        )
+
     async def execute_fortune(
         self,
         fortune_type: str,
@@ -145,33 +187,8 @@ class FortuneSystem:
         if fortune_type not in self.fortune_menus:
             raise ValueError(f"未対応の占いタイプ: {fortune_type}")
 
-        menu_config = self.fortune_menus[fortune_type]
-
         # 占い専用プロンプト構築
-        fortune_prompt = f"""
-あなたは霊能師「蒼司」として、以下の占いを実行してください：
-
-占いタイプ: {fortune_type}
-占い内容: {menu_config['description']}
-
-ユーザー情報:
-{user_data}
-
-追加コンテキスト: {context}
-
-以下の形式で占い結果を生成してください：
-
-【占い結果】
-具体的で的確な洞察を3-4文で
-
-【ガイダンス】
-実践的なアドバイスを2-3文で
-
-【タイミング】
-最適な行動時期について1-2文で
-
-神秘的で魅力的な表現を使い、前向きで建設的な内容にしてください。
-"""
+        fortune_prompt = self.build_fortune_prompt(fortune_type, user_data, context)
 
         try:
             # OpenAI API呼び出し
@@ -13,6 +13,8 @@ import yaml
 import re
 import os
 from core.openai_client import get_openai_manager
+from core.scheduler import Priority
+from shared.config import AppConfig
 
 # 挨拶用のルーター
 greeting_router = APIRouter()
@@ -163,7 +165,7 @@ class GreetingGenerator:
         print("✅ greeting_system.mdからシステムプロンプト構築完了")
         return greeting_system_content + dynamic_context
 
-    def generate_greeting(self, visit_count: int = 1, user_context: Optional[Dict] = None) -> str:
+    async def generate_greeting(self, visit_count: int = 1, user_context: Optional[Dict] = None) -> str:
         """AI挨拶文を生成"""
         try:
             # キャラクター設定読み込み
@@ -177,19 +179,19 @@ class GreetingGenerator:
             # システムプロンプト構築
             system_prompt = self.build_system_prompt(character_config, context)
 
-            # OpenAI APIで挨拶生成
-            client = self.openai_manager.client
-            response = client.chat.completions.create(
-                model="gpt-3.5-turbo",
+            # OpenAI APIで挨拶生成（共有非同期クライアント経由）
+            greeting_text = await self.openai_manager.create_chat_completion(
                 messages=[
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": "キャラクター「蒼司」として、心の専門家パートナーとして、自然で温かい挨拶文を生成してください。"}
                 ],
+                model=AppConfig.GREETING_MODEL,
                 max_tokens=300,
-                temperature=0.8
+                temperature=0.8,
+                endpoint="greeting",
+                priority=Priority.GREETING
             )
 
-            greeting_text = response.choices[0].message.content.strip()
             return greeting_text
 
         except Exception as e:
@@ -199,11 +201,11 @@ class GreetingGenerator:
 
 # APIエンドポイント
 @greeting_router.get("/api/greeting")
-def get_greeting(visit_count: int = 1):
+async def get_greeting(visit_count: int = 1):
     """動的挨拶を取得"""
     try:
         generator = GreetingGenerator()
-        greeting_text = generator.generate_greeting(visit_count=visit_count)
+        greeting_text = await generator.generate_greeting(visit_count=visit_count)
         character_config = generator.load_character_config()
 
         return GreetingResponse(
@@ -217,11 +219,11 @@ def get_greeting(visit_count: int = 1):
         raise HTTPException(status_code=500, detail=f"挨拶生成エラー: {str(e)}")
 
 @greeting_router.post("/api/greeting")
-def generate_custom_greeting(request: GreetingRequest):
+async def generate_custom_greeting(request: GreetingRequest):
     """カスタム挨拶を生成"""
     try:
         generator = GreetingGenerator()
-        greeting_text = generator.generate_greeting(
+        greeting_text = await generator.generate_greeting(
             visit_count=request.visit_count or 1,
             user_context=request.user_context
         )
@@ -12,6 +12,11 @@ from datetime import datetime
 from typing import Dict, List, Any, Optional, Tuple
 from dataclasses import dataclass, asdict
 from copy import deepcopy
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.message_features import keyword_registry, message_features
 
 @dataclass
 class DataField:
@@ -38,6 +43,33 @@ class UserSession:
 class SessionManager:
     """セッション管理システム"""
 
+    # 基本的な情報抽出パターン（フィールドごとに先頭から順に照合）
+    EXTRACTION_PATTERNS = {
+        "relationship_status": {
+            "彼氏": ("彼氏がいる", "inferred"),
+            "彼女": ("彼女がいる", "inferred"),
+            "恋人": ("恋人がいる", "inferred"),
+            "独身": ("独身", "direct"),
+            "一人": ("独身", "inferred")
+        },
+        "emotional_state": {
+            "不安": ("不安", "direct"),
+            "心配": ("心配", "direct"),
+            "寂しい": ("寂しい", "direct"),
+            "つらい": ("つらい", "direct"),
+            "嬉しい": ("嬉しい", "direct")
+        },
+        "communication_style": {
+            "連絡": ("連絡重視", "inferred"),
+            "メッセージ": ("メッセージ重視", "inferred")
+        }
+    }
+
+    EXTRACTION_GROUPS = {
+        field: keyword_registry.define(f"session.{field}", pattern_dict)
+        for field, pattern_dict in EXTRACTION_PATTERNS.items()
+    }
+
     def __init__(self):
         self.sessions: Dict[str, UserSession] = {}
         self.init_data_structure()
@@ -186,31 +218,14 @@ class SessionManager:
         """メッセージから情報を抽出してデータを更新"""
         extracted = {}
 
-        # 基本的な情報抽出パターン
-        patterns = {
-            "relationship_status": {
-                "彼氏": ("彼氏がいる", "inferred"),
-                "彼女": ("彼女がいる", "inferred"),
-                "恋人": ("恋人がいる", "inferred"),
-                "独身": ("独身", "direct"),
-                "一人": ("独身", "inferred")
-            },
-            "emotional_state": {
-                "不安": ("不安", "direct"),
-                "心配": ("心配", "direct"),
-                "寂しい": ("寂しい", "direct"),
-                "つらい": ("つらい", "direct"),
-                "嬉しい": ("嬉しい", "direct")
-            },
-            "communication_style": {
-                "連絡": ("連絡重視", "inferred"),
-                "メッセージ": ("メッセージ重視", "inferred")
-            }
-        }
+        features = message_features(message)
 
-        for field, pattern_dict in patterns.items():
+        for field, pattern_dict in self.EXTRACTION_PATTERNS.items():
+            # フィールド内のキーワードが1つも含まれなければ個別の照合を省略
+            if not features.any(self.EXTRACTION_GROUPS[field]):
+                continue
             for keyword, (value, source) in pattern_dict.items():
-                if keyword in message:
+                if features.has(keyword):
                     # 適切なカテゴリを判定
                     category = self._determine_category(field)
                     if category:
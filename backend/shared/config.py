@@ -18,6 +18,15 @@ class AppConfig:
     # OpenAI API設定
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
+    # Anthropic API設定（未設定時はAnthropicへのルーティング・Claude感情分析を行わない）
+    ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
+    ANTHROPIC_VERSION = "2023-06-01"
+
+    # LLMエンドポイント設定（LLM_STUB_URL指定時は両プロバイダをスタブサーバーへ向ける）
+    LLM_STUB_URL = os.getenv("LLM_STUB_URL")
+    OPENAI_BASE_URL = f"{LLM_STUB_URL.rstrip('/')}/v1" if LLM_STUB_URL else os.getenv("OPENAI_BASE_URL")
+    ANTHROPIC_BASE_URL = LLM_STUB_URL.rstrip('/') if LLM_STUB_URL else os.getenv("ANTHROPIC_BASE_URL", "https://api.anthropic.com")
+
     # サーバー設定
     HOST = "127.0.0.1"
     PORT = 8011
@@ -42,9 +51,222 @@ class AppConfig:
     CHAT_MODEL = "gpt-4"
     MAX_TOKENS = 300  # 3文以内制約
     TEMPERATURE = 0.7
+    GREETING_MODEL = "gpt-3.5-turbo"
+
+    # 感情分析設定（emotionルーティング: Anthropicのみ、OpenAIへのフェイルオーバーは明示的に有効化した場合のみ）
+    EMOTION_MODEL = os.getenv("EMOTION_MODEL", "gpt-4")  # Anthropicでは claude-3-5-sonnet に対応付け
+    EMOTION_OPENAI_FAILOVER = os.getenv("EMOTION_OPENAI_FAILOVER", "false").lower() == "true"  # OpenAIでは EMOTION_MODEL をそのまま使用
+    EMOTION_MAX_TOKENS = 1000
+    EMOTION_TEMPERATURE = float(os.getenv("EMOTION_TEMPERATURE", "0.2"))
+    EMOTION_TIMEOUT_SECONDS = float(os.getenv("EMOTION_TIMEOUT_SECONDS", "8"))  # 感情分析段の時間予算（ターン期限内）
+    EMOTION_PROMPT_INCLUDE_MD = os.getenv("EMOTION_PROMPT_INCLUDE_MD", "false").lower() == "true"  # 感情分析MDをプロンプトに含める（入力トークン増）
+    EMOTION_CACHE_ENABLED = os.getenv("EMOTION_CACHE_ENABLED", "true").lower() == "true"
+    EMOTION_CACHE_MAX_ENTRIES = int(os.getenv("EMOTION_CACHE_MAX_ENTRIES", "2048"))
+    # 感情分析MDの版が記録されていない旧形式の履歴も事前投入に使うか（旧MDでの分析結果が混ざる）
+    EMOTION_CACHE_WARM_UNVERSIONED = os.getenv("EMOTION_CACHE_WARM_UNVERSIONED", "false").lower() == "true"
+    # 感情分析のマイクロバッチ（時間窓内の同時リクエストを1回の呼び出しにまとめ、JSON配列で受け取る）
+    EMOTION_BATCH_ENABLED = os.getenv("EMOTION_BATCH_ENABLED", "false").lower() == "true"
+    EMOTION_BATCH_WINDOW_MS = float(os.getenv("EMOTION_BATCH_WINDOW_MS", "10"))
+    EMOTION_BATCH_MAX_SIZE = int(os.getenv("EMOTION_BATCH_MAX_SIZE", "8"))
+    EMOTION_BATCH_TOKENS_PER_MESSAGE = int(os.getenv("EMOTION_BATCH_TOKENS_PER_MESSAGE", "400"))  # 出力トークン上限＝件数×この値
+
+    # ローカル感情・ニーズ分類器（確信度が閾値未満のときだけLLMで感情分析）
+    # 実トラフィックでの検証が済むまで既定は無効（無効時のニーズ分析はキーワードのみ）
+    LOCAL_CLASSIFIER_ENABLED = os.getenv("LOCAL_CLASSIFIER_ENABLED", "false").lower() == "true"
+    LOCAL_CLASSIFIER_PATH = os.getenv(
+        "LOCAL_CLASSIFIER_PATH",
+        os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "models", "local_classifier.npz")
+    )
+    EMOTION_LOCAL_CONFIDENCE_THRESHOLD = float(os.getenv("EMOTION_LOCAL_CONFIDENCE_THRESHOLD", "0.5"))
+    NEEDS_LOCAL_CONFIDENCE_THRESHOLD = float(os.getenv("NEEDS_LOCAL_CONFIDENCE_THRESHOLD", "0.7"))
+
+    # 統合モード（感情分析JSONと応答文を1回の呼び出しで生成し、往復回数を半減）
+    CHAT_FUSED_ANALYSIS_ENABLED = os.getenv("CHAT_FUSED_ANALYSIS_ENABLED", "false").lower() == "true"
+    CHAT_FUSED_MAX_TOKENS = int(os.getenv("CHAT_FUSED_MAX_TOKENS", "700"))  # 応答文＋感情分析JSON
+
+    # 応答モデルのティア設定（ターンごとに感情強度・危機レベルで選択）
+    CHAT_MODEL_TIERING_ENABLED = os.getenv("CHAT_MODEL_TIERING_ENABLED", "true").lower() == "true"
+    CHAT_MODEL_TIERS = {
+        "fast": {"model": os.getenv("CHAT_FAST_MODEL", "gpt-3.5-turbo"), "max_tokens": MAX_TOKENS},
+        "standard": {"model": CHAT_MODEL, "max_tokens": MAX_TOKENS},
+        "strong": {"model": os.getenv("CHAT_STRONG_MODEL", "gpt-4o"), "max_tokens": MAX_TOKENS}  # standardより上位のモデル
+    }
+    CHAT_MODEL_TIER_RULES = {
+        "fast_max_intensity": int(os.getenv("CHAT_TIER_FAST_MAX_INTENSITY", "30")),    # この強度以下かつ
+        "fast_max_crisis": int(os.getenv("CHAT_TIER_FAST_MAX_CRISIS", "1")),           # この危機レベル以下ならfast
+        "strong_min_intensity": int(os.getenv("CHAT_TIER_STRONG_MIN_INTENSITY", "80")),  # この強度以上または
+        "strong_min_crisis": int(os.getenv("CHAT_TIER_STRONG_MIN_CRISIS", "3"))          # この危機レベル以上ならstrong
+    }
+
+    # OpenAI接続プール設定（非同期クライアント共有）
+    OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+    OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "20"))
+    OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "30"))
+    OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5"))
+    OPENAI_READ_TIMEOUT = float(os.getenv("OPENAI_READ_TIMEOUT", "60"))
+
+    # Anthropic接続プール設定
+    ANTHROPIC_MAX_CONNECTIONS = int(os.getenv("ANTHROPIC_MAX_CONNECTIONS", "50"))
+    ANTHROPIC_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("ANTHROPIC_MAX_KEEPALIVE_CONNECTIONS", "20"))
+
+    # プロバイダルーティング設定（タスク種別ごとのポリシー）
+    # strategy: primary（記載順）/ latency（直近p95が小さい順）/ weighted（weightsで分割）
+    ROUTING_POLICIES = {
+        "chat": {
+            "providers": ["openai", "anthropic"],
+            "strategy": os.getenv("ROUTING_CHAT_STRATEGY", "latency")
+        },
+        "fortune": {
+            "providers": ["openai", "anthropic"],
+            "strategy": "weighted",
+            "weights": {
+                "openai": float(os.getenv("ROUTING_FORTUNE_OPENAI_WEIGHT", "1.0")),
+                "anthropic": float(os.getenv("ROUTING_FORTUNE_ANTHROPIC_WEIGHT", "0.0"))
+            }
+        },
+        "greeting": {
+            "providers": ["openai", "anthropic"],
+            "strategy": "primary"
+        },
+        "emotion": {
+            "providers": ["anthropic", "openai"] if EMOTION_OPENAI_FAILOVER else ["anthropic"],
+            "strategy": "primary"
+        },
+        "default": {
+            "providers": ["openai"],
+            "strategy": "primary"
+        }
+    }
+    ROUTING_TASK_ALIASES = {"chat_fallback": "chat", "chat_fused": "chat", "chat_crisis": "chat", "emotion_batch": "emotion"}  # エンドポイント → タスク種別
+    ROUTING_LATENCY_PERCENTILE = float(os.getenv("ROUTING_LATENCY_PERCENTILE", "95"))
+    ROUTING_LATENCY_MIN_SAMPLES = int(os.getenv("ROUTING_LATENCY_MIN_SAMPLES", "20"))
+    ROUTING_EXPLORE_RATE = float(os.getenv("ROUTING_EXPLORE_RATE", "0.05"))  # 最速以外を試す割合（p95の鮮度維持）
+    ROUTING_ATTEMPTS_BEFORE_FAILOVER = int(os.getenv("ROUTING_ATTEMPTS_BEFORE_FAILOVER", "1"))
+    PROVIDER_MODEL_MAP = {  # 指定モデル（OpenAI名）→ 各プロバイダの同等モデル
+        "anthropic": {
+            "gpt-4": "claude-3-5-sonnet-20241022",
+            "gpt-3.5-turbo": "claude-3-haiku-20240307",
+            "default": "claude-3-5-sonnet-20241022"
+        }
+    }
+
+    # 補完キャッシュ設定（メモリLRU + SQLite）
+    COMPLETION_CACHE_ENABLED = os.getenv("COMPLETION_CACHE_ENABLED", "true").lower() == "true"
+    COMPLETION_CACHE_PATH = os.getenv(
+        "COMPLETION_CACHE_PATH",
+        os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "cache", "completions.sqlite3")
+    )
+    COMPLETION_CACHE_MEMORY_ENTRIES = int(os.getenv("COMPLETION_CACHE_MEMORY_ENTRIES", "512"))
+    # 既定の対象は同一プロンプトが繰り返されるフォールバック応答・占いのみ
+    # （通常チャット・挨拶は同じ文面を他のユーザーへ返さないよう、TTLと温度上限を明示した場合のみ対象）
+    COMPLETION_CACHE_MAX_TEMPERATURE = float(os.getenv("COMPLETION_CACHE_MAX_TEMPERATURE", "0.3"))  # これを超える温度はキャッシュしない
+    COMPLETION_CACHE_MAX_TEMPERATURES = {  # エンドポイント別の温度上限（未指定は COMPLETION_CACHE_MAX_TEMPERATURE）
+        "chat_fallback": 0.7,
+        "fortune": 0.8
+    }
+    COMPLETION_CACHE_TTLS = {  # エンドポイント別TTL（秒）、0でキャッシュ無効
+        "chat": int(os.getenv("COMPLETION_CACHE_CHAT_TTL", "0")),
+        "chat_fallback": 3600,
+        "fortune": 86400,
+        "greeting": int(os.getenv("COMPLETION_CACHE_GREETING_TTL", "0"))
+    }
+
+    # 上流呼び出しの録音・再生（off / record / replay）
+    LLM_CASSETTE_MODE = os.getenv("LLM_CASSETTE_MODE", "off").lower()
+    LLM_CASSETTE_PATH = os.getenv(
+        "LLM_CASSETTE_PATH",
+        os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "cassettes", "default.jsonl")
+    )
+    LLM_CASSETTE_LATENCY = os.getenv("LLM_CASSETTE_LATENCY", "recorded").lower()  # recorded / zero
+    LLM_CASSETTE_STRICT = os.getenv("LLM_CASSETTE_STRICT", "false").lower() == "true"  # 完全一致のみ再生
+
+    # 上流呼び出しスケジューラ設定（プロバイダ別同時実行上限・流量制限）
+    UPSTREAM_LIMITS = {
+        "openai": {
+            "max_concurrency": int(os.getenv("OPENAI_MAX_CONCURRENCY", "16")),
+            "rate_per_second": float(os.getenv("OPENAI_RATE_PER_SECOND", "8")),
+            "burst": int(os.getenv("OPENAI_RATE_BURST", "16"))
+        },
+        "anthropic": {
+            "max_concurrency": int(os.getenv("ANTHROPIC_MAX_CONCURRENCY", "8")),
+            "rate_per_second": float(os.getenv("ANTHROPIC_RATE_PER_SECOND", "4")),
+            "burst": int(os.getenv("ANTHROPIC_RATE_BURST", "8"))
+        },
+        "default": {
+            "max_concurrency": 8,
+            "rate_per_second": 4.0,
+            "burst": 8
+        }
+    }
+    CRISIS_PRIORITY_LEVEL = 4  # この危機レベル以上は最優先レーン
+
+    # 危機ファストパス（上流呼び出しより先に危機レベルを検出し、感情分析を待たずに応答）
+    CRISIS_FAST_PATH_ENABLED = os.getenv("CRISIS_FAST_PATH_ENABLED", "true").lower() == "true"
+    # この危機レベル以上は定型安全応答を即時返却（上流呼び出しなし）、CRISIS_PRIORITY_LEVEL以上は危機対応プロンプトで1回だけ生成
+    CRISIS_SAFETY_RESPONSE_LEVEL = int(os.getenv("CRISIS_SAFETY_RESPONSE_LEVEL", "5"))
+
+    # リクエスト期限・リトライ・ヘッジ設定
+    CHAT_TURN_DEADLINE_SECONDS = float(os.getenv("CHAT_TURN_DEADLINE_SECONDS", "25"))
+    LLM_DEFAULT_DEADLINE_SECONDS = float(os.getenv("LLM_DEFAULT_DEADLINE_SECONDS", "60"))
+    LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "3"))
+    LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+    LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "8"))
+    LLM_HEDGING_ENABLED = os.getenv("LLM_HEDGING_ENABLED", "false").lower() == "true"
+    # ヘッジ対象エンドポイント（非ストリーミング呼び出しのみ有効。文数制限対象のchat系はストリーミングのため対象外）
+    LLM_HEDGING_ENDPOINTS = [e.strip() for e in os.getenv("LLM_HEDGING_ENDPOINTS", "chat_crisis,fortune").split(",") if e.strip()]
+    LLM_HEDGING_PERCENTILE = float(os.getenv("LLM_HEDGING_PERCENTILE", "95"))
+    LLM_HEDGING_MIN_SAMPLES = int(os.getenv("LLM_HEDGING_MIN_SAMPLES", "20"))
+
+    # サーキットブレーカー設定（プロバイダ共通）
+    CIRCUIT_BREAKER = {
+        "window": int(os.getenv("CIRCUIT_WINDOW", "20")),                   # 判定対象の直近呼び出し数
+        "min_calls": int(os.getenv("CIRCUIT_MIN_CALLS", "5")),              # 判定に必要な最小呼び出し数
+        "failure_rate": float(os.getenv("CIRCUIT_FAILURE_RATE", "0.5")),    # OPENにする失敗率
+        "slow_call_rate": float(os.getenv("CIRCUIT_SLOW_CALL_RATE", "0.8")),  # OPENにする遅延呼び出し率
+        "open_seconds": float(os.getenv("CIRCUIT_OPEN_SECONDS", "30")),     # HALF_OPENまでの待機秒数
+        "half_open_probes": int(os.getenv("CIRCUIT_HALF_OPEN_PROBES", "1"))
+    }
+    CIRCUIT_SLOW_CALL_SECONDS = {  # 遅延呼び出しとみなす秒数（プロバイダ別）
+        "openai": float(os.getenv("OPENAI_SLOW_CALL_SECONDS", "15")),
+        "anthropic": float(os.getenv("ANTHROPIC_SLOW_CALL_SECONDS", "10")),
+        "default": 15.0
+    }
+
+    # プロンプト入力トークン予算（呼び出し種別ごと、オフライン推定値）
+    # system_prompt・統合の既定値は現在のMD（推定: 約6.2k・約6.7k）より大きく、MDの肥大化に対する上限として働く
+    # 感情分析MD（約2.5k）は EMOTION_PROMPT_INCLUDE_MD=true の場合のみ含め、emotion の予算内に要約・削除する
+    PROMPT_TOKEN_BUDGETS = {
+        "system_prompt": int(os.getenv("SYSTEM_PROMPT_TOKEN_BUDGET", "8000")),
+        "emotion": int(os.getenv("EMOTION_PROMPT_TOKEN_BUDGET", "2000")),
+        "fused_turn": int(os.getenv("FUSED_PROMPT_TOKEN_BUDGET", "8000")),
+        "default": 4000
+    }
+    PROMPT_SECTION_PRIORITIES = {  # MD見出しキーワード → 優先度（大きいほど残す）
+        "概要": 3,
+        "定義": 3,
+        "カテゴリ": 3,
+        "マッピング": 3,
+        "制約": 3,
+        "緊急": 3,
+        "判定": 2,
+        "アルゴリズム": 2,
+        "レベル": 2,
+        "パラメータ": 0,
+        "調整": 0,
+        "チューニング": 0,
+        "品質管理": 0,
+        "多様性": 0,
+        "最適化": 0,
+        "テンプレート": 0
+    }
+    PROMPT_SECTION_DEFAULT_PRIORITY = 1
 
     # レスポンス設定
     MAX_RESPONSE_SENTENCES = 3
+    # 文数上限に達した時点でストリームを打ち切るエンドポイント
+    SENTENCE_LIMIT_ENDPOINTS = (
+        ["chat", "chat_fallback", "chat_fused"] if os.getenv("CHAT_SENTENCE_LIMIT_ENABLED", "true").lower() == "true" else []
+    )
     TARGET_CHARACTER_COUNT = 150  # 150-250文字目安の最小値
 
     # ログ設定
@@ -0,0 +1 @@
+# Tool scripts for integrated fortune chat system
\ No newline at end of file
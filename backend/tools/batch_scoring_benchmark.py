@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+バッチスコアリングベンチマーク
+シードデータ・会話履歴のユーザー発話をN件に増やし、1件ずつのスコアリング
+（analyze_resort_scores・analyze_detailed_needs・fortune_timing）と BatchScoringSystem の
+結果が完全に一致することを確認して、処理時間を比較する
+
+使用例:
+    python tools/batch_scoring_benchmark.py
+    python tools/batch_scoring_benchmark.py --sizes 100 1000 10000 --rally-count 3
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from core.md_loader import get_md_configs
+from services.analysis_service import BatchScoringSystem
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def load_messages(logs_dir: str) -> List[str]:
+    """シードデータと会話履歴のユーザー発話"""
+    messages = []
+    with open(os.path.join(PROJECT_ROOT, "data", "emotion_seed.jsonl"), "r", encoding="utf-8") as f:
+        messages.extend(json.loads(line)["message"] for line in f if line.strip())
+
+    if os.path.isdir(logs_dir):
+        for name in sorted(os.listdir(logs_dir)):
+            if not (name.startswith("chat_") and name.endswith(".json")):
+                continue
+            try:
+                with open(os.path.join(logs_dir, name), "r", encoding="utf-8") as f:
+                    history = json.load(f).get("messages", [])
+            except Exception as e:
+                print(f"読み込みエラー ({name}): {e}", file=sys.stderr)
+                continue
+            messages.extend(m.get("content", "") for m in history if m.get("type") == "user")
+    return [message for message in messages if message]
+
+
+def score_scalar(scorer: BatchScoringSystem, messages: List[str], user_data: Dict[str, Any], rally_count: int) -> Dict[str, Any]:
+    """1件ずつのスコアリング（既存の分析器をそのまま呼ぶ）"""
+    resort_scores, needs, fortune_timing = [], [], []
+    for message in messages:
+        resort = scorer.resort_analyzer.analyze_resort_scores([message], user_data, rally_count)
+        detected = scorer.needs_analyzer.analyze_detailed_needs([message], user_data)
+        resort_scores.append([resort[dimension] for dimension in scorer.dimensions])
+        needs.append([detected[need_type] for need_type in scorer.need_types])
+        fortune_timing.append(scorer.program.fortune_timing(resort, detected))
+    return {"resort_scores": resort_scores, "needs": needs, "fortune_timing": fortune_timing}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="1件ずつのスコアリングとバッチスコアリングの一致確認・処理時間比較")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--rally-count", type=int, default=2)
+    parser.add_argument("--user-data", default='{"emotional_state": "不安"}', help="ユーザーデータ（JSON）")
+    parser.add_argument("--logs-dir", default=os.path.join(PROJECT_ROOT, "chat_logs"))
+    args = parser.parse_args()
+
+    user_data = json.loads(args.user_data)
+    scorer = BatchScoringSystem(get_md_configs())
+    corpus = load_messages(args.logs_dir)
+    print(f"語彙 {len(scorer.vocabulary)}語, グループ {len(scorer.group_columns)}個, 元メッセージ {len(corpus)}件")
+
+    for size in args.sizes:
+        # 特徴量キャッシュが効かないよう、繰り返したメッセージには通し番号を付ける
+        messages = [f"{corpus[i % len(corpus)]} #{i}" for i in range(size)]
+
+        started = time.perf_counter()
+        expected = score_scalar(scorer, messages, user_data, args.rally_count)
+        scalar_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        actual = scorer.score(messages, user_data, args.rally_count)
+        batch_seconds = time.perf_counter() - started
+
+        assert np.array_equal(actual["resort_scores"], np.array(expected["resort_scores"])), "RESORTスコア不一致"
+        assert np.array_equal(actual["needs"], np.array(expected["needs"])), "ニーズスコア不一致"
+        assert np.array_equal(actual["fortune_timing"], np.array(expected["fortune_timing"])), "占いタイミング不一致"
+
+        print(
+            f"{size:>6}件: 1件ずつ {scalar_seconds * 1000:8.1f}ms, バッチ {batch_seconds * 1000:7.1f}ms "
+            f"({scalar_seconds / batch_seconds:.1f}倍) - 結果一致"
+        )
+
+
+if __name__ == "__main__":
+    main()
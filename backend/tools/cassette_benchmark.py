@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+カセット再生ベンチマーク
+chat_endpoint・execute_fortune・GreetingGenerator をプロセス内で実行し、
+録音（record）した上流応答を再生（replay）してPython側パイプラインの処理時間を測定する
+
+使用例:
+    python tools/cassette_benchmark.py --mode record --cassette ../cassettes/bench.jsonl
+    python tools/cassette_benchmark.py --mode replay --cassette ../cassettes/bench.jsonl --latency zero --rounds 20
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.cassette import cassette
+from core.md_loader import get_md_configs
+from core.openai_client import openai_manager
+from services.chat_service import ChatMessage, chat_endpoint
+from services.chat_history_service import chat_history_manager
+from services.fortune_service import FortuneSystem
+from services.greeting_service import GreetingGenerator
+
+SAMPLE_MESSAGES = [
+    "彼氏から連絡がこないです",
+    "最近仕事がつらくて眠れません",
+    "好きな人に告白するべきか迷っています"
+]
+
+FORTUNE_CASES = [
+    ("相手の本音占い", {"name": "さくら", "age": 28}, "彼氏のこと"),
+    ("復縁可能性診断", {"name": "みほ"}, "")
+]
+
+
+async def run_round(md_configs: Dict[str, str], timings: Dict[str, List[float]], outputs: Dict[str, List[str]]):
+    """3シナリオを1巡実行"""
+    for index, message in enumerate(SAMPLE_MESSAGES):
+        started = time.perf_counter()
+        result = await chat_endpoint(
+            ChatMessage(message=message, rally_count=index + 1, session_id="cassette_bench"),
+            md_configs, openai_manager
+        )
+        timings["chat_endpoint"].append(time.perf_counter() - started)
+        outputs["chat_endpoint"].append(result.response)
+
+    fortune = FortuneSystem(md_configs)
+    for fortune_type, user_data, context in FORTUNE_CASES:
+        started = time.perf_counter()
+        result = await fortune.execute_fortune(fortune_type, user_data, openai_manager, context)
+        timings["execute_fortune"].append(time.perf_counter() - started)
+        outputs["execute_fortune"].append(json.dumps(result, ensure_ascii=False, sort_keys=True))
+
+    started = time.perf_counter()
+    greeting = await GreetingGenerator().generate_greeting(visit_count=1)
+    timings["greeting"].append(time.perf_counter() - started)
+    outputs["greeting"].append(greeting)
+
+
+def summarize(values: List[float]) -> Dict:
+    ordered = sorted(values)
+    return {
+        "count": len(values),
+        "mean_ms": round(statistics.mean(values) * 1000, 2),
+        "p50_ms": round(ordered[len(ordered) // 2] * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2)
+    }
+
+
+async def run(args) -> Dict:
+    cassette.configure(args.mode, args.cassette, args.latency, args.strict)
+    # ランダムなパターン選択を固定し、再生時のプロンプト・応答を決定的にする
+    random.seed(args.seed)
+    # ベンチマークの会話ログは一時ディレクトリへ
+    chat_history_manager.logs_dir = tempfile.mkdtemp(prefix="cassette_bench_")
+
+    md_configs = get_md_configs()
+    timings: Dict[str, List[float]] = defaultdict(list)
+    outputs: Dict[str, List[str]] = defaultdict(list)
+
+    started = time.perf_counter()
+    for _ in range(args.rounds):
+        await run_round(md_configs, timings, outputs)
+    elapsed = time.perf_counter() - started
+
+    await openai_manager.aclose()
+
+    return {
+        "mode": args.mode,
+        "rounds": args.rounds,
+        "elapsed_seconds": round(elapsed, 3),
+        "scenarios": {name: summarize(values) for name, values in timings.items()},
+        # 再生結果の回帰確認用（同じカセット・シードなら一致する）
+        "output_digest": {
+            name: hashlib.sha256("\n".join(texts).encode("utf-8")).hexdigest()[:16]
+            for name, texts in outputs.items()
+        },
+        "cassette": cassette.stats()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="カセット録音・再生によるパイプラインベンチマーク")
+    parser.add_argument("--mode", choices=["record", "replay", "off"], default="replay")
+    parser.add_argument("--cassette", default=cassette.path)
+    parser.add_argument("--latency", choices=["recorded", "zero"], default="zero", help="再生時のレイテンシ")
+    parser.add_argument("--strict", action="store_true", help="フィンガープリント完全一致のみ再生")
+    parser.add_argument("--rounds", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
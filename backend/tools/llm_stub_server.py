@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LLMスタブサーバー（負荷・レイテンシ試験用）
+OpenAI /v1/chat/completions と Anthropic /v1/messages の形式を模倣し、
+レイテンシ分布・エラー率・429バーストを設定可能にしてトークンを消費せずに試験する
+
+起動例:
+    python tools/llm_stub_server.py --port 8100 --latency lognormal:800:0.5 --error-rate 0.02 --burst-429 60:5
+
+アプリ側は .env に LLM_STUB_URL=http://127.0.0.1:8100 を設定すると両プロバイダがスタブを向く
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import random
+import re
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# 定型応答（メッセージのハッシュで選択し、同一入力には同一応答）
+CHAT_REPLIES = [
+    "お気持ちを話してくださってありがとうございます。その不安はとても自然なものですよ。少しずつ一緒に整理していきましょう。",
+    "そんなことがあったのですね。今まで一人で抱えてきたのは本当に大変だったと思います。あなたの心が少しでも軽くなるよう寄り添いますね。",
+    "あなたの優しさがとても伝わってきます。相手を想う気持ちがあるからこそ悩むのですね。今の気持ちをもう少し聞かせていただけますか。",
+    "星の流れは今、あなたに静かな転機を示しています。焦らず自分の心の声に耳を傾けてください。近いうちに小さな良い兆しが訪れるでしょう。"
+]
+
+EXTRA_SENTENCES = [
+    "ほかにも気になることがあれば、どんなことでも遠慮なくお話しくださいね。",
+    "あなたのペースで大丈夫ですから、無理をせず少しずつ進んでいきましょう。"
+]
+
+EMOTION_KEYWORDS = [
+    (("不安", "心配", "連絡", "こない"), "不安", 70, 4, 2),
+    (("悲しい", "つらい", "辛い", "泣"), "悲しみ", 65, 4, 2),
+    (("ムカつく", "怒", "許せない"), "怒り", 60, 3, 1),
+    (("嬉しい", "楽しい", "幸せ"), "喜び", 60, 2, 0),
+    (("死にたい", "消えたい"), "絶望", 95, 5, 5)
+]
+
+
+class StubSettings:
+    """スタブの挙動設定（実行中に /stub/config で変更可能）"""
+
+    def __init__(self):
+        self.latency = "lognormal:600:0.4"       # 非ストリーミング応答の遅延分布（ミリ秒）
+        self.anthropic_latency = None            # 未指定なら latency と同じ
+        self.first_token = "fixed:250"           # ストリーミング最初のトークンまでの遅延
+        self.token_interval_ms = 30.0            # ストリーミングのチャンク間隔
+        self.error_rate = 0.0                    # 500を返す確率
+        self.burst_429 = None                    # "周期秒:継続秒"（周期の先頭で継続秒だけ429）
+        self.retry_after = 1.0                   # 429時のRetry-After秒
+        self.extra_sentences = 0                 # チャット応答に追加する文数（3文制限を超過するモデルの再現）
+        self.started_at = time.monotonic()
+
+    def update(self, values: Dict[str, Any]):
+        for key, value in values.items():
+            if hasattr(self, key) and key != "started_at":
+                setattr(self, key, value)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {k: v for k, v in vars(self).items() if k != "started_at"}
+
+
+settings = StubSettings()
+stats = {"requests": 0, "streams": 0, "errors_500": 0, "errors_429": 0, "by_route": {}}
+
+app = FastAPI(title="LLM Stub Server", docs_url=None, redoc_url=None)
+
+
+def sample_ms(spec: str) -> float:
+    """分布指定（fixed:ms / uniform:min:max / normal:mean:sd / lognormal:median:sigma）から1件サンプル"""
+    kind, *params = spec.split(":")
+    values = [float(p) for p in params]
+
+    if kind == "fixed":
+        return values[0]
+    if kind == "uniform":
+        return random.uniform(values[0], values[1])
+    if kind == "normal":
+        return max(0.0, random.gauss(values[0], values[1]))
+    if kind == "lognormal":
+        return random.lognormvariate(math.log(values[0]), values[1])
+    raise ValueError(f"未対応の分布指定: {spec}")
+
+
+def in_429_burst() -> bool:
+    """429バースト期間中か"""
+    if not settings.burst_429:
+        return False
+    period, duration = (float(v) for v in str(settings.burst_429).split(":"))
+    return (time.monotonic() - settings.started_at) % period < duration
+
+
+def injected_failure(route: str) -> Optional[JSONResponse]:
+    """設定に応じて429/500を返す（正常時はNone）"""
+    stats["requests"] += 1
+    stats["by_route"][route] = stats["by_route"].get(route, 0) + 1
+
+    if in_429_burst():
+        stats["errors_429"] += 1
+        return JSONResponse(
+            status_code=429,
+            headers={"retry-after": str(settings.retry_after)},
+            content={"error": {"type": "rate_limit_error", "message": "stub: rate limited"}}
+        )
+    if random.random() < settings.error_rate:
+        stats["errors_500"] += 1
+        return JSONResponse(
+            status_code=500,
+            content={"error": {"type": "server_error", "message": "stub: injected failure"}}
+        )
+    return None
+
+
+def last_user_text(messages: List[Dict[str, Any]]) -> str:
+    for message in reversed(messages):
+        if message.get("role") == "user":
+            content = message.get("content", "")
+            if isinstance(content, list):
+                return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+            return content
+    return ""
+
+
+def chat_reply(messages: List[Dict[str, Any]]) -> str:
+    digest = hashlib.sha256(last_user_text(messages).encode("utf-8")).digest()
+    reply = CHAT_REPLIES[digest[0] % len(CHAT_REPLIES)]
+    return reply + "".join(EXTRA_SENTENCES[i % len(EXTRA_SENTENCES)] for i in range(int(settings.extra_sentences)))
+
+
+def emotion_reply(prompt: str) -> str:
+    """感情分析プロンプトに対するJSON応答（analyze_emotion_advancedの要求形式）"""
+    # 分析対象メッセージ部分のみを判定に使う
+    target = prompt.split("【分析対象メッセージ】")[-1].split("【要求する分析結果")[0]
+    emotion, intensity, empathy, crisis = "ニュートラル", 10, 1, 0
+    for keywords, name, level, empathy_level, crisis_level in EMOTION_KEYWORDS:
+        if any(keyword in target for keyword in keywords):
+            emotion, intensity, empathy, crisis = name, level, empathy_level, crisis_level
+            break
+
+    return json.dumps({
+        "primary_emotion": emotion,
+        "emotion_intensity": intensity,
+        "emotion_layers": {"surface": emotion, "middle": "安心欲求", "deep": "理解されたい"},
+        "empathy_level": empathy,
+        "tone_matching": "優しく安定した",
+        "analysis_quality": "primary",
+        "crisis_level": crisis
+    }, ensure_ascii=False)
+
+
+def emotion_batch_reply(prompt: str) -> str:
+    """マイクロバッチの感情分析プロンプトに対するJSON配列応答（[番号] "メッセージ" の行ごとに1要素）"""
+    listing = prompt.split("【分析対象メッセージ一覧】")[-1].split("【要求する分析結果")[0]
+    analyses = []
+    for index, target in re.findall(r"^\[(\d+)\] (.*)$", listing, re.MULTILINE):
+        analysis = json.loads(emotion_reply(f"【分析対象メッセージ】{target}"))
+        analyses.append({"index": int(index), **analysis})
+    return json.dumps(analyses, ensure_ascii=False)
+
+
+def stub_reply(messages: List[Dict[str, Any]], system: str = "") -> str:
+    """プロンプト種別に応じた応答（感情分析JSON / 統合モードJSON / 通常の応答文）"""
+    prompt = last_user_text(messages)
+    if "【分析対象メッセージ一覧】" in prompt:
+        return emotion_batch_reply(prompt)
+    if "感情分析" in prompt:
+        return emotion_reply(prompt)
+
+    system += "".join(str(m.get("content", "")) for m in messages if m.get("role") == "system")
+    if '"emotion_analysis"' in system:
+        return json.dumps({
+            "emotion_analysis": json.loads(emotion_reply(f"【分析対象メッセージ】{prompt}")),
+            "response": chat_reply(messages)
+        }, ensure_ascii=False)
+    return chat_reply(messages)
+
+
+def approx_tokens(text: str) -> int:
+    return max(1, len(text))
+
+
+def chunk_text(text: str, size: int = 4) -> List[str]:
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+async def stream_chunks(text: str, render) -> AsyncIterator[str]:
+    """最初のトークン遅延 → チャンク間隔で送出"""
+    await asyncio.sleep(sample_ms(settings.first_token) / 1000.0)
+    for index, chunk in enumerate(chunk_text(text)):
+        if index:
+            await asyncio.sleep(settings.token_interval_ms / 1000.0)
+        yield render(chunk)
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    """OpenAI Chat Completions互換"""
+    body = await request.json()
+    failure = injected_failure("openai")
+    if failure:
+        return failure
+
+    model = body.get("model", "gpt-4")
+    messages = body.get("messages", [])
+    text = stub_reply(messages)
+    completion_id = f"chatcmpl-stub-{uuid.uuid4().hex[:12]}"
+    created = int(time.time())
+
+    if body.get("stream"):
+        stats["streams"] += 1
+
+        def render(chunk: str) -> str:
+            data = {
+                "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "delta": {"content": chunk}, "finish_reason": None}]
+            }
+            return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+        async def events():
+            async for event in stream_chunks(text, render):
+                yield event
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    await asyncio.sleep(sample_ms(settings.latency) / 1000.0)
+    prompt_tokens = sum(approx_tokens(str(m.get("content", ""))) for m in messages)
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": created,
+        "model": model,
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": text}}],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": approx_tokens(text),
+            "total_tokens": prompt_tokens + approx_tokens(text)
+        }
+    }
+
+
+@app.post("/v1/messages")
+async def messages(request: Request):
+    """Anthropic Messages互換"""
+    body = await request.json()
+    failure = injected_failure("anthropic")
+    if failure:
+        return failure
+
+    model = body.get("model", "claude-3-5-sonnet-20241022")
+    prompt = last_user_text(body.get("messages", []))
+    text = stub_reply(body.get("messages", []), body.get("system", ""))
+    message_id = f"msg_stub_{uuid.uuid4().hex[:12]}"
+    usage = {"input_tokens": approx_tokens(prompt), "output_tokens": approx_tokens(text)}
+
+    if body.get("stream"):
+        stats["streams"] += 1
+
+        def sse(event: str, data: Dict[str, Any]) -> str:
+            return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+        async def events():
+            yield sse("message_start", {"type": "message_start", "message": {
+                "id": message_id, "type": "message", "role": "assistant", "model": model,
+                "content": [], "usage": {"input_tokens": usage["input_tokens"], "output_tokens": 0}
+            }})
+            yield sse("content_block_start", {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}})
+            async for event in stream_chunks(text, lambda chunk: sse("content_block_delta", {
+                "type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": chunk}
+            })):
+                yield event
+            yield sse("content_block_stop", {"type": "content_block_stop", "index": 0})
+            yield sse("message_delta", {"type": "message_delta", "delta": {"stop_reason": "end_turn"}, "usage": {"output_tokens": usage["output_tokens"]}})
+            yield sse("message_stop", {"type": "message_stop"})
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    await asyncio.sleep(sample_ms(settings.anthropic_latency or settings.latency) / 1000.0)
+    return {
+        "id": message_id,
+        "type": "message",
+        "role": "assistant",
+        "model": model,
+        "content": [{"type": "text", "text": text}],
+        "stop_reason": "end_turn",
+        "usage": usage
+    }
+
+
+@app.get("/stub/stats")
+async def stub_stats():
+    """受信数・注入エラー数と現在の設定"""
+    return {**stats, "settings": settings.to_dict(), "in_429_burst": in_429_burst()}
+
+
+@app.post("/stub/config")
+async def stub_config(values: Dict[str, Any]):
+    """挙動設定を実行中に変更"""
+    settings.update(values)
+    return settings.to_dict()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI/Anthropic互換のLLMスタブサーバー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency", default=settings.latency, help="fixed:ms | uniform:min:max | normal:mean:sd | lognormal:median:sigma")
+    parser.add_argument("--anthropic-latency", default=None, help="Anthropic用の遅延分布（未指定は--latency）")
+    parser.add_argument("--first-token", default=settings.first_token, help="ストリーミング最初のトークンまでの遅延分布")
+    parser.add_argument("--token-interval-ms", type=float, default=settings.token_interval_ms)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="500を返す確率（0-1）")
+    parser.add_argument("--burst-429", default=None, help="周期秒:継続秒（例 60:5）")
+    parser.add_argument("--retry-after", type=float, default=settings.retry_after)
+    parser.add_argument("--extra-sentences", type=int, default=0, help="チャット応答に追加する文数")
+    args = parser.parse_args()
+
+    settings.update({
+        "latency": args.latency,
+        "anthropic_latency": args.anthropic_latency,
+        "first_token": args.first_token,
+        "token_interval_ms": args.token_interval_ms,
+        "error_rate": args.error_rate,
+        "burst_429": args.burst_429,
+        "retry_after": args.retry_after,
+        "extra_sentences": args.extra_sentences
+    })
+
+    print(f"🧪 LLMスタブサーバー起動: http://{args.host}:{args.port}  設定: {settings.to_dict()}")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+チャットパイプライン負荷試験
+起動中のサーバー（通常はLLMスタブ接続）へ同時リクエストを送り、スループットとテールレイテンシを測定する
+
+使用例:
+    python tools/llm_stub_server.py --latency lognormal:800:0.5 &
+    LLM_STUB_URL=http://127.0.0.1:8100 ANTHROPIC_API_KEY=stub python main.py &
+    python tools/load_test.py --requests 200 --concurrency 20 --stream
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import uuid
+from typing import Dict, List, Optional
+
+import httpx
+
+SAMPLE_MESSAGES = [
+    "彼氏から連絡がこないです",
+    "最近仕事がつらくて眠れません",
+    "好きな人に告白するべきか迷っています",
+    "元彼のことが忘れられない",
+    "友達との関係がぎくしゃくしていて悲しい",
+    "今日は嬉しいことがありました"
+]
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q / 100.0 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+async def send_chat(client: httpx.AsyncClient, base_url: str, message: str, stream: bool) -> Dict:
+    """1ターン送信し、総時間と（ストリーミング時）最初のトークンまでの時間を計測"""
+    payload = {"message": message, "rally_count": 1, "session_id": f"load_{uuid.uuid4().hex[:8]}"}
+    started = time.perf_counter()
+
+    if not stream:
+        response = await client.post(f"{base_url}/api/chat", json=payload)
+        return {"ok": response.status_code == 200, "total": time.perf_counter() - started, "ttft": None}
+
+    ttft = None
+    async with client.stream("POST", f"{base_url}/api/chat/stream", json=payload) as response:
+        async for line in response.aiter_lines():
+            if ttft is None and line.startswith("event: token"):
+                ttft = time.perf_counter() - started
+        ok = response.status_code == 200
+    return {"ok": ok, "total": time.perf_counter() - started, "ttft": ttft}
+
+
+async def run(args) -> Dict:
+    results: List[Dict] = []
+    queue: asyncio.Queue = asyncio.Queue()
+    for i in range(args.requests):
+        message = SAMPLE_MESSAGES[i % len(SAMPLE_MESSAGES)]
+        # --unique指定時は補完キャッシュ・集約を避けるため毎回異なるメッセージにする
+        queue.put_nowait(f"{message}（{i}）" if args.unique else message)
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+
+        async def worker():
+            while not queue.empty():
+                message = queue.get_nowait()
+                try:
+                    results.append(await send_chat(client, args.base_url, message, args.stream))
+                except Exception as e:
+                    results.append({"ok": False, "total": None, "ttft": None, "error": str(e)})
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+        try:
+            server_status = (await client.get(f"{args.base_url}/status")).json()
+        except Exception:
+            server_status = {}
+
+    totals = [r["total"] for r in results if r["ok"] and r["total"] is not None]
+    ttfts = [r["ttft"] for r in results if r["ok"] and r["ttft"] is not None]
+
+    def summary(values: List[float]) -> Dict:
+        if not values:
+            return {"count": 0}
+        return {
+            "count": len(values),
+            "mean_ms": round(statistics.mean(values) * 1000, 1),
+            "p50_ms": round(percentile(values, 50) * 1000, 1),
+            "p95_ms": round(percentile(values, 95) * 1000, 1),
+            "p99_ms": round(percentile(values, 99) * 1000, 1),
+            "max_ms": round(max(values) * 1000, 1)
+        }
+
+    return {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "stream": args.stream,
+        "elapsed_seconds": round(elapsed, 2),
+        "throughput_rps": round(len(results) / elapsed, 2) if elapsed else 0,
+        "errors": sum(1 for r in results if not r["ok"]),
+        "latency": summary(totals),
+        "time_to_first_token": summary(ttfts),
+        "server_metrics": server_status.get("metrics", {}),
+        "circuit_breakers": server_status.get("circuit_breakers", {})
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="チャットパイプラインの負荷試験")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8011")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--stream", action="store_true", help="/api/chat/stream を使い最初のトークンまでの時間も測定")
+    parser.add_argument("--unique", action="store_true", help="毎回異なるメッセージを送る（キャッシュ無効化）")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
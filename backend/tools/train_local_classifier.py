@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ローカル感情・ニーズ分類器の学習
+シードデータ（data/emotion_seed.jsonl）と chat_logs の分析メタデータから学習し、
+交差検証の精度・確信度別の精度とカバー率・推論レイテンシをレポートとして出力する
+
+使用例:
+    python tools/train_local_classifier.py
+    python tools/train_local_classifier.py --folds 10 --include-unversioned --output ../models/local_classifier.npz
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Any, Dict, List
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.config import AppConfig
+from core.emotion_cache import normalize_message
+from core.local_classifier import DEFAULT_DIMENSIONS, LocalClassifier
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+REQUIRED_FIELDS = ("primary_emotion", "emotion_intensity", "emotion_layers", "empathy_level", "tone_matching", "crisis_level")
+REPORT_THRESHOLDS = (0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9)
+
+
+def load_seed(path: str) -> List[Dict[str, Any]]:
+    """シードデータ（1行1例のJSONL）"""
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def load_chat_logs(logs_dir: str, include_unversioned: bool) -> List[Dict[str, Any]]:
+    """会話履歴のユーザー発話と直後のAI応答の分析メタデータを学習例にする
+
+    感情分析MDの版が記録された（＝モデルによる）分析のみを使う。旧形式はオプション指定時のみ。
+    """
+    examples = []
+    for name in sorted(os.listdir(logs_dir)):
+        if not (name.startswith("chat_") and name.endswith(".json")):
+            continue
+        try:
+            with open(os.path.join(logs_dir, name), "r", encoding="utf-8") as f:
+                messages = json.load(f).get("messages", [])
+        except Exception as e:
+            print(f"読み込みエラー ({name}): {e}", file=sys.stderr)
+            continue
+
+        for previous, current in zip(messages, messages[1:]):
+            if previous.get("type") != "user" or current.get("type") != "ai":
+                continue
+            metadata = current.get("metadata") or {}
+            analysis = metadata.get("emotion_analysis")
+            if not isinstance(analysis, dict) or any(field not in analysis for field in REQUIRED_FIELDS):
+                continue
+            if not metadata.get("emotion_md_version") and not include_unversioned:
+                continue
+            # 分類器自身の推定は学習に使わない
+            if analysis.get("analysis_quality") == "local":
+                continue
+
+            needs = metadata.get("needs_analysis") or {}
+            top_need = max(needs, key=needs.get) if needs and max(needs.values()) > 0 else None
+            examples.append({"message": previous.get("content", ""), "emotion_analysis": analysis, "need": top_need})
+    return examples
+
+
+def deduplicate(examples: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """正規化メッセージ単位で重複除去（後に読み込んだ例を優先）"""
+    unique = {}
+    for example in examples:
+        unique[normalize_message(example["message"])] = example
+    return list(unique.values())
+
+
+def cross_validate(examples: List[Dict[str, Any]], folds: int, seed: int, train_options: Dict[str, Any]) -> Dict[str, Any]:
+    """k分割交差検証（ラベル別に順に振り分けて分割の偏りを抑える）"""
+    by_label = defaultdict(list)
+    for example in examples:
+        by_label[example["emotion_analysis"]["primary_emotion"]].append(example)
+
+    rng = random.Random(seed)
+    fold_of = {}
+    offset = 0
+    for label in sorted(by_label):
+        rng.shuffle(by_label[label])
+        for index, example in enumerate(by_label[label]):
+            fold_of[id(example)] = (index + offset) % folds
+        offset += len(by_label[label])
+
+    emotion_results, needs_results = [], []
+    for fold in range(folds):
+        train = [e for e in examples if fold_of[id(e)] != fold]
+        test = [e for e in examples if fold_of[id(e)] == fold]
+        if not test:
+            continue
+        classifier = LocalClassifier.train(train, **train_options)
+        for example in test:
+            analysis, confidence = classifier.predict_emotion(example["message"])
+            emotion_results.append((analysis["primary_emotion"] == example["emotion_analysis"]["primary_emotion"], confidence))
+            need = classifier.predict_need(example["message"])
+            if need and example.get("need"):
+                needs_results.append((need[0] == example["need"], need[1]))
+
+    return {"emotion": accuracy_report(emotion_results), "needs": accuracy_report(needs_results)}
+
+
+def accuracy_report(results: List) -> Dict[str, Any]:
+    """全体精度と、確信度閾値ごとのカバー率（ローカルで確定する割合）・精度"""
+    if not results:
+        return {"count": 0}
+    by_threshold = {}
+    for threshold in REPORT_THRESHOLDS:
+        accepted = [correct for correct, confidence in results if confidence >= threshold]
+        by_threshold[str(threshold)] = {
+            "coverage": round(len(accepted) / len(results), 3),
+            "accuracy": round(sum(accepted) / len(accepted), 3) if accepted else None
+        }
+    return {
+        "count": len(results),
+        "accuracy": round(sum(correct for correct, _ in results) / len(results), 3),
+        "by_threshold": by_threshold
+    }
+
+
+def measure_latency(classifier: LocalClassifier, messages: List[str], repeats: int) -> Dict[str, float]:
+    """1メッセージあたりの推論時間（感情＋ニーズ）"""
+    samples = []
+    for _ in range(repeats):
+        for message in messages:
+            started = time.perf_counter()
+            classifier.predict_emotion(message)
+            classifier.predict_need(message)
+            samples.append(time.perf_counter() - started)
+    ordered = sorted(samples)
+    return {
+        "count": len(samples),
+        "mean_ms": round(statistics.mean(samples) * 1000, 4),
+        "p50_ms": round(ordered[len(ordered) // 2] * 1000, 4),
+        "p95_ms": round(ordered[int(len(ordered) * 0.95)] * 1000, 4),
+        "max_ms": round(ordered[-1] * 1000, 4)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ローカル感情・ニーズ分類器の学習とレポート出力")
+    parser.add_argument("--seed-data", action="append", default=None, help="シードデータJSONL（複数指定可）")
+    parser.add_argument("--logs-dir", default=os.path.join(PROJECT_ROOT, "chat_logs"))
+    parser.add_argument("--include-unversioned", action="store_true", help="感情分析MDの版が記録されていない旧形式の履歴も使う")
+    parser.add_argument("--output", default=AppConfig.LOCAL_CLASSIFIER_PATH)
+    parser.add_argument("--report", default=None, help="レポート出力先（既定: モデルと同じ場所に *_report.json）")
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--dimensions", type=int, default=DEFAULT_DIMENSIONS)
+    parser.add_argument("--epochs", type=int, default=600)
+    parser.add_argument("--l2", type=float, default=1e-4)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    seed_paths = args.seed_data or [os.path.join(PROJECT_ROOT, "data", "emotion_seed.jsonl")]
+    examples = []
+    for path in seed_paths:
+        examples.extend(load_seed(path))
+    seed_count = len(examples)
+    if os.path.isdir(args.logs_dir):
+        examples.extend(load_chat_logs(args.logs_dir, args.include_unversioned))
+    log_count = len(examples) - seed_count
+    examples = deduplicate(examples)
+
+    train_options = {"dimensions": args.dimensions, "epochs": args.epochs, "l2": args.l2}
+    started = time.perf_counter()
+    evaluation = cross_validate(examples, args.folds, args.seed, train_options)
+    classifier = LocalClassifier.train(examples, **train_options)
+    training_seconds = time.perf_counter() - started
+
+    classifier.metadata = {
+        "trained_at": datetime.now().isoformat(),
+        "examples": len(examples)
+    }
+    classifier.save(args.output)
+    # 保存したモデル（float16重み）で推論時間を測定
+    classifier = LocalClassifier.load(args.output)
+
+    report = {
+        "model": os.path.relpath(args.output, PROJECT_ROOT),
+        "trained_at": classifier.metadata["trained_at"],
+        "examples": {
+            "total": len(examples),
+            "seed": seed_count,
+            "chat_logs": log_count,
+            "emotion_labels": dict(Counter(e["emotion_analysis"]["primary_emotion"] for e in examples)),
+            "need_labels": dict(Counter(e["need"] for e in examples if e.get("need")))
+        },
+        "cross_validation": {"folds": args.folds, **evaluation},
+        "latency": measure_latency(classifier, [e["message"] for e in examples], repeats=5),
+        "training_seconds": round(training_seconds, 2),
+        "thresholds": {
+            "emotion": AppConfig.EMOTION_LOCAL_CONFIDENCE_THRESHOLD,
+            "needs": AppConfig.NEEDS_LOCAL_CONFIDENCE_THRESHOLD
+        }
+    }
+
+    report_path = args.report or os.path.splitext(args.output)[0] + "_report.json"
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()